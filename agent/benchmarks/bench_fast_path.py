@@ -0,0 +1,104 @@
+"""
+Fast-path intent router: hit rate and latency saved
+Routes a mixed set of voice-style utterances, timing the router's cost on misses and comparing each hit
+with the same turn run through the agent against a stub model that takes a tool call and an answer
+
+Run from the agent directory (no network needed):
+    python -m benchmarks.bench_fast_path [--repeat 2000] [--model-latency-ms 400]
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+os.environ.setdefault("GOOGLE_API_KEY", "offline-benchmark")
+os.environ.setdefault("LOG_LEVEL", "ERROR")
+
+from pydantic_ai.messages import ModelResponse, TextPart, ToolCallPart, ToolReturnPart  # noqa: E402
+from pydantic_ai.models.function import AgentInfo, FunctionModel  # noqa: E402
+
+from src import agent as agent_module  # noqa: E402
+from src.intent_router import intent_router  # noqa: E402
+
+SYSTEM_PROMPT = "User name: Dan Keegan\nUser ID: 123e4567-e89b-12d3-a456-426614174000\nEmail: dan@example.com"
+
+# (utterance, tool the model would call for it, or None when it needs the agent anyway)
+UTTERANCES = [
+    ("What's my name?", "get_my_profile"),
+    ("Who am I?", "get_my_profile"),
+    ("I'd like to book a call", "book_consultation"),
+    ("What's the booking link?", "book_consultation"),
+    ("What services do you offer?", "recommend_services"),
+    ("How much does member retention cost?", "get_service_info"),
+    ("How do we reduce churn among first-year members?", None),
+    ("We're a professional body with about 3,000 members", None),
+    ("Can you share a case study for a trade association?", None),
+    ("I'd like to book a call next Tuesday morning", None),
+]
+
+
+def stub_model(latency_ms: float) -> FunctionModel:
+    """Calls the turn's tool on the first request and answers on the second, each after latency_ms."""
+    tools = dict(UTTERANCES)
+
+    async def respond(messages, info: AgentInfo) -> ModelResponse:
+        await asyncio.sleep(latency_ms / 1000)
+        last = messages[-1].parts[-1]
+        if isinstance(last, ToolReturnPart):
+            return ModelResponse(parts=[TextPart("Here you go.")])
+        prompt = next(p.content for p in messages[-1].parts if getattr(p, "part_kind", "") == "user-prompt")
+        tool = tools.get(prompt)
+        if tool is None:
+            return ModelResponse(parts=[TextPart("Let's talk about that.")])
+        args = {"service_name": "Member Retention"} if tool == "get_service_info" else {}
+        return ModelResponse(parts=[ToolCallPart(tool, json.dumps(args))])
+
+    return FunctionModel(respond, model_name="stub")
+
+
+def route_cost(repeat: int) -> None:
+    deps = agent_module.build_clm_deps(SYSTEM_PROMPT, "bench-session")
+    answerers = agent_module.fast_path_answerers(deps)
+    hits = [u for u, _ in UTTERANCES if intent_router.match(u)]
+    misses = [u for u, _ in UTTERANCES if not intent_router.match(u)]
+    print(f"hit rate on this mix: {len(hits)}/{len(UTTERANCES)} ({len(hits) / len(UTTERANCES):.0%})")
+
+    for label, batch in (("miss (router only)", misses), ("hit (route + answer)", hits)):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for utterance in batch:
+                intent_router.answer("bench", utterance, answerers)
+        elapsed = time.perf_counter() - start
+        print(f"  {label:<22} {elapsed / (repeat * len(batch)) * 1e6:8.1f} us/message")
+
+
+async def agent_latency(model_latency_ms: float) -> None:
+    hits = [u for u, _ in UTTERANCES if intent_router.match(u)]
+    agent_ms, fast_ms = [], []
+    with agent_module.agent.override(model=stub_model(model_latency_ms)):
+        for utterance in hits:
+            deps = agent_module.build_clm_deps(SYSTEM_PROMPT, "bench-session")
+            start = time.perf_counter()
+            await agent_module.agent.run(utterance, deps=deps)
+            agent_ms.append((time.perf_counter() - start) * 1000)
+
+            start = time.perf_counter()
+            answer = intent_router.answer("bench", utterance, agent_module.fast_path_answerers(deps))
+            fast_ms.append((time.perf_counter() - start) * 1000)
+            assert answer is not None, utterance
+    mean_agent, mean_fast = sum(agent_ms) / len(agent_ms), sum(fast_ms) / len(fast_ms)
+    print(f"per hit, {model_latency_ms:.0f} ms model latency: agent {mean_agent:.1f} ms, "
+          f"fast path {mean_fast:.3f} ms, saved {mean_agent - mean_fast:.1f} ms and 2 model requests")
+
+
+def main(args) -> None:
+    route_cost(args.repeat)
+    asyncio.run(agent_latency(args.model_latency_ms))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=2000)
+    parser.add_argument("--model-latency-ms", type=float, default=400)
+    main(parser.parse_args())
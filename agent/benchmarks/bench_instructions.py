@@ -0,0 +1,95 @@
+"""
+Dynamic instruction build time per model request
+Compares dedenting the f-string on every request with the precompiled, memoised templates in src.agent
+
+Run from the agent directory:
+    python -m benchmarks.bench_instructions [--requests 100000]
+"""
+import argparse
+import os
+import time
+from textwrap import dedent
+
+os.environ.setdefault("GOOGLE_API_KEY", "offline-benchmark")
+
+from src import agent as agent_module  # noqa: E402
+from src.agent import PAGE_CONTEXTS, AppState, UserProfile  # noqa: E402
+
+
+def legacy_instructions(state: AppState) -> str:
+    """The previous body of user_context_instructions (plus the timeline line added since)."""
+    user = state.user if state else None
+    current_page = state.current_page if state else None
+    page_context = PAGE_CONTEXTS.get(current_page or "", PAGE_CONTEXTS["homepage"])
+
+    if user and (user.name or user.firstName):
+        first_name = user.firstName or (user.name.split()[0] if user.name else None)
+        org_type = state.organisation_type or "Not specified"
+        challenges = ", ".join(state.primary_challenges) if state.primary_challenges else "Not discussed yet"
+
+        return dedent(f"""
+            ## CURRENT PAGE CONTEXT
+            {page_context}
+
+            ## CURRENT USER CONTEXT
+            You are speaking with a logged-in user. Here is their information:
+            - Name: {user.name or 'Unknown'}
+            - First Name: {first_name or 'Unknown'}
+            - Email: {user.email or 'Not provided'}
+            - Organisation Type: {org_type}
+            - Organisation Name: {state.organisation_name or 'Not provided'}
+            - Member Count: {state.member_count or 'Not discussed'}
+            - Primary Challenges: {challenges}
+            - Budget Range: {state.budget_range or 'Not discussed'}
+            - Timeline: {state.timeline or 'Not discussed'}
+
+            IMPORTANT INSTRUCTIONS:
+            - ALWAYS address the user by their first name ({first_name}) in your responses
+            - When they ask "what's my name", "who am I", or about their profile, tell them: "{user.name}"
+            - Use their organisation context to give personalised recommendations
+            - Reference the current page context when relevant
+        """)
+    return dedent(f"""
+        ## CURRENT PAGE CONTEXT
+        {page_context}
+
+        ## GUEST USER
+        This user is not logged in. They can still have a consultation.
+        Focus on understanding their needs and qualifying them for a call.
+    """)
+
+
+STATES = {
+    "guest": AppState(current_page="member-retention"),
+    "logged in": AppState(
+        user=UserProfile(id="u1", name="Dan Keegan", firstName="Dan", email="dan@example.com"),
+        organisation_type="professional_body",
+        organisation_name="Institute of Examples",
+        member_count="2000_10000",
+        primary_challenges=["retention", "engagement"],
+        budget_range="2k_5k",
+        current_page="case-studies",
+    ),
+}
+
+
+def run(label: str, fn, state: AppState, requests: int) -> None:
+    start = time.perf_counter()
+    for _ in range(requests):
+        fn(state)
+    elapsed = time.perf_counter() - start
+    print(f"  {label:<10} {elapsed / requests * 1e6:8.2f} us/request")
+
+
+def main(requests: int) -> None:
+    for name, state in STATES.items():
+        assert agent_module.render_user_context_instructions(state) == legacy_instructions(state)
+        print(f"{name} ({requests} model requests)")
+        run("legacy", legacy_instructions, state, requests)
+        run("templated", agent_module.render_user_context_instructions, state, requests)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=100000)
+    main(parser.parse_args().requests)
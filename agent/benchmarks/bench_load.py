@@ -0,0 +1,254 @@
+"""
+Offline load test for the agent app
+Swaps Gemini for a deterministic stub model with configurable latency and drives /chat/completions
+(streamed and not) and /agui at increasing concurrency through an in-process ASGI driver; requests
+admission control turns away (429) are counted apart from errors, since levels past its limits expect them
+
+Run from the agent directory (no network needed):
+    python -m benchmarks.bench_load [--concurrency 1 8 32] [--requests 200] [--scenarios clm-stream agui]
+    python -m benchmarks.bench_load --max-p95-ms 250 --min-rps 50   # exits 1 on a regression
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Optional
+
+os.environ.setdefault("GOOGLE_API_KEY", "offline-benchmark")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from pydantic_ai.messages import ModelResponse, TextPart, ToolCallPart, ToolReturnPart  # noqa: E402
+from pydantic_ai.models.function import AgentInfo, DeltaToolCall, FunctionModel  # noqa: E402
+
+from src import agent as agent_module  # noqa: E402
+from src.metrics import TimedModel  # noqa: E402
+
+REPLY = (
+    "Thanks for sharing that. Engaged members are three times more likely to renew, so I'd start with "
+    "onboarding and a renewal campaign. Would you like to book a free consultation?"
+)
+
+
+# =====
+# Stub model
+# =====
+def _wants_tool(messages, call_tool: bool) -> bool:
+    """Call one tool on the first model request of a run, then answer."""
+    if not call_tool:
+        return False
+    return not any(isinstance(part, ToolReturnPart) for part in messages[-1].parts)
+
+
+def stub_model(first_token_ms: float, chunks: int, chunk_ms: float, call_tool: bool) -> FunctionModel:
+    """A deterministic model: waits first_token_ms, then streams REPLY in `chunks` pieces chunk_ms apart."""
+    words = REPLY.split(" ")
+    step = max(1, len(words) // max(chunks, 1))
+    pieces = [" ".join(words[i:i + step]) + " " for i in range(0, len(words), step)]
+
+    async def respond(messages, info: AgentInfo) -> ModelResponse:
+        await asyncio.sleep((first_token_ms + chunk_ms * len(pieces)) / 1000)
+        if _wants_tool(messages, call_tool):
+            return ModelResponse(parts=[ToolCallPart("recommend_services", {})])
+        return ModelResponse(parts=[TextPart(REPLY)])
+
+    async def stream(messages, info: AgentInfo):
+        await asyncio.sleep(first_token_ms / 1000)
+        if _wants_tool(messages, call_tool):
+            yield {0: DeltaToolCall(name="recommend_services", json_args="{}")}
+            return
+        for piece in pieces:
+            yield piece
+            if chunk_ms:
+                await asyncio.sleep(chunk_ms / 1000)
+
+    return FunctionModel(respond, stream_function=stream)
+
+
+# =====
+# In-process ASGI driver
+# =====
+@dataclass
+class Sample:
+    status: int
+    latency: float
+    first_chunk: Optional[float]
+
+
+async def asgi_request(app, path: str, payload: dict) -> Sample:
+    """POST a JSON body straight into the ASGI app, timing the first body chunk and the last."""
+    body = json.dumps(payload).encode()
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "POST", "scheme": "http", "path": path, "raw_path": path.encode(),
+        "query_string": b"", "root_path": "", "client": ("127.0.0.1", 0), "server": ("bench", 80),
+        "headers": [
+            (b"host", b"bench"),
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"accept", b"text/event-stream"),
+        ],
+    }
+    finished = asyncio.Event()
+    sent_body = False
+    status = 0
+    first_chunk = None
+    start = time.perf_counter()
+
+    async def receive():
+        nonlocal sent_body
+        if not sent_body:
+            sent_body = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        # Starlette listens for a disconnect while streaming; the client stays until the body ends
+        await finished.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal status, first_chunk
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            if first_chunk is None and message.get("body"):
+                first_chunk = time.perf_counter() - start
+            if not message.get("more_body", False):
+                finished.set()
+
+    await app(scope, receive, send)
+    finished.set()
+    return Sample(status, time.perf_counter() - start, first_chunk)
+
+
+# =====
+# Scenarios
+# =====
+def clm_payload(i: int, run: str, stream: bool) -> dict:
+    # A session and question unique to this request and level (run) keep the answer cache and
+    # single-flight replays of earlier levels out of the measurement, and a distinct user keeps
+    # per-user admission limits out of it (the global limit still applies)
+    return {
+        "stream": stream,
+        "custom_session_id": f"bench-{run}-{i}",
+        "messages": [
+            {"role": "system", "content": f"User Name: Bench User\nUser ID: 00000000-0000-0000-0000-{i:012d}"},
+            {"role": "user", "content": f"How do we reduce churn? (run {run}, request {i})"},
+        ],
+    }
+
+
+def agui_payload(i: int, run: str) -> dict:
+    return {
+        "threadId": f"bench-thread-{run}-{i}",
+        "runId": uuid.uuid4().hex,
+        "state": {"user": {"id": f"bench-user-{i}", "name": "Bench User"}, "current_page": "member-retention"},
+        "messages": [{"id": uuid.uuid4().hex, "role": "user", "content": f"How do we reduce churn? (run {run}, request {i})"}],
+        "tools": [],
+        "context": [],
+        "forwardedProps": {},
+    }
+
+
+SCENARIOS = {
+    "clm-stream": ("/chat/completions", lambda i, run: clm_payload(i, run, stream=True)),
+    "clm": ("/chat/completions", lambda i, run: clm_payload(i, run, stream=False)),
+    "agui": ("/agui/", agui_payload),
+}
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+async def run_level(app, scenario: str, concurrency: int, requests: int) -> dict:
+    path, payload = SCENARIOS[scenario]
+    queue = iter(range(requests))
+    samples: list[Sample] = []
+    run = uuid.uuid4().hex[:8]
+
+    async def worker():
+        for i in queue:
+            samples.append(await asgi_request(app, path, payload(i, run)))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    ok = [s for s in samples if s.status == 200]
+    # 429s are admission control shedding load past its limits, not failures
+    rejected = sum(s.status == 429 for s in samples)
+    latencies = [s.latency * 1000 for s in ok]
+    first_chunks = [s.first_chunk * 1000 for s in ok if s.first_chunk is not None]
+    return {
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "requests": requests,
+        "rejected": rejected,
+        "errors": len(samples) - len(ok) - rejected,
+        "rps": len(ok) / elapsed,
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "p99_ms": percentile(latencies, 99),
+        "ttfc_p50_ms": percentile(first_chunks, 50),
+        "ttfc_p95_ms": percentile(first_chunks, 95),
+    }
+
+
+def print_row(row: dict) -> None:
+    print(
+        f"  c={row['concurrency']:<4} {row['rps']:8.1f} req/s  "
+        f"p50 {row['p50_ms']:7.1f}  p95 {row['p95_ms']:7.1f}  p99 {row['p99_ms']:7.1f} ms  "
+        f"ttfc p50 {row['ttfc_p50_ms']:7.1f}  p95 {row['ttfc_p95_ms']:7.1f} ms  errors {row['errors']}  429s {row['rejected']}"
+    )
+
+
+async def main(args) -> int:
+    model = TimedModel(stub_model(args.first_token_ms, args.chunks, args.chunk_ms, args.tools))
+    rows = []
+    with agent_module.agent.override(model=model):
+        for scenario in args.scenarios:
+            print(f"{scenario} ({args.requests} requests per level)")
+            # Warm caches, imports and the event loop before measuring
+            await run_level(agent_module.app, scenario, 1, 3)
+            for concurrency in args.concurrency:
+                row = await run_level(agent_module.app, scenario, concurrency, args.requests)
+                rows.append(row)
+                print_row(row)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(rows, f, indent=2)
+
+    failures = []
+    for row in rows:
+        label = f"{row['scenario']} c={row['concurrency']}"
+        if row["errors"]:
+            failures.append(f"{label}: {row['errors']} failed requests")
+        if args.max_p95_ms is not None and row["p95_ms"] > args.max_p95_ms:
+            failures.append(f"{label}: p95 {row['p95_ms']:.1f} ms > {args.max_p95_ms} ms")
+        if args.min_rps is not None and row["rps"] < args.min_rps:
+            failures.append(f"{label}: {row['rps']:.1f} req/s < {args.min_rps} req/s")
+    for failure in failures:
+        print(f"REGRESSION {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32, 128])
+    parser.add_argument("--requests", type=int, default=200, help="requests per concurrency level")
+    parser.add_argument("--first-token-ms", type=float, default=50, help="stub model latency before the first token")
+    parser.add_argument("--chunks", type=int, default=8, help="pieces the stub streams its reply in")
+    parser.add_argument("--chunk-ms", type=float, default=5, help="stub model delay between pieces")
+    parser.add_argument("--tools", action="store_true", help="make the stub call a tool before answering")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--max-p95-ms", type=float, help="fail if any level's p95 latency exceeds this")
+    parser.add_argument("--min-rps", type=float, help="fail if any level's throughput falls below this")
+    sys.exit(asyncio.run(main(parser.parse_args())))
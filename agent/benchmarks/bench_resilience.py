@@ -0,0 +1,117 @@
+"""
+Model resilience under injected latency and failures
+Runs the agent against stub models with a slow tail and a failure rate, comparing a bare model with
+ResilientModel retries, hedging and fallback
+
+Run from the agent directory (no network needed):
+    python -m benchmarks.bench_resilience [--runs 300] [--failure-rate 0.1] [--slow-rate 0.1] [--stream]
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+
+os.environ.setdefault("GOOGLE_API_KEY", "offline-benchmark")
+os.environ.setdefault("LOG_LEVEL", "ERROR")
+
+from pydantic_ai.exceptions import ModelHTTPError  # noqa: E402
+from pydantic_ai.messages import ModelResponse, TextPart  # noqa: E402
+from pydantic_ai.models.function import AgentInfo, FunctionModel  # noqa: E402
+
+from src import agent as agent_module  # noqa: E402
+from src.resilient_model import ResilientModel  # noqa: E402
+
+REPLY = "Engaged members are three times more likely to renew."
+
+
+def flaky_model(name: str, typical_ms: float, slow_ms: float, slow_rate: float, failure_rate: float, rng: random.Random):
+    """A stub that is usually quick, sometimes very slow, and sometimes fails with a 503."""
+    async def delay_or_fail():
+        slow = rng.random() < slow_rate
+        await asyncio.sleep((slow_ms if slow else typical_ms * rng.uniform(0.8, 1.2)) / 1000)
+        if rng.random() < failure_rate:
+            raise ModelHTTPError(503, name, "injected failure")
+
+    async def respond(messages, info: AgentInfo) -> ModelResponse:
+        await delay_or_fail()
+        return ModelResponse(parts=[TextPart(REPLY)])
+
+    async def stream(messages, info: AgentInfo):
+        await delay_or_fail()
+        for word in REPLY.split(" "):
+            yield word + " "
+
+    return FunctionModel(respond, stream_function=stream, model_name=name)
+
+
+async def run_once(stream: bool) -> bool:
+    deps = agent_module.SessionDeps(state=agent_module.AppState())
+    if stream:
+        async for event in agent_module.agent.run_stream_events("How do we reduce churn?", deps=deps):
+            pass
+        return True
+    await agent_module.agent.run("How do we reduce churn?", deps=deps)
+    return True
+
+
+def percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))] if ordered else float("nan")
+
+
+async def measure(label: str, model, runs: int, concurrency: int, stream: bool) -> None:
+    latencies, failures = [], 0
+    queue = iter(range(runs))
+
+    async def worker():
+        nonlocal failures
+        for _ in queue:
+            start = time.perf_counter()
+            try:
+                await run_once(stream)
+            except Exception:
+                failures += 1
+                continue
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    with agent_module.agent.override(model=model):
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    print(
+        f"  {label:<26} success {1 - failures / runs:7.1%}  "
+        f"p50 {percentile(latencies, 50):7.1f}  p95 {percentile(latencies, 95):7.1f}  p99 {percentile(latencies, 99):7.1f} ms"
+    )
+
+
+async def main(args) -> None:
+    def primary(seed):
+        return flaky_model("primary", args.typical_ms, args.slow_ms, args.slow_rate, args.failure_rate, random.Random(seed))
+
+    def fallback(seed):
+        return flaky_model("fallback", args.typical_ms * 1.5, args.slow_ms, args.slow_rate / 2, args.failure_rate / 5, random.Random(seed))
+
+    timeout = args.slow_ms / 1000 * 1.5
+    hedge_after = args.typical_ms * 2 / 1000
+    print(f"{args.runs} {'streamed ' if args.stream else ''}runs, {args.failure_rate:.0%} failures, "
+          f"{args.slow_rate:.0%} slow ({args.slow_ms:.0f} ms), hedge after {hedge_after * 1000:.0f} ms")
+    variants = [
+        ("bare model", lambda: primary(1)),
+        ("retry", lambda: ResilientModel(primary(1), attempt_timeout=timeout, max_attempts=3, hedge_after=0)),
+        ("retry + hedge", lambda: ResilientModel(primary(1), attempt_timeout=timeout, max_attempts=3, hedge_after=hedge_after)),
+        ("retry + hedge + fallback", lambda: ResilientModel(
+            primary(1), fallback=fallback(2), attempt_timeout=timeout, max_attempts=2, hedge_after=hedge_after)),
+    ]
+    for label, build in variants:
+        await measure(label, build(), args.runs, args.concurrency, args.stream)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--typical-ms", type=float, default=40)
+    parser.add_argument("--slow-ms", type=float, default=600)
+    parser.add_argument("--slow-rate", type=float, default=0.1)
+    parser.add_argument("--failure-rate", type=float, default=0.1)
+    parser.add_argument("--stream", action="store_true", help="use streamed runs (as the CLM endpoint does)")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,85 @@
+"""
+SSE streaming micro-benchmark for the Hume CLM endpoint
+Compares the legacy per-word encoder against the coalescing encoder in src.sse
+
+Run from the agent directory:
+    python -m benchmarks.bench_sse [--words 300 600]
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from src.sse import encode_sse_stream
+
+SENTENCE = (
+    "Engaged members are three times more likely to renew, so we usually start with "
+    "onboarding, engagement scoring and a renewal campaign that reaches lapsing members early. "
+)
+
+
+async def legacy_stream_sse_response(content: str, msg_id: str, sleep: bool = True):
+    """The previous implementation: one chunk per word, fresh dict and json.dumps per chunk."""
+    words = content.split(' ')
+    for i, word in enumerate(words):
+        chunk = {
+            "id": msg_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": "membership-marketing-agent",
+            "choices": [{
+                "index": 0,
+                "delta": {"content": word + (' ' if i < len(words) - 1 else '')},
+                "finish_reason": None
+            }]
+        }
+        yield f"data: {json.dumps(chunk)}\n\n"
+        if sleep:
+            await asyncio.sleep(0.01)
+
+    final = {
+        "id": msg_id,
+        "object": "chat.completion.chunk",
+        "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]
+    }
+    yield f"data: {json.dumps(final)}\n\n"
+    yield "data: [DONE]\n\n"
+
+
+async def word_deltas(content: str):
+    """Simulate a model streaming one word per delta with no network delay."""
+    for word in content.split(' '):
+        yield word + ' '
+
+
+async def measure(frames) -> tuple[float, int, int]:
+    start = time.perf_counter()
+    chunks = 0
+    size = 0
+    async for frame in frames:
+        chunks += 1
+        size += len(frame.encode())
+    return time.perf_counter() - start, chunks, size
+
+
+def report(label: str, elapsed: float, chunks: int, size: int) -> None:
+    print(
+        f"  {label:<28} {elapsed * 1000:9.2f} ms  {chunks:6d} chunks  "
+        f"{chunks / elapsed:12.0f} chunks/s  {size / elapsed / 1e6:9.2f} MB/s"
+    )
+
+
+async def main(word_counts: list[int]) -> None:
+    for count in word_counts:
+        words = (SENTENCE * (count // len(SENTENCE.split()) + 1)).split()[:count]
+        content = " ".join(words)
+        print(f"{count} words ({len(content)} chars)")
+        report("legacy (with sleep)", *await measure(legacy_stream_sse_response(content, "bench")))
+        report("legacy (encoding only)", *await measure(legacy_stream_sse_response(content, "bench", sleep=False)))
+        report("coalescing encoder", *await measure(encode_sse_stream(word_deltas(content), "bench")))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--words", type=int, nargs="+", default=[300, 600])
+    asyncio.run(main(parser.parse_args().words))
@@ -0,0 +1,68 @@
+"""
+Symptom matching benchmark for assess_challenges
+Throughput and match rate of the legacy whole-phrase substring check versus the
+trigram TF-IDF matcher, over thousands of generated symptom phrases
+
+Run from the agent directory:
+    python -m benchmarks.bench_symptom_matcher [--phrases 1000 5000 20000]
+"""
+import argparse
+import itertools
+import random
+import time
+
+from src.catalogue import catalogue
+
+SUBJECTS = ["members", "our members", "younger professionals", "corporate members", "supporters", "people"]
+PROBLEMS = [
+    "aren't renewing", "are leaving after the first year", "don't come to events", "never open our emails",
+    "don't see the value", "think we're too expensive", "have never heard of us", "keep cancelling",
+    "ignore our resources", "say our offer feels outdated", "are joining more slowly", "are disengaged",
+]
+SUFFIXES = ["", " this year", " and churn is high", ", renewals are down", " since covid", " despite discounts"]
+
+
+def generate_phrases(count: int, seed: int = 7) -> list[str]:
+    combos = [f"{s} {p}{x}" for s, p, x in itertools.product(SUBJECTS, PROBLEMS, SUFFIXES)]
+    rng = random.Random(seed)
+    return [rng.choice(combos) for _ in range(count)]
+
+
+def legacy_match(symptoms: list[str]) -> list[str]:
+    """The previous matching: a canned symptom must appear verbatim inside the description."""
+    identified = []
+    for key, challenge in catalogue.challenges.items():
+        for symptom in symptoms:
+            if any(s.lower() in symptom.lower() for s in challenge["symptoms"]):
+                if key not in identified:
+                    identified.append(key)
+    return identified
+
+
+def run(label: str, fn, phrases: list[str]) -> None:
+    start = time.perf_counter()
+    matched = sum(1 for phrase in phrases if fn([phrase]))
+    elapsed = time.perf_counter() - start
+    print(
+        f"  {label:<22} {elapsed * 1000:9.1f} ms  {len(phrases) / elapsed:10.0f} phrases/s  "
+        f"match rate {matched / len(phrases):6.1%}"
+    )
+
+
+def main(counts: list[int]) -> None:
+    matcher = catalogue.symptom_matcher
+    for count in counts:
+        phrases = generate_phrases(count)
+        print(f"{count} phrases")
+        run("legacy substring", legacy_match, phrases)
+        run("tf-idf per phrase", matcher.rank, phrases)
+        start = time.perf_counter()
+        matcher.score(phrases)
+        elapsed = time.perf_counter() - start
+        print(f"  {'tf-idf one batch':<22} {elapsed * 1000:9.1f} ms  {count / elapsed:10.0f} phrases/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--phrases", type=int, nargs="+", default=[1000, 5000, 20000])
+    main(parser.parse_args().phrases)
@@ -0,0 +1,36 @@
+"""
+Tool result payload sizes
+Estimated prompt tokens per tool result, compact (default) versus detailed
+
+Run from the agent directory:
+    python -m benchmarks.bench_tool_payloads [--turns 6]
+"""
+import argparse
+import os
+
+os.environ.setdefault("GOOGLE_API_KEY", "offline-benchmark")
+
+from src import agent as agent_module  # noqa: E402
+from src.tool_payloads import result_tokens  # noqa: E402
+
+CALLS = [
+    ("recommend_services()", lambda detail: agent_module._recommend_services(None, detail)),
+    ("recommend_services(retention)", lambda detail: agent_module._recommend_services("retention", detail)),
+    ("get_case_studies()", lambda detail: agent_module._get_case_studies(None, None, 3, detail)),
+    ("get_case_studies(professional_body)", lambda detail: agent_module._get_case_studies("professional_body", None, 3, detail)),
+]
+
+
+def main(turns: int) -> None:
+    # A tool result stays in the message history, so it is re-sent on every later turn of the run
+    print(f"{'call':<38} {'compact':>8} {'detail':>8} {'saved':>7}   over {turns} turns")
+    for label, call in CALLS:
+        compact, detailed = result_tokens(call(False)), result_tokens(call(True))
+        saved = 1 - compact / detailed
+        print(f"{label:<38} {compact:8d} {detailed:8d} {saved:7.1%}   {compact * turns:6d} vs {detailed * turns:6d}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=6)
+    main(parser.parse_args().turns)
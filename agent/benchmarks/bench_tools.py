@@ -0,0 +1,103 @@
+"""
+Tool calls in one model turn: sequential vs concurrent, timeouts, and event-loop lag
+Runs an agent whose stub model asks for several artificially slow tools in a single response, first one
+after another and then concurrently on the tool pool, and measures how a blocking tool run inline stalls
+every other request on the event loop
+
+Run from the agent directory (no network needed):
+    python -m benchmarks.bench_tools [--tools 4] [--tool-ms 200] [--timeout-ms 300]
+"""
+import argparse
+import asyncio
+import os
+import time
+
+os.environ.setdefault("GOOGLE_API_KEY", "offline-benchmark")
+os.environ.setdefault("LOG_LEVEL", "ERROR")
+
+from pydantic_ai import Agent, RunContext  # noqa: E402
+from pydantic_ai._tool_manager import ToolManager  # noqa: E402
+from pydantic_ai.messages import ModelResponse, TextPart, ToolCallPart, ToolReturnPart  # noqa: E402
+from pydantic_ai.models.function import AgentInfo, FunctionModel  # noqa: E402
+
+from src.tool_runtime import TOOL_THREADS, blocking_tool, inline_tool, tool_timeouts  # noqa: E402
+
+
+def stub_model(tools: int) -> FunctionModel:
+    """Calls `tools` slow tools in its first response, then answers once their results are back."""
+    async def respond(messages, info: AgentInfo) -> ModelResponse:
+        if isinstance(messages[-1].parts[-1], ToolReturnPart):
+            return ModelResponse(parts=[TextPart("Done.")])
+        return ModelResponse(parts=[ToolCallPart("slow_lookup", {"n": n}) for n in range(tools)])
+
+    return FunctionModel(respond, model_name="stub")
+
+
+def build_agent(decorate, tool_ms: float) -> Agent:
+    bench_agent = Agent(deps_type=float)
+
+    @bench_agent.tool
+    @decorate
+    def slow_lookup(ctx: RunContext[float], n: int) -> dict:
+        """Look something up slowly."""
+        # Sleeps for tool_ms, or ctx.deps seconds when the run overrides it
+        time.sleep(ctx.deps if ctx.deps else tool_ms / 1000)
+        return {"n": n}
+
+    return bench_agent
+
+
+async def timed_run(bench_agent: Agent, tools: int, deps: float = 0.0) -> float:
+    start = time.perf_counter()
+    await bench_agent.run("go", model=stub_model(tools), deps=deps)
+    return (time.perf_counter() - start) * 1000
+
+
+async def loop_lag(during) -> float:
+    """Worst delay of a 5 ms ticker on the event loop while `during` runs."""
+    worst = 0.0
+    stop = False
+
+    async def ticker():
+        nonlocal worst
+        while not stop:
+            start = time.perf_counter()
+            await asyncio.sleep(0.005)
+            worst = max(worst, time.perf_counter() - start - 0.005)
+
+    task = asyncio.create_task(ticker())
+    await asyncio.sleep(0.01)
+    await during
+    stop = True
+    await task
+    return worst * 1000
+
+
+async def run(args) -> None:
+    print(f"{args.tools} tools x {args.tool_ms:.0f} ms in one model response (tool pool: {TOOL_THREADS} threads)")
+
+    pooled = build_agent(blocking_tool(timeout=None), args.tool_ms)
+    with ToolManager.sequential_tool_calls():
+        sequential_ms = await timed_run(pooled, args.tools)
+    concurrent_ms = await timed_run(pooled, args.tools)
+    print(f"  sequential             {sequential_ms:8.1f} ms")
+    print(f"  concurrent (tool pool) {concurrent_ms:8.1f} ms  (ideal ~{args.tool_ms:.0f} ms, "
+          f"{sequential_ms / concurrent_ms:.1f}x faster)")
+
+    capped = build_agent(blocking_tool(timeout=args.timeout_ms / 1000), args.tool_ms)
+    capped_ms = await timed_run(capped, args.tools, deps=args.timeout_ms * 4 / 1000)
+    print(f"  hung tools, {args.timeout_ms:.0f} ms timeout {capped_ms:5.1f} ms  "
+          f"({tool_timeouts.value(tool='slow_lookup'):.0f} timed out; each would take {args.timeout_ms * 4:.0f} ms)")
+
+    inline = build_agent(inline_tool, args.tool_ms)
+    inline_lag = await loop_lag(timed_run(inline, args.tools))
+    pooled_lag = await loop_lag(timed_run(pooled, args.tools))
+    print(f"  worst event-loop stall: blocking tool inline {inline_lag:7.1f} ms, on the tool pool {pooled_lag:5.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tools", type=int, default=4)
+    parser.add_argument("--tool-ms", type=float, default=200)
+    parser.add_argument("--timeout-ms", type=float, default=300)
+    asyncio.run(run(parser.parse_args()))
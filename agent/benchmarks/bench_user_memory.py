@@ -0,0 +1,99 @@
+"""
+User memory prefetch: time added before the first model request
+Serves Zep's graph search from a local fake server with a set latency, and times how long a turn waits
+for its memory when fetched after request preparation, prefetched alongside it, cached, or stale
+
+Run from the agent directory (no network needed):
+    python -m benchmarks.bench_user_memory [--zep-ms 150] [--prepare-ms 100] [--turns 20]
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import asyncio
+import json
+import os
+import threading
+import time
+
+os.environ.setdefault("GOOGLE_API_KEY", "offline-benchmark")
+os.environ.setdefault("LOG_LEVEL", "ERROR")
+
+from src.user_memory import UserMemory, memory_fetches  # noqa: E402
+
+EDGES = [
+    {"fact": "Runs membership for the Institute of Widget Engineers, a professional body of 4,000 members"},
+    {"fact": "First-year renewals dropped to 70% last year"},
+    {"fact": "Interested in an onboarding email journey"},
+    {"fact": "Prefers calls on Friday mornings"},
+]
+
+
+def fake_zep(latency_ms: float) -> ThreadingHTTPServer:
+    """A graph search endpoint that answers every user with EDGES after latency_ms."""
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers["Content-Length"]))
+            time.sleep(latency_ms / 1000)
+            body = json.dumps({"edges": EDGES}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+async def turn(memory: UserMemory, user_id: str, prepare_ms: float, prefetch: bool) -> float:
+    """ms from the request arriving until its memory block is ready, after prepare_ms of other work."""
+    start = time.perf_counter()
+    if prefetch:
+        memory.prefetch(user_id)
+    # Parsing, state, history, admission queueing
+    await asyncio.sleep(prepare_ms / 1000)
+    await memory.instructions(user_id)
+    return (time.perf_counter() - start) * 1000
+
+
+async def run(args) -> None:
+    server = fake_zep(args.zep_ms)
+    url = f"http://127.0.0.1:{server.server_port}"
+    print(f"Zep latency {args.zep_ms:.0f} ms, request preparation {args.prepare_ms:.0f} ms")
+
+    # A wait longer than Zep's latency, so the sequential case shows the whole fetch
+    memory = UserMemory(api_url=url, api_key="bench", wait_seconds=10)
+    sequential = [await turn(memory, f"cold-{n}", args.prepare_ms, prefetch=False) for n in range(args.turns)]
+    prefetched = [await turn(memory, f"prefetch-{n}", args.prepare_ms, prefetch=True) for n in range(args.turns)]
+    cached = [await turn(memory, "prefetch-0", args.prepare_ms, prefetch=True) for _ in range(args.turns)]
+    await memory.aclose()
+
+    stale_memory = UserMemory(api_url=url, api_key="bench", ttl_seconds=0, wait_seconds=10)
+    await turn(stale_memory, "stale", 0, prefetch=True)
+    fetches = memory_fetches.value(result="ok")
+    stale = [await turn(stale_memory, "stale", args.prepare_ms, prefetch=False) for _ in range(args.turns)]
+    await asyncio.sleep(args.zep_ms / 1000 * 2)
+    refreshed = memory_fetches.value(result="ok") - fetches
+    await stale_memory.aclose()
+    server.shutdown()
+
+    for label, times in (
+        ("fetched after preparing", sequential),
+        ("prefetched (cold)", prefetched),
+        ("cached", cached),
+        ("stale, revalidating", stale),
+    ):
+        times.sort()
+        print(f"  {label:<24} p50 {times[len(times) // 2]:7.1f} ms  max {times[-1]:7.1f} ms")
+    print(f"  stale turns: {args.turns}, background refreshes: {refreshed:.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--zep-ms", type=float, default=150)
+    parser.add_argument("--prepare-ms", type=float, default=100)
+    parser.add_argument("--turns", type=int, default=20)
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,231 @@
+"""
+Admission control for agent runs
+A bounded number of concurrent runs, a short per-user fair queue in front of them, and a
+Retry-After estimate for requests turned away when it is full
+"""
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+import asyncio
+import itertools
+import math
+import os
+import time
+
+from starlette.responses import JSONResponse, Response
+
+from .metrics import Counter, Gauge, Histogram, registry
+
+MAX_CONCURRENT_RUNS = int(os.getenv("AGENT_MAX_CONCURRENT_RUNS", "32"))
+MAX_QUEUED_RUNS = int(os.getenv("AGENT_MAX_QUEUED_RUNS", "64"))
+QUEUE_TIMEOUT_SECONDS = float(os.getenv("AGENT_QUEUE_TIMEOUT_SECONDS", "5"))
+# Runs one user may have going at once; the same number may wait behind them
+MAX_RUNS_PER_USER = int(os.getenv("AGENT_MAX_RUNS_PER_USER", "2"))
+
+# Callers with no user or session id aren't one user: each run gets a key of its own, so guests share
+# only the global limits and not one per-user cap
+ANONYMOUS = "anonymous"
+_anonymous_runs = itertools.count()
+
+queue_depth = registry.register(Gauge(
+    "agent_admission_queue_depth", "Agent runs waiting for a slot."))
+running_runs = registry.register(Gauge(
+    "agent_admission_running", "Agent runs holding a slot."))
+rejected_runs = registry.register(Counter(
+    "agent_admission_rejected_total", "Agent runs turned away, by reason.", ("reason",)))
+queue_wait = registry.register(Histogram(
+    "agent_admission_wait_seconds", "Time admitted runs spent queued."))
+
+
+class Saturated(Exception):
+    """No slot is available; retry_after is a hint in whole seconds."""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(f"agent runs saturated ({reason}), retry after {retry_after}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Slot:
+    """A held run slot; release() is idempotent so stream wrappers and handlers can both call it."""
+
+    def __init__(self, controller: "AdmissionController", user: str):
+        self._controller = controller
+        self.user = user
+        self.started = time.monotonic()
+        self._released = False
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self._controller._release(self.user, time.monotonic() - self.started)
+
+
+class AdmissionController:
+    """Concurrency limit with a fair queue, for use from a single event loop.
+
+    Waiting runs are kept per user and served round-robin, so one busy
+    caller can't starve everyone else, and no user holds more than
+    max_per_user slots. A run that can't be queued, or waits longer than
+    queue_timeout, raises Saturated; callers answer 429 with Retry-After.
+    A run with no user is keyed on its own, so the per-user cap doesn't
+    apply to it.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = MAX_CONCURRENT_RUNS,
+        max_queue: int = MAX_QUEUED_RUNS,
+        queue_timeout: float = QUEUE_TIMEOUT_SECONDS,
+        max_per_user: int = MAX_RUNS_PER_USER,
+    ):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.max_per_user = max_per_user
+        self.running = 0
+        self.queued = 0
+        self._running_by_user: dict[str, int] = {}
+        self._waiting: OrderedDict[str, deque[asyncio.Future]] = OrderedDict()
+        # Moving average of run duration, for the Retry-After estimate
+        self._mean_run_seconds = 2.0
+
+    @property
+    def mean_run_seconds(self) -> float:
+        """Moving average of how long an admitted run holds its slot."""
+        return self._mean_run_seconds
+
+    def retry_after(self) -> int:
+        """Seconds until a slot is likely free, given the queue ahead and typical run length."""
+        waves = (self.queued + 1) / max(self.max_concurrent, 1)
+        return min(60, max(1, math.ceil(self._mean_run_seconds * waves)))
+
+    def _eligible(self, user: str) -> bool:
+        return self._running_by_user.get(user, 0) < self.max_per_user
+
+    def _grant(self, user: str) -> None:
+        self.running += 1
+        self._running_by_user[user] = self._running_by_user.get(user, 0) + 1
+        running_runs.set(self.running)
+
+    def _release(self, user: str, duration: Optional[float]) -> None:
+        self.running -= 1
+        remaining = self._running_by_user.get(user, 1) - 1
+        if remaining:
+            self._running_by_user[user] = remaining
+        else:
+            self._running_by_user.pop(user, None)
+        if duration is not None:
+            self._mean_run_seconds += 0.1 * (duration - self._mean_run_seconds)
+        running_runs.set(self.running)
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """Hand free slots to waiting users in round-robin order."""
+        while self.running < self.max_concurrent:
+            user = next((u for u in self._waiting if self._eligible(u)), None)
+            if user is None:
+                return
+            waiters = self._waiting.pop(user)
+            waiter = waiters.popleft()
+            self.queued -= 1
+            if waiters:
+                # Back of the rotation
+                self._waiting[user] = waiters
+            queue_depth.set(self.queued)
+            if waiter.done():
+                # Cancelled while queued; its task hasn't resumed to forget it yet
+                continue
+            self._grant(user)
+            waiter.set_result(None)
+
+    def _forget(self, user: str, waiter: asyncio.Future) -> None:
+        waiters = self._waiting.get(user)
+        if waiters and waiter in waiters:
+            waiters.remove(waiter)
+            self.queued -= 1
+            if not waiters:
+                del self._waiting[user]
+            queue_depth.set(self.queued)
+
+    async def acquire(self, user: Optional[str]) -> Slot:
+        """Wait for a run slot for this user, or raise Saturated."""
+        user = user or f"{ANONYMOUS}:{next(_anonymous_runs)}"
+        # Free slots are always handed to eligible waiters first, so an
+        # eligible newcomer that finds one free isn't overtaking anybody
+        if self.running < self.max_concurrent and self._eligible(user):
+            self._grant(user)
+            return Slot(self, user)
+
+        if self.queued >= self.max_queue:
+            rejected_runs.inc(reason="queue_full")
+            raise Saturated("queue_full", self.retry_after())
+        if len(self._waiting.get(user, ())) >= self.max_per_user:
+            rejected_runs.inc(reason="user_queue_full")
+            raise Saturated("user_queue_full", self.retry_after())
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiting.setdefault(user, deque()).append(waiter)
+        self.queued += 1
+        queue_depth.set(self.queued)
+        start = time.monotonic()
+        try:
+            async with asyncio.timeout(self.queue_timeout):
+                await waiter
+        except (TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # Granted a slot just as we gave up; hand it straight back
+                self._release(user, None)
+            else:
+                self._forget(user, waiter)
+            if isinstance(e, TimeoutError):
+                rejected_runs.inc(reason="queue_timeout")
+                raise Saturated("queue_timeout", self.retry_after()) from None
+            raise
+        queue_wait.observe(time.monotonic() - start)
+        return Slot(self, user)
+
+    @asynccontextmanager
+    async def slot(self, user: Optional[str]) -> AsyncIterator[Slot]:
+        held = await self.acquire(user)
+        try:
+            yield held
+        finally:
+            held.release()
+
+
+class HeldSlotResponse(Response):
+    """Sends a (streaming) response, then releases the run slot however sending ends.
+
+    Anything with release() can be held the same way, e.g. a request's
+    single_flight attachment.
+
+    Releasing around the ASGI call rather than in the body iterator also
+    covers a client that disconnects before the body is first iterated.
+    """
+
+    def __init__(self, response: Response, held: Slot):
+        self.response = response
+        self.held = held
+        self.background = None
+
+    def __getattr__(self, name):
+        return getattr(self.response, name)
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await self.response(scope, receive, send)
+        finally:
+            self.held.release()
+
+
+def saturated_response(error: Saturated) -> JSONResponse:
+    """429 in the OpenAI error shape, which both Hume and CopilotKit surface as a retryable error."""
+    return JSONResponse(
+        {"error": {"message": "The assistant is busy, please try again shortly.", "type": "rate_limit_exceeded", "code": error.reason}},
+        status_code=429,
+        headers={"Retry-After": str(error.retry_after)},
+    )
+
+
+admission = AdmissionController()
@@ -2,18 +2,31 @@
 Membership Marketing Agency Agent
 CopilotKit + Pydantic AI integration for lead qualification and consultation booking
 """
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from functools import lru_cache
 from textwrap import dedent
-from typing import Optional, List
+from types import SimpleNamespace
+from typing import Optional, List, AsyncIterator
 from pydantic import BaseModel, Field
-from pydantic_ai import Agent, RunContext
+from pydantic_ai import Agent, AgentRunResultEvent, RunContext, ToolReturn
+from pydantic_ai.messages import ModelMessage, PartStartEvent, PartDeltaEvent, TextPart, TextPartDelta, ToolCallPart
 from pydantic_ai.ag_ui import StateDeps
-from pydantic_ai.models.google import GoogleModel
+from pydantic_ai.ui.ag_ui import AGUIAdapter
+from ag_ui.core import (
+    BaseEvent, EventType, RunFinishedEvent, RunStartedEvent, StateDeltaEvent, TextMessageContentEvent,
+    TextMessageEndEvent, TextMessageStartEvent,
+)
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from starlette.responses import StreamingResponse
+from pydantic import ValidationError
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from starlette.routing import Route
 import os
-import sys
-import json
+import re
+import hashlib
 import uuid
 import time
 import asyncio
@@ -21,247 +34,154 @@ import asyncio
 from dotenv import load_dotenv
 load_dotenv()
 
-DATABASE_URL = os.getenv("DATABASE_URL")
+from .admission import HeldSlotResponse, Saturated, admission, saturated_response
+from .cancellation import CancellableAgent, ClientDisconnected, client_disconnects, unless_disconnected
+from .catalogue import catalogue
+from .clm_history import HISTORY_ROLES, build_message_history
+from .database import Database
+from .intent_router import IntentMatch, intent_router
+from .leads import LeadWriter
+from .logs import RequestIdMiddleware, get_logger
+from .metrics import (
+    MetricsMiddleware, TimedModel, cache_requests, observe_first_chunk, observe_tool, registry,
+    render_metrics, runs_cancelled, span, tool_result_tokens,
+)
+from .model_client import build_model, http_client, warm_up
+from .qualification import (
+    QUALIFICATION_FIELDS, clean_answer, normalise_budget_range, normalise_challenges, normalise_member_count,
+    normalise_organisation_type, normalise_timeline,
+)
+from .resilient_model import FALLBACK_MODEL, ResilientModel
+from .response_cache import answer_cache, memoise_tool_result, tool_cache_stats
+from .session_store import SessionStore
+from .single_flight import SingleFlight
+from .state_store import STATE_DELTA_KEY, StatePatchError, ThreadStateStore, json_patch
+from .sse import encode_sse_stream
+from .tool_payloads import account_tool_tokens, case_study_summary, service_summary, tool_token_stats
+from .tool_runtime import blocking_tool, inline_tool, tool_executor
+from .user_memory import user_memory
 
-# =====
-# User Context Cache (for CopilotKit instructions parsing)
-# =====
-_cached_user_context: dict = {}
+DATABASE_URL = os.getenv("DATABASE_URL")
 
-def extract_user_from_instructions(instructions: str) -> dict:
-    """Extract user info from CopilotKit instructions text or Hume system prompt."""
-    result = {"user_id": None, "name": None, "email": None}
+# Leads are written in the background; without a database, recording them is a no-op
+database = Database(DATABASE_URL) if DATABASE_URL else None
+lead_writer = LeadWriter(database)
 
-    if not instructions:
-        return result
+log = get_logger("clm")
 
-    import re
+# =====
+# User Context Store (per Hume session / CopilotKit thread)
+# =====
+user_context_store = SessionStore(
+    max_entries=int(os.getenv("USER_CONTEXT_MAX_SESSIONS", "10000")),
+    ttl_seconds=float(os.getenv("USER_CONTEXT_TTL_SECONDS", "3600")),
+)
 
-    # Try multiple formats for user ID
-    id_match = re.search(r'User ID:\s*([a-f0-9-]+)', instructions, re.IGNORECASE)
-    if id_match:
-        result["user_id"] = id_match.group(1)
 
-    # Try multiple formats for name
-    name_patterns = [
-        r'User Name:\s*([^\n]+)',
-        r'-\s*Name:\s*([^\n]+)',
-        r'Name:\s*([^\n]+)',
-        r'first name \(([^)]+)\)',
-    ]
-    for pattern in name_patterns:
-        name_match = re.search(pattern, instructions, re.IGNORECASE)
-        if name_match:
-            result["name"] = name_match.group(1).strip()
-            break
+# Both endpoints keep entries in this store and in thread_states under ids their clients choose, so
+# each has its own key prefix: no AG-UI threadId can name a CLM session ("user:<id>" included)
+def clm_key(session_id: Optional[str]) -> Optional[str]:
+    return f"clm:{session_id}" if session_id else None
+
+
+def agui_key(thread_id: Optional[str]) -> Optional[str]:
+    return f"agui:{thread_id}" if thread_id else None
+
+
+# Every label ends in ":", so finding each colon (a C-speed str.find) visits every
+# candidate in one pass; the few characters before it decide the label. Labels
+# are ranked in priority order - an earlier label wins wherever it appears,
+# matching the original search-per-pattern behaviour.
+_ID_VALUE = re.compile(r"\s*([a-f0-9-]+)", re.IGNORECASE)
+_LINE_VALUE = re.compile(r"\s*([^\n]+)")
+_TOKEN_VALUE = re.compile(r"\s*([^\s]+)")
+_FIRST_NAME_PAREN = re.compile(r"first name \(([^)]+)\)", re.IGNORECASE)
+_NAME_LABELS = ("name_user", "name_dash", "name_plain")
+_EMAIL_LABELS = ("email_user", "email_dash", "email_plain")
+
+# Hume resends the same system prompt on every turn, so parse each prompt once
+_extracted_user_cache = SessionStore(max_entries=1024, ttl_seconds=3600)
+
+
+def _classify_label(before: str, field: str) -> str:
+    """Rank a "<field>:" label by the text preceding it (already lowercased)."""
+    head = before[:-len(field)]
+    if head.endswith("user "):
+        return f"{field}_user"
+    if head.rstrip().endswith("-"):
+        return f"{field}_dash"
+    return f"{field}_plain"
+
+
+def _scan_user_fields(instructions: str) -> dict:
+    """Single pass over the instructions, keeping the first value for each label."""
+    found = {}
+    colon = instructions.find(":")
+    while colon != -1:
+        before = instructions[max(0, colon - 16):colon].lower()
+
+        label = None
+        if before.endswith("user id"):
+            label, value_pattern = "user_id", _ID_VALUE
+        elif before.endswith("name"):
+            label, value_pattern = _classify_label(before, "name"), _LINE_VALUE
+        elif before.endswith("email"):
+            label = _classify_label(before, "email")
+            value_pattern = _TOKEN_VALUE if label == "email_plain" else _LINE_VALUE
+
+        if label and label not in found:
+            value = value_pattern.match(instructions, colon + 1)
+            if value:
+                found[label] = value.group(1)
+                # Stop once the top-priority label for every field has been seen
+                if "user_id" in found and "name_user" in found and "email_user" in found:
+                    break
+        colon = instructions.find(":", colon + 1)
+    return found
 
-    # Try multiple formats for email
-    email_patterns = [
-        r'User Email:\s*([^\n]+)',
-        r'-\s*Email:\s*([^\n]+)',
-        r'Email:\s*([^\s\n]+)',
-    ]
-    for pattern in email_patterns:
-        email_match = re.search(pattern, instructions, re.IGNORECASE)
-        if email_match:
-            result["email"] = email_match.group(1).strip()
-            break
 
-    # Cache if we found any user info
-    if result["user_id"] or result["name"]:
-        global _cached_user_context
-        _cached_user_context = result
-        print(f"[Agent] Cached user from instructions: {result}", file=sys.stderr)
+def extract_user_from_instructions(instructions: str) -> dict:
+    """Extract user info from CopilotKit instructions text or Hume system prompt."""
+    if not instructions:
+        return {"user_id": None, "name": None, "email": None}
+
+    key = hashlib.blake2b(instructions.encode(), digest_size=16).digest()
+    cached = _extracted_user_cache.get(key)
+    if cached is not None:
+        return dict(cached)
+
+    found = _scan_user_fields(instructions)
+    name = next((found[label] for label in _NAME_LABELS if label in found), None)
+    if name is None:
+        # Lowest-priority name format, only worth a search when nothing else matched
+        paren = _FIRST_NAME_PAREN.search(instructions)
+        name = paren.group(1) if paren else None
+    email = next((found[label] for label in _EMAIL_LABELS if label in found), None)
+    result = {
+        "user_id": found.get("user_id"),
+        "name": name.strip() if name else None,
+        "email": email.strip() if email else None,
+    }
 
-    return result
+    _extracted_user_cache.set(key, result)
+    return dict(result)
 
-def get_effective_user_name(state_user) -> Optional[str]:
-    """Get user name from state or cached instructions."""
+def get_effective_user_name(state_user, user_context: Optional[dict] = None) -> Optional[str]:
+    """Get user name from state or the session's stored user context."""
     if state_user and (state_user.firstName or state_user.name):
         return state_user.firstName or state_user.name
-    if _cached_user_context.get("name"):
-        return _cached_user_context["name"]
+    if user_context and user_context.get("name"):
+        return user_context["name"]
     return None
 
 
 # =====
-# Membership Marketing Services Data
+# Membership Marketing Services Data (see catalogue.json)
 # =====
-SERVICES = [
-    {
-        "name": "Member Acquisition",
-        "description": "Data-driven campaigns to attract and convert new members",
-        "key_activities": [
-            "Targeted digital advertising",
-            "Content marketing and SEO",
-            "Referral programme development",
-            "Event marketing and webinars",
-            "Partnership and sponsorship activation"
-        ],
-        "typical_results": "20-40% increase in new member sign-ups",
-        "ideal_for": ["Growing organisations", "Launching new membership tiers", "Expanding into new markets"],
-        "monthly_investment": "£2,000 - £8,000"
-    },
-    {
-        "name": "Member Retention",
-        "description": "Reduce churn and increase lifetime value through engagement strategies",
-        "key_activities": [
-            "Onboarding journey optimisation",
-            "Engagement scoring and intervention",
-            "Renewal campaign automation",
-            "Win-back campaigns for lapsed members",
-            "Member feedback and NPS programmes"
-        ],
-        "typical_results": "15-30% reduction in churn rate",
-        "ideal_for": ["High churn organisations", "Mature membership bases", "Subscription fatigue issues"],
-        "monthly_investment": "£1,500 - £6,000"
-    },
-    {
-        "name": "Member Engagement",
-        "description": "Deepen member relationships and increase participation",
-        "key_activities": [
-            "Community building and forums",
-            "Content strategy and member resources",
-            "Event programming and networking",
-            "Gamification and recognition programmes",
-            "Member communications optimisation"
-        ],
-        "typical_results": "40-60% increase in active engagement",
-        "ideal_for": ["Low engagement organisations", "Diverse member bases", "Value perception issues"],
-        "monthly_investment": "£1,500 - £5,000"
-    },
-    {
-        "name": "Membership Strategy",
-        "description": "Strategic consulting to transform your membership model",
-        "key_activities": [
-            "Membership proposition review",
-            "Pricing and tier optimisation",
-            "Competitive analysis",
-            "Member journey mapping",
-            "Technology and platform assessment"
-        ],
-        "typical_results": "Clear roadmap with quick wins and long-term growth plan",
-        "ideal_for": ["Organisations in transition", "New CEOs/membership directors", "Stagnant growth"],
-        "monthly_investment": "£3,000 - £10,000"
-    },
-    {
-        "name": "Content Marketing",
-        "description": "Position your organisation as the go-to voice in your sector",
-        "key_activities": [
-            "Thought leadership content",
-            "Member magazine/newsletter production",
-            "Podcast and video production",
-            "Social media strategy",
-            "SEO and search visibility"
-        ],
-        "typical_results": "3x increase in organic reach and brand authority",
-        "ideal_for": ["Organisations needing visibility", "Competitive sectors", "Launching new initiatives"],
-        "monthly_investment": "£2,000 - £7,000"
-    }
-]
-
-CASE_STUDIES = [
-    {
-        "client": "Professional Body (Finance Sector)",
-        "challenge": "Declining membership and low engagement among younger professionals",
-        "solution": "Digital-first acquisition campaign + community platform launch",
-        "results": {
-            "new_members": "+47% in 12 months",
-            "engagement": "3x increase in event attendance",
-            "retention": "Churn reduced from 18% to 11%"
-        },
-        "services_used": ["Member Acquisition", "Member Engagement"]
-    },
-    {
-        "client": "Trade Association (Construction)",
-        "challenge": "Members questioning value; renewal rates dropping",
-        "solution": "Member value proposition refresh + retention automation",
-        "results": {
-            "retention": "Renewal rate up from 72% to 86%",
-            "nps": "NPS improved from +12 to +41",
-            "revenue": "15% increase in membership revenue"
-        },
-        "services_used": ["Member Retention", "Membership Strategy"]
-    },
-    {
-        "client": "Membership Charity (Healthcare)",
-        "challenge": "Low awareness and struggling to compete for attention",
-        "solution": "Content marketing programme + thought leadership campaign",
-        "results": {
-            "visibility": "Featured in 12 national publications",
-            "traffic": "Website traffic up 340%",
-            "leads": "Qualified leads up 89%"
-        },
-        "services_used": ["Content Marketing", "Member Acquisition"]
-    },
-    {
-        "client": "Professional Institute (Technology)",
-        "challenge": "Members not engaging with resources; low CPD completion",
-        "solution": "Gamification programme + personalised learning paths",
-        "results": {
-            "engagement": "Resource usage up 156%",
-            "completion": "CPD completion rate doubled",
-            "satisfaction": "Member satisfaction up 28 points"
-        },
-        "services_used": ["Member Engagement", "Content Marketing"]
-    }
-]
-
-ORGANISATION_TYPES = {
-    "professional_body": {
-        "name": "Professional Body",
-        "description": "Organisations representing professionals in a specific field (accountants, engineers, lawyers, etc.)",
-        "common_challenges": ["Younger member recruitment", "Demonstrating CPD value", "Competing with free online content"],
-        "typical_size": "1,000 - 100,000+ members"
-    },
-    "trade_association": {
-        "name": "Trade Association",
-        "description": "Organisations representing businesses in a specific industry",
-        "common_challenges": ["Member ROI justification", "Engaging SME members", "Policy influence visibility"],
-        "typical_size": "200 - 10,000 members"
-    },
-    "membership_charity": {
-        "name": "Membership Charity",
-        "description": "Charitable organisations with a supporter/member base",
-        "common_challenges": ["Donor fatigue", "Demonstrating impact", "Converting supporters to regular givers"],
-        "typical_size": "5,000 - 500,000+ supporters"
-    },
-    "learned_society": {
-        "name": "Learned Society",
-        "description": "Academic and research-focused membership organisations",
-        "common_challenges": ["International member engagement", "Journal/publication competition", "Early career recruitment"],
-        "typical_size": "500 - 50,000 members"
-    },
-    "member_association": {
-        "name": "Member Association",
-        "description": "General membership organisations (clubs, societies, interest groups)",
-        "common_challenges": ["Volunteer engagement", "Modernising operations", "Competing for attention"],
-        "typical_size": "100 - 50,000 members"
-    }
-}
-
-CHALLENGES = {
-    "acquisition": {
-        "name": "Member Acquisition",
-        "symptoms": ["Declining new member numbers", "High cost per acquisition", "Low awareness in target market"],
-        "recommended_services": ["Member Acquisition", "Content Marketing"]
-    },
-    "retention": {
-        "name": "Member Retention",
-        "symptoms": ["High churn rate", "Low renewal rates", "Members questioning value"],
-        "recommended_services": ["Member Retention", "Member Engagement"]
-    },
-    "engagement": {
-        "name": "Member Engagement",
-        "symptoms": ["Low event attendance", "Poor resource usage", "Silent majority of members"],
-        "recommended_services": ["Member Engagement", "Content Marketing"]
-    },
-    "strategy": {
-        "name": "Strategic Direction",
-        "symptoms": ["Unclear value proposition", "Outdated membership model", "Competitive pressure"],
-        "recommended_services": ["Membership Strategy", "Member Acquisition"]
-    }
-}
+SERVICES = catalogue.services
+CASE_STUDIES = catalogue.case_studies
+ORGANISATION_TYPES = catalogue.organisation_types
+CHALLENGES = catalogue.challenges
 
 
 # =====
@@ -287,13 +207,31 @@ class AppState(BaseModel):
     current_page: Optional[str] = None
 
 
+@dataclass
+class SessionDeps(StateDeps[AppState]):
+    """Agent deps carrying the conversation key and its stored user context."""
+    session_id: Optional[str] = None
+    user_context: dict = field(default_factory=dict)
+
+
+# AG-UI thread state lives server-side, so clients only send what changed (see state_store.py)
+thread_states = ThreadStateStore(AppState, database)
+
+
 # =====
 # Agent Definition
 # =====
+# Gemini over the shared, pooled HTTP client (see model_client.py), with retries, hedging
+# and an optional fallback model (see resilient_model.py); each attempt is timed
+gemini_model = build_model()
+fallback_model = build_model(FALLBACK_MODEL) if FALLBACK_MODEL else None
+
 agent = Agent(
-    model=GoogleModel('gemini-2.0-flash'),
-    deps_type=StateDeps[AppState],
-    system_prompt=dedent("""
+    model=ResilientModel(TimedModel(gemini_model), fallback=TimedModel(fallback_model) if fallback_model else None),
+    deps_type=SessionDeps,
+    # Instructions rather than a system prompt: Pydantic AI only adds a system prompt when there
+    # is no message history, and CLM turns after the first always carry some
+    instructions=dedent("""
         You are a friendly, knowledgeable membership marketing consultant.
         You help associations, professional bodies, and membership organisations grow and retain their members.
 
@@ -326,6 +264,7 @@ agent = Agent(
 
         **Flow like a consultation:**
         - Ask ONE question at a time
+        - As soon as they answer, save it with record_qualification - never ask again for something already recorded
         - Acknowledge their answer and show understanding
         - Build on what they share with relevant insights
         - Only recommend services AFTER you understand their needs
@@ -345,6 +284,7 @@ agent = Agent(
         | Success stories | get_case_studies |
         | Service details | get_service_info |
         | Their profile | get_my_profile |
+        | Saving their qualification answers | record_qualification |
         | Book a call | book_consultation |
 
         ## Key Stats to Reference
@@ -364,6 +304,9 @@ agent = Agent(
     """)
 )
 
+# Streamed runs (CLM streaming, AG-UI) go through this, so a client going away stops its run
+streaming_agent = CancellableAgent(agent)
+
 
 # Page context descriptions
 PAGE_CONTEXTS = {
@@ -380,89 +323,186 @@ PAGE_CONTEXTS = {
     "homepage": "The user is on the HOMEPAGE. Understand their needs and guide them to relevant information.",
 }
 
-# Dynamic instructions that inject user context from state
-@agent.instructions
-async def user_context_instructions(ctx: RunContext[StateDeps[AppState]]) -> str:
-    """Inject user context into the system prompt dynamically."""
-    state = ctx.deps.state
+# Instruction templates, dedented once at import rather than on every model request
+_USER_INSTRUCTIONS_TEMPLATE = dedent("""
+    ## CURRENT PAGE CONTEXT
+    {page_context}
+
+    ## CURRENT USER CONTEXT
+    You are speaking with a logged-in user. Here is their information:
+    - Name: {name}
+    - First Name: {first_name}
+    - Email: {email}
+    - Organisation Type: {org_type}
+    - Organisation Name: {org_name}
+    - Member Count: {member_count}
+    - Primary Challenges: {challenges}
+    - Budget Range: {budget_range}
+    - Timeline: {timeline}
+
+    IMPORTANT INSTRUCTIONS:
+    - ALWAYS address the user by their first name ({first_name_raw}) in your responses
+    - When they ask "what's my name", "who am I", or about their profile, tell them: "{name_raw}"
+    - Use their organisation context to give personalised recommendations
+    - Reference the current page context when relevant
+""")
+
+_GUEST_INSTRUCTIONS_TEMPLATE = dedent("""
+    ## CURRENT PAGE CONTEXT
+    {page_context}
+
+    ## GUEST USER
+    This user is not logged in. They can still have a consultation.
+    Focus on understanding their needs and qualifying them for a call.
+""")
+
+_QUALIFICATION_TEMPLATE = dedent("""
+    ## QUALIFICATION SO FAR
+    {answers}
+    Still to ask about: {missing}
+""")
+
+# Guest instructions only vary by page, so every one is rendered up front
+_GUEST_INSTRUCTIONS = {
+    page: _GUEST_INSTRUCTIONS_TEMPLATE.format(page_context=page_context)
+    for page, page_context in PAGE_CONTEXTS.items()
+}
+
+
+@lru_cache(maxsize=1024)
+def _render_user_instructions(
+    page_context: str,
+    name: Optional[str],
+    first_name: Optional[str],
+    email: Optional[str],
+    org_type: Optional[str],
+    org_name: Optional[str],
+    member_count: Optional[str],
+    challenges: tuple[str, ...],
+    budget_range: Optional[str],
+    timeline: Optional[str]
+) -> str:
+    return _USER_INSTRUCTIONS_TEMPLATE.format(
+        page_context=page_context,
+        name=name or 'Unknown',
+        name_raw=name,
+        first_name=first_name or 'Unknown',
+        first_name_raw=first_name,
+        email=email or 'Not provided',
+        org_type=org_type or "Not specified",
+        org_name=org_name or 'Not provided',
+        member_count=member_count or 'Not discussed',
+        challenges=", ".join(challenges) if challenges else "Not discussed yet",
+        budget_range=budget_range or 'Not discussed',
+        timeline=timeline or 'Not discussed',
+    )
+
+
+@lru_cache(maxsize=1024)
+def _render_qualification(answers: tuple[tuple[str, str], ...]) -> str:
+    known = dict(answers)
+    return _QUALIFICATION_TEMPLATE.format(
+        answers="\n".join(f"- {key.replace('_', ' ').title()}: {value}" for key, value in answers),
+        missing=", ".join(key.replace("_", " ") for key in QUALIFICATION_FIELDS if key not in known) or "nothing - ready to recommend",
+    )
+
+
+def render_user_context_instructions(state: Optional[AppState]) -> str:
+    """User and page context for the system prompt, memoised on the fields it shows.
+
+    Runs before every model request of a run (each tool-loop iteration too),
+    and the state rarely changes between them.
+    """
     user = state.user if state else None
 
     # Get page context
     current_page = state.current_page if state else None
-    page_context = PAGE_CONTEXTS.get(current_page or "", PAGE_CONTEXTS["homepage"])
-
-    # Build user context section
-    if user and (user.name or user.firstName):
-        first_name = user.firstName or (user.name.split()[0] if user.name else None)
-        org_type = state.organisation_type or "Not specified"
-        challenges = ", ".join(state.primary_challenges) if state.primary_challenges else "Not discussed yet"
-
-        return dedent(f"""
-            ## CURRENT PAGE CONTEXT
-            {page_context}
-
-            ## CURRENT USER CONTEXT
-            You are speaking with a logged-in user. Here is their information:
-            - Name: {user.name or 'Unknown'}
-            - First Name: {first_name or 'Unknown'}
-            - Email: {user.email or 'Not provided'}
-            - Organisation Type: {org_type}
-            - Organisation Name: {state.organisation_name or 'Not provided'}
-            - Member Count: {state.member_count or 'Not discussed'}
-            - Primary Challenges: {challenges}
-            - Budget Range: {state.budget_range or 'Not discussed'}
-
-            IMPORTANT INSTRUCTIONS:
-            - ALWAYS address the user by their first name ({first_name}) in your responses
-            - When they ask "what's my name", "who am I", or about their profile, tell them: "{user.name}"
-            - Use their organisation context to give personalised recommendations
-            - Reference the current page context when relevant
-        """)
-    else:
-        return dedent(f"""
-            ## CURRENT PAGE CONTEXT
-            {page_context}
+    if current_page not in PAGE_CONTEXTS:
+        current_page = "homepage"
+
+    if not (user and (user.name or user.firstName)):
+        # Answers recorded so far, so the model doesn't need the transcript to remember them
+        answers = tuple(
+            (key, ", ".join(value) if isinstance(value, list) else value)
+            for key in ("organisation_type", "organisation_name", *QUALIFICATION_FIELDS[1:])
+            if (value := getattr(state, key, None))
+        )
+        if not answers:
+            return _GUEST_INSTRUCTIONS[current_page]
+        return _GUEST_INSTRUCTIONS[current_page] + _render_qualification(answers)
+
+    first_name = user.firstName or (user.name.split()[0] if user.name else None)
+    return _render_user_instructions(
+        PAGE_CONTEXTS[current_page],
+        user.name,
+        first_name,
+        user.email,
+        state.organisation_type,
+        state.organisation_name,
+        state.member_count,
+        tuple(state.primary_challenges),
+        state.budget_range,
+        state.timeline,
+    )
 
-            ## GUEST USER
-            This user is not logged in. They can still have a consultation.
-            Focus on understanding their needs and qualifying them for a call.
-        """)
+
+# Dynamic instructions that inject user context from state
+@agent.instructions
+async def user_context_instructions(ctx: RunContext[SessionDeps]) -> str:
+    """Inject user context into the system prompt dynamically."""
+    state = ctx.deps.state
+    user_id = (state.user.id if state and state.user else None) or ctx.deps.user_context.get("user_id")
+    # Usually prefetched while the request was prepared (see user_memory.py); only a run's
+    # first model request waits for it, not each tool-loop iteration after it
+    memory = await user_memory.instructions(user_id, wait=ctx.run_step == 0)
+    return render_user_context_instructions(state) + memory
 
 
 # =====
 # Tools
 # =====
 @agent.tool
+@inline_tool
+@observe_tool
+@account_tool_tokens
 def recommend_services(
-    ctx: RunContext[StateDeps[AppState]],
-    challenge: Optional[str] = None
+    ctx: RunContext[SessionDeps],
+    challenge: Optional[str] = None,
+    detail: bool = False
 ) -> dict:
     """
     Recommend membership marketing services based on the user's challenges.
 
     Args:
         challenge: Optional filter for specific challenge (acquisition, retention, engagement, strategy)
+        detail: Include each service's key activities and ideal-for list (only when the user asks for specifics)
     """
+    return _recommend_services(challenge, detail)
+
+
+@memoise_tool_result()
+def _recommend_services(challenge: Optional[str], detail: bool = False) -> dict:
     services = SERVICES
 
     # Filter by challenge if specified
     if challenge:
-        challenge_lower = challenge.lower()
-        challenge_data = CHALLENGES.get(challenge_lower)
+        challenge_data = CHALLENGES.get(challenge.lower())
         if challenge_data:
-            recommended_names = challenge_data["recommended_services"]
-            services = [s for s in services if s["name"] in recommended_names]
+            services = catalogue.services_named(challenge_data["recommended_services"])
 
     return {
         "title": f"Recommended Services" + (f" for {challenge}" if challenge else ""),
-        "services": services,
+        "services": services if detail else [service_summary(s) for s in services],
         "next_step": "Book a free consultation to discuss which services would work best for your organisation."
     }
 
 
 @agent.tool
+@inline_tool
+@observe_tool
+@account_tool_tokens
 def assess_challenges(
-    ctx: RunContext[StateDeps[AppState]],
+    ctx: RunContext[SessionDeps],
     symptoms: Optional[List[str]] = None
 ) -> dict:
     """
@@ -483,16 +523,15 @@ def assess_challenges(
             ]
         }
 
-    # Match symptoms to challenges
-    identified_challenges = []
-    for challenge_key, challenge_data in CHALLENGES.items():
-        for symptom in symptoms:
-            if any(s.lower() in symptom.lower() for s in challenge_data["symptoms"]):
-                if challenge_data["name"] not in [c["name"] for c in identified_challenges]:
-                    identified_challenges.append({
-                        "name": challenge_data["name"],
-                        "recommended_services": challenge_data["recommended_services"]
-                    })
+    # Rank challenges by similarity to the described symptoms
+    identified_challenges = [
+        {
+            "name": CHALLENGES[key]["name"],
+            "match_score": round(score, 2),
+            "recommended_services": CHALLENGES[key]["recommended_services"]
+        }
+        for key, score in catalogue.rank_challenges(symptoms)
+    ]
 
     return {
         "symptoms_analysed": symptoms,
@@ -502,10 +541,15 @@ def assess_challenges(
 
 
 @agent.tool
+@inline_tool
+@observe_tool
+@account_tool_tokens
 def get_case_studies(
-    ctx: RunContext[StateDeps[AppState]],
+    ctx: RunContext[SessionDeps],
     organisation_type: Optional[str] = None,
-    service: Optional[str] = None
+    service: Optional[str] = None,
+    limit: int = 3,
+    detail: bool = False
 ) -> dict:
     """
     Get relevant case studies and success stories.
@@ -513,23 +557,46 @@ def get_case_studies(
     Args:
         organisation_type: Filter by organisation type (professional_body, trade_association, etc.)
         service: Filter by service used
+        limit: Maximum number of case studies to return (most relevant first)
+        detail: Include the solution and every result, not just the headline result
     """
-    cases = CASE_STUDIES
+    return _get_case_studies(organisation_type, service, limit, detail)
 
-    # Filter by service if specified
-    if service:
-        cases = [c for c in cases if any(service.lower() in s.lower() for s in c["services_used"])]
 
-    return {
+@memoise_tool_result()
+def _get_case_studies(
+    organisation_type: Optional[str],
+    service: Optional[str],
+    limit: int = 3,
+    detail: bool = False
+) -> dict:
+    cases, total = catalogue.find_case_studies(service=service, organisation_type=organisation_type, limit=limit)
+    relaxed = None
+
+    # Nothing for this exact combination - fall back to the service, then the organisation type
+    if not cases and service and organisation_type:
+        for relaxed, (svc, org) in (("organisation_type", (service, None)), ("service", (None, organisation_type))):
+            cases, total = catalogue.find_case_studies(service=svc, organisation_type=org, limit=limit)
+            if cases:
+                break
+
+    result = {
         "title": "Success Stories",
-        "case_studies": cases,
+        "case_studies": cases if detail else [case_study_summary(c) for c in cases],
+        "total_matches": total,
         "note": "These are representative results. Actual results depend on your specific situation."
     }
+    if relaxed and cases:
+        result["note"] = f"No exact match for both filters, so this ignores the {relaxed.replace('_', ' ')} filter. " + result["note"]
+    return result
 
 
 @agent.tool
+@inline_tool
+@observe_tool
+@account_tool_tokens
 def get_service_info(
-    ctx: RunContext[StateDeps[AppState]],
+    ctx: RunContext[SessionDeps],
     service_name: str
 ) -> dict:
     """
@@ -538,18 +605,21 @@ def get_service_info(
     Args:
         service_name: The name of the service to look up
     """
-    service_lower = service_name.lower()
-
-    for service in SERVICES:
-        if service_lower in service["name"].lower():
-            return {
-                "service": service["name"],
-                "description": service["description"],
-                "key_activities": service["key_activities"],
-                "typical_results": service["typical_results"],
-                "ideal_for": service["ideal_for"],
-                "investment": service["monthly_investment"]
-            }
+    return _get_service_info(service_name)
+
+
+@memoise_tool_result()
+def _get_service_info(service_name: str) -> dict:
+    service = catalogue.find_service(service_name)
+    if service:
+        return {
+            "service": service["name"],
+            "description": service["description"],
+            "key_activities": service["key_activities"],
+            "typical_results": service["typical_results"],
+            "ideal_for": service["ideal_for"],
+            "investment": service["monthly_investment"]
+        }
 
     return {
         "error": f"Service not found: {service_name}",
@@ -559,8 +629,11 @@ def get_service_info(
 
 
 @agent.tool
+@inline_tool
+@observe_tool
+@account_tool_tokens
 def get_organisation_insights(
-    ctx: RunContext[StateDeps[AppState]],
+    ctx: RunContext[SessionDeps],
     organisation_type: str
 ) -> dict:
     """
@@ -569,10 +642,13 @@ def get_organisation_insights(
     Args:
         organisation_type: Type of organisation (professional_body, trade_association, etc.)
     """
-    org_key = organisation_type.lower().replace(" ", "_")
+    return _get_organisation_insights(organisation_type)
 
-    if org_key in ORGANISATION_TYPES:
-        org = ORGANISATION_TYPES[org_key]
+
+@memoise_tool_result()
+def _get_organisation_insights(organisation_type: str) -> dict:
+    org = catalogue.find_organisation_type(organisation_type)
+    if org:
         return {
             "organisation_type": org["name"],
             "description": org["description"],
@@ -589,8 +665,69 @@ def get_organisation_insights(
 
 
 @agent.tool
+@inline_tool
+@observe_tool
+@account_tool_tokens
+def record_qualification(
+    ctx: RunContext[SessionDeps],
+    organisation_type: Optional[str] = None,
+    organisation_name: Optional[str] = None,
+    member_count: Optional[str] = None,
+    primary_challenges: Optional[List[str]] = None,
+    budget_range: Optional[str] = None,
+    timeline: Optional[str] = None
+) -> ToolReturn:
+    """
+    Save the prospect's answers to the qualification questions as soon as they give them.
+    Pass only what they have just told you; earlier answers are kept.
+
+    Args:
+        organisation_type: Type of organisation (professional_body, trade_association, etc.)
+        organisation_name: The organisation's name
+        member_count: Roughly how many members, as they said it (e.g. "about 1,200")
+        primary_challenges: Their challenges (acquisition, retention, engagement, strategy)
+        budget_range: Monthly budget, as they said it (e.g. "around 3k")
+        timeline: When they want to start (e.g. "asap", "within 3 months", "just exploring")
+    """
+    state = ctx.deps.state
+    before = state.model_dump(mode="json", exclude={"user"})
+
+    answers = {
+        "organisation_type": normalise_organisation_type(organisation_type),
+        "organisation_name": clean_answer(organisation_name),
+        "member_count": normalise_member_count(member_count),
+        "budget_range": normalise_budget_range(budget_range),
+        "timeline": normalise_timeline(timeline),
+    }
+    for field_name, value in answers.items():
+        if value:
+            setattr(state, field_name, value)
+    if primary_challenges:
+        state.primary_challenges = normalise_challenges([*state.primary_challenges, *primary_challenges])
+
+    after = state.model_dump(mode="json", exclude={"user"})
+    delta = json_patch(before, after)
+
+    # The model gets a short acknowledgement; the UI gets only the fields that changed
+    return ToolReturn(
+        return_value={
+            "recorded": {key: after[key] for key in after if after[key] != before[key]},
+            "still_to_ask": [key for key in QUALIFICATION_FIELDS if not after[key]],
+        },
+        metadata=[StateDeltaEvent(type=EventType.STATE_DELTA, delta=delta)] if delta else None,
+    )
+
+
+CALENDAR_LINK = "https://calendly.com/membership-marketing-agency/consultation"
+BOOKING_MESSAGE = "Great! I'd love to set up a free 30-minute consultation call."
+
+
+@agent.tool
+@blocking_tool()
+@observe_tool
+@account_tool_tokens
 def book_consultation(
-    ctx: RunContext[StateDeps[AppState]],
+    ctx: RunContext[SessionDeps],
     preferred_time: Optional[str] = None,
     specific_topic: Optional[str] = None
 ) -> dict:
@@ -603,11 +740,12 @@ def book_consultation(
     """
     state = ctx.deps.state
     user = state.user if state else None
+    user_context = ctx.deps.user_context
 
     # Gather what we know about them
     profile_summary = {
-        "name": user.name if user else _cached_user_context.get("name"),
-        "email": user.email if user else _cached_user_context.get("email"),
+        "name": user.name if user else user_context.get("name"),
+        "email": user.email if user else user_context.get("email"),
         "organisation_type": state.organisation_type if state else None,
         "organisation_name": state.organisation_name if state else None,
         "member_count": state.member_count if state else None,
@@ -615,9 +753,23 @@ def book_consultation(
         "budget_range": state.budget_range if state else None
     }
 
+    # Queued for the background writer - never a database round-trip mid-conversation
+    lead_fields = {
+        "session_id": ctx.deps.session_id,
+        "user_id": user.id if user and user.id else user_context.get("user_id"),
+        "email": profile_summary["email"],
+    }
+    lead_writer.record("booking", {
+        "profile": profile_summary,
+        "preferred_time": preferred_time,
+        "topic": specific_topic,
+    }, **lead_fields)
+    if state:
+        lead_writer.record("qualification", state.model_dump(exclude={"user"}), **lead_fields)
+
     return {
         "action": "book_consultation",
-        "message": "Great! I'd love to set up a free 30-minute consultation call.",
+        "message": BOOKING_MESSAGE,
         "profile_captured": profile_summary,
         "preferred_time": preferred_time,
         "topic": specific_topic,
@@ -627,27 +779,31 @@ def book_consultation(
             "We'll share some initial ideas on the call",
             "No obligation - it's a chance to see if we're a good fit"
         ],
-        "calendar_link": "https://calendly.com/membership-marketing-agency/consultation"
+        "calendar_link": CALENDAR_LINK
     }
 
 
 @agent.tool
+@inline_tool
+@observe_tool
+@account_tool_tokens
 def get_my_profile(
-    ctx: RunContext[StateDeps[AppState]]
+    ctx: RunContext[SessionDeps]
 ) -> dict:
     """
     Get the current user's profile information.
-    Returns user details from state or cached instructions.
+    Returns user details from state or the session's stored user context.
     Use this when the user asks about their profile, name, or account.
     """
     state = ctx.deps.state
     user = state.user if state else None
+    user_context = ctx.deps.user_context
 
-    # Try to get info from state first, then from cached instructions
-    user_id = user.id if user and user.id else _cached_user_context.get("user_id")
-    name = get_effective_user_name(user)
+    # Try to get info from state first, then from the session's user context
+    user_id = user.id if user and user.id else user_context.get("user_id")
+    name = get_effective_user_name(user, user_context)
     first_name = user.firstName if user and user.firstName else (name.split()[0] if name else None)
-    email = user.email if user and user.email else _cached_user_context.get("email")
+    email = user.email if user and user.email else user_context.get("email")
 
     if not user_id and not name:
         return {
@@ -673,14 +829,168 @@ def get_my_profile(
     }
 
 
+# =====
+# Fast Path (answered from data, without a model round-trip)
+# =====
+def _words(text: str) -> set:
+    return set(re.findall(r"[a-z]+", text.lower()))
+
+
+def fast_path_answerers(deps: SessionDeps) -> dict:
+    """Answer functions per router intent, over the same tools the agent would have called.
+
+    Only read-only tools are called (they only read ctx.deps); anything with a
+    side effect, like the lead book_consultation records, is left to the agent.
+    """
+    # __wrapped__ is the sync tool behind its tool_runtime wrapper
+    ctx = SimpleNamespace(deps=deps)
+
+    def profile(match: IntentMatch) -> Optional[str]:
+        result = get_my_profile.__wrapped__(ctx)
+        if not result["logged_in"]:
+            return result["message"]
+        if not result["name"]:
+            return None
+        email = f" and your email is {result['email']}" if result["email"] else ""
+        return f"You're {result['name']}{email}."
+
+    def booking_link(match: IntentMatch) -> str:
+        # Only the link, without the lead book_consultation would record
+        return (
+            f"{BOOKING_MESSAGE} You can pick a time that suits you at {CALENDAR_LINK}, "
+            "and we'll send a calendar invite to your email."
+        )
+
+    def list_services(match: IntentMatch) -> str:
+        names = [service["name"] for service in SERVICES]
+        return (
+            f"We offer {len(names)} services: {', '.join(names[:-1])} and {names[-1]}. "
+            "Which of these sounds closest to what you need?"
+        )
+
+    def service_price(match: IntentMatch) -> Optional[str]:
+        asked = match.slots.get("service", "")
+        service = catalogue.find_service(asked)
+        # Only a name made of the service's own words ("retention", not "it")
+        if service is None or not _words(asked) or not _words(asked) <= _words(service["name"]):
+            return None
+        result = get_service_info.__wrapped__(ctx, service["name"])
+        return (
+            f"{result['service']} is typically {result['investment']} a month, depending on scope. "
+            "Would you like to book a free consultation for a tailored quote?"
+        )
+
+    return {
+        "profile": profile,
+        "booking_link": booking_link,
+        "list_services": list_services,
+        "service_price": service_price,
+    }
+
+
+async def fast_path_events(thread_id: str, run_id: str, answer: str) -> AsyncIterator[BaseEvent]:
+    """An AG-UI run that just says the fast-path answer."""
+    message_id = str(uuid.uuid4())
+    yield RunStartedEvent(thread_id=thread_id, run_id=run_id)
+    yield TextMessageStartEvent(message_id=message_id)
+    yield TextMessageContentEvent(message_id=message_id, delta=answer)
+    yield TextMessageEndEvent(message_id=message_id)
+    yield RunFinishedEvent(thread_id=thread_id, run_id=run_id)
+
+
 # =====
 # FastAPI App Setup
 # =====
+async def run_ag_ui(request: Request) -> Response:
+    """Run the agent for one AG-UI request with deps scoped to its CopilotKit thread."""
+    try:
+        with span("agui_parse"):
+            adapter = await AGUIAdapter.from_request(request, agent=streaming_agent)
+    except ValidationError as e:
+        return Response(content=e.json(), media_type="application/json", status_code=422)
+
+    thread_id = adapter.run_input.thread_id
+    store_key = agui_key(thread_id)
+    try:
+        with span("agui_state"):
+            state = await thread_states.resolve(store_key, adapter.run_input.state)
+    except (StatePatchError, ValidationError) as e:
+        return JSONResponse({"detail": str(e)}, status_code=422)
+
+    user = state.user
+    if user is not None and (user.id or user.name):
+        user_context = {"user_id": user.id, "name": user.name, "email": user.email}
+        user_context_store.set(store_key, user_context)
+    else:
+        user_context = user_context_store.get(store_key, {})
+    # Fetched while the request queues for a slot and the run starts
+    user_memory.prefetch(user_context.get("user_id"))
+
+    deps = SessionDeps(state=state, session_id=thread_id, user_context=user_context)
+
+    # Deterministic requests are answered before queueing for a model run
+    last_message = adapter.run_input.messages[-1] if adapter.run_input.messages else None
+    if last_message is not None and last_message.role == "user" and isinstance(last_message.content, str):
+        answer = intent_router.answer("agui", last_message.content, fast_path_answerers(deps), admission.mean_run_seconds)
+        if answer is not None:
+            thread_states.save(store_key, state)
+            return adapter.streaming_response(fast_path_events(thread_id, adapter.run_input.run_id, answer))
+
+    try:
+        held = await admission.acquire(user_context.get("user_id") or thread_id)
+    except Saturated as e:
+        return saturated_response(e)
+
+    # The adapter validates its state into deps.state; handing it the resolved
+    # instance makes that a no-op instead of a second full validation
+    adapter.state = state
+
+    async def events():
+        try:
+            async for event in adapter.run_stream(deps=deps):
+                yield event
+        except (asyncio.CancelledError, GeneratorExit):
+            # Starlette stops the response when the client disconnects; the run stops with it
+            client_disconnects.inc(endpoint="agui")
+            runs_cancelled.inc(endpoint="agui")
+            raise
+        finally:
+            thread_states.save(store_key, deps.state)
+
+    return HeldSlotResponse(adapter.streaming_response(events()), held)
+
+
 # Export agent as AG-UI app
-ag_ui_app = agent.to_ag_ui(deps=StateDeps(AppState()))
+ag_ui_app = Starlette(routes=[Route("/", run_ag_ui, methods=["POST"])])
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Warm model connections in the background while /health reports warming; flush and close pools on shutdown."""
+    warm_up_task = None
+    if not warm_up.ready:
+        warm_up_task = asyncio.create_task(warm_up.run(gemini_model))
+    lead_writer.start()
+    yield
+    if warm_up_task is not None:
+        warm_up_task.cancel()
+    await thread_states.drain()
+    # Tool calls still running may queue leads, so they finish before the writer stops
+    await asyncio.to_thread(tool_executor.shutdown, cancel_futures=True)
+    await asyncio.to_thread(lead_writer.stop)
+    await user_memory.aclose()
+    await http_client.aclose()
+
 
 # Main FastAPI app
-main_app = FastAPI(title="Membership Marketing Agent", description="AI assistant for membership marketing consultation")
+main_app = FastAPI(
+    title="Membership Marketing Agent",
+    description="AI assistant for membership marketing consultation",
+    lifespan=lifespan,
+)
+
+# Correlation id for every request's log lines, and request metrics (added first, so they wrap CORS too)
+main_app.add_middleware(MetricsMiddleware)
+main_app.add_middleware(RequestIdMiddleware)
 
 # CORS middleware
 main_app.add_middleware(
@@ -706,8 +1016,31 @@ def root():
 
 @main_app.get("/health")
 def health():
-    """Health check for Railway."""
-    return {"status": "healthy"}
+    """Health check for Railway: not ready until model connections are warm."""
+    if not warm_up.ready:
+        return JSONResponse({"status": "warming"}, status_code=503)
+    return {"status": "healthy", "warm_up_seconds": warm_up.duration, "warm_up_error": warm_up.error}
+
+
+def _collect_cache_metrics() -> None:
+    """Mirror the caches' and tool meter's running totals into the registry at scrape time."""
+    answer_stats = answer_cache.stats()
+    cache_requests.set(answer_stats["hits"], cache="clm_answer", result="hit")
+    cache_requests.set(answer_stats["misses"], cache="clm_answer", result="miss")
+    for tool, stats in tool_cache_stats().items():
+        cache_requests.set(stats["hits"], cache=tool, result="hit")
+        cache_requests.set(stats["misses"], cache=tool, result="miss")
+    for tool, stats in tool_token_stats().items():
+        tool_result_tokens.set(stats["tokens"], tool=tool)
+
+
+registry.add_collector(_collect_cache_metrics)
+
+
+@main_app.get("/metrics")
+def metrics():
+    """Prometheus text exposition of latency, in-flight and error metrics."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
 
 
 # =====
@@ -722,114 +1055,301 @@ class ChatCompletionRequest(BaseModel):
     messages: List[ChatMessage]
     model: Optional[str] = "membership-marketing-agent"
     stream: Optional[bool] = True
+    # Hume passes custom_session_id as a query parameter; proxies may forward it in the body
+    custom_session_id: Optional[str] = None
+    session_id: Optional[str] = None
 
 
-async def stream_sse_response(content: str, msg_id: str):
-    """Stream OpenAI-compatible SSE chunks for Hume EVI."""
-    words = content.split(' ')
-    for i, word in enumerate(words):
-        chunk = {
-            "id": msg_id,
-            "object": "chat.completion.chunk",
-            "created": int(time.time()),
-            "model": "membership-marketing-agent",
-            "choices": [{
-                "index": 0,
-                "delta": {"content": word + (' ' if i < len(words) - 1 else '')},
-                "finish_reason": None
-            }]
-        }
-        yield f"data: {json.dumps(chunk)}\n\n"
-        await asyncio.sleep(0.01)
+CLM_FALLBACK_RESPONSE = "Sorry, I couldn't process that request. Try asking about membership marketing!"
+
+
+def build_clm_deps(system_prompt: str = None, session_id: str = None) -> SessionDeps:
+    """Build agent deps for a CLM run, seeding the user from the Hume system prompt."""
+    # Extract user context from system prompt if provided, else reuse the session's
+    user_context = extract_user_from_instructions(system_prompt) if system_prompt else {}
+    if user_context.get("user_id") or user_context.get("name"):
+        # Without a session id, key by user so the context never leaks across people
+        session_id = session_id or (f"user:{user_context['user_id']}" if user_context.get("user_id") else None)
+        user_context_store.set(clm_key(session_id), user_context)
+    else:
+        user_context = user_context_store.get(clm_key(session_id), {})
+
+    log.info("session user context", extra={
+        "session_id": session_id,
+        "user_id": user_context.get("user_id"),
+        "has_name": bool(user_context.get("name")),
+        "has_email": bool(user_context.get("email")),
+    })
+
+    # Build state with the session's user if available
+    state = AppState()
+    if user_context.get("name") or user_context.get("user_id"):
+        state.user = UserProfile(
+            id=user_context.get("user_id"),
+            name=user_context.get("name"),
+            firstName=user_context.get("name"),
+            email=user_context.get("email")
+        )
+        log.debug("state user set", extra={"user_name": state.user.name})
+
+    return SessionDeps(state=state, session_id=session_id, user_context=user_context)
+
 
-    final = {
-        "id": msg_id,
-        "object": "chat.completion.chunk",
-        "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]
+async def restore_session_state(deps: SessionDeps) -> None:
+    """Carry recorded qualification answers across a Hume session's turns; the user still comes from the prompt."""
+    if deps.session_id:
+        delta = {"user": deps.state.user.model_dump()} if deps.state.user else {}
+        deps.state = await thread_states.resolve(clm_key(deps.session_id), {STATE_DELTA_KEY: delta})
+
+
+def clm_answer_cache_key(
+    deps: SessionDeps,
+    user_message: str,
+    system_prompt: Optional[str],
+    has_history: bool
+) -> Optional[str]:
+    """Answer-cache key for guest opening turns; None when the answer may be personal or contextual."""
+    if has_history or deps.state.user or deps.user_context.get("name") or deps.user_context.get("user_id"):
+        return None
+    return answer_cache.key(user_message, system_prompt, deps.state.model_dump_json(exclude={"user"}))
+
+
+# Tools that record something for the session (its state, a lead); replaying an answer
+# that called one would skip that for the next guest
+STATEFUL_TOOLS = frozenset({"record_qualification", "book_consultation"})
+
+
+def replayable(messages: List[ModelMessage]) -> bool:
+    """Whether a run's answer may be cached for other guests: it called no stateful tool."""
+    return not any(
+        isinstance(part, ToolCallPart) and part.tool_name in STATEFUL_TOOLS
+        for message in messages
+        for part in message.parts
+    )
+
+
+def usage_fields(usage) -> dict:
+    """Token and request counts from a run's usage, for its log line."""
+    return {
+        "input_tokens": usage.input_tokens,
+        "output_tokens": usage.output_tokens,
+        "model_requests": usage.requests,
+        "tool_calls": usage.tool_calls,
     }
-    yield f"data: {json.dumps(final)}\n\n"
-    yield "data: [DONE]\n\n"
 
 
-async def run_agent_for_clm(user_message: str, system_prompt: str = None) -> str:
+def clm_quick_answer(deps: SessionDeps, user_message: str, cache_key: Optional[str]) -> Optional[str]:
+    """A cached or fast-path answer for a CLM turn, or None when it needs an agent run."""
+    cached_answer = answer_cache.get(cache_key)
+    if cached_answer is not None:
+        return cached_answer
+    return intent_router.answer("clm", user_message, fast_path_answerers(deps), admission.mean_run_seconds)
+
+
+async def run_agent_for_clm(
+    user_message: str,
+    deps: SessionDeps,
+    cache_key: Optional[str] = None,
+    message_history: Optional[List[ModelMessage]] = None
+) -> str:
     """Run the Pydantic AI agent and return text response."""
+    session_id = deps.session_id
     try:
-        # Extract user context from system prompt if provided
-        if system_prompt:
-            extract_user_from_instructions(system_prompt)
-
-        print(f"[CLM] Starting agent run for: {user_message[:50]}", file=sys.stderr)
-        print(f"[CLM] Cached user context: {_cached_user_context}", file=sys.stderr)
-
-        # Build state with cached user if available
-        state = AppState()
-        if _cached_user_context.get("name") or _cached_user_context.get("user_id"):
-            state.user = UserProfile(
-                id=_cached_user_context.get("user_id"),
-                name=_cached_user_context.get("name"),
-                firstName=_cached_user_context.get("name"),
-                email=_cached_user_context.get("email")
-            )
-            print(f"[CLM] State user set: {state.user.name}", file=sys.stderr)
-
-        deps = StateDeps(state)
-        result = await agent.run(user_message, deps=deps)
-        print(f"[CLM] Agent result type: {type(result)}", file=sys.stderr)
+        log.info("agent run started", extra={"session_id": session_id, "query_chars": len(user_message)})
+        with span("agent_run"):
+            try:
+                result = await agent.run(user_message, deps=deps, message_history=message_history)
+            finally:
+                thread_states.save(clm_key(deps.session_id), deps.state)
+        log.info("agent run finished", extra={"session_id": session_id, **usage_fields(result.usage())})
+        log.debug("agent result", extra={"result_type": type(result).__name__})
 
         # Pydantic AI returns result.output for the text response
         if hasattr(result, 'output') and result.output:
-            return str(result.output)
-        if hasattr(result, 'data') and result.data:
-            return str(result.data)
-        return str(result)
-    except Exception as e:
-        import traceback
-        print(f"[CLM] Agent error: {e}", file=sys.stderr)
-        print(f"[CLM] Traceback: {traceback.format_exc()}", file=sys.stderr)
-        return "Sorry, I couldn't process that request. Try asking about membership marketing!"
+            answer = str(result.output)
+        elif hasattr(result, 'data') and result.data:
+            answer = str(result.data)
+        else:
+            answer = str(result)
+        if replayable(result.new_messages()):
+            answer_cache.set(cache_key, answer)
+        return answer
+    except Exception:
+        log.exception("agent run failed", extra={"session_id": session_id})
+        return CLM_FALLBACK_RESPONSE
+
+
+async def stream_agent_for_clm(
+    user_message: str,
+    deps: SessionDeps,
+    cache_key: Optional[str] = None,
+    message_history: Optional[List[ModelMessage]] = None
+) -> AsyncIterator[str]:
+    """Run the Pydantic AI agent and yield text deltas as the model produces them."""
+    session_id = deps.session_id
+    emitted = []
+    result = None
+    try:
+        log.info("streamed agent run started", extra={"session_id": session_id, "query_chars": len(user_message)})
+        with span("agent_run"):
+            try:
+                async for event in streaming_agent.run_stream_events(user_message, deps=deps, message_history=message_history):
+                    text = None
+                    if isinstance(event, PartStartEvent) and isinstance(event.part, TextPart):
+                        text = event.part.content
+                        # Separate text from an earlier response (e.g. before a tool call)
+                        if text and emitted and not text[0].isspace():
+                            text = " " + text
+                    elif isinstance(event, PartDeltaEvent) and isinstance(event.delta, TextPartDelta):
+                        text = event.delta.content_delta
+                    elif isinstance(event, AgentRunResultEvent):
+                        result = event.result
+                        log.info("streamed agent run finished", extra={"session_id": session_id, **usage_fields(event.result.usage())})
+
+                    if text:
+                        emitted.append(text)
+                        yield text
+            finally:
+                thread_states.save(clm_key(deps.session_id), deps.state)
+    except Exception:
+        log.exception("streamed agent run failed", extra={"session_id": session_id, "emitted_parts": len(emitted)})
+        yield (" " if emitted else "") + CLM_FALLBACK_RESPONSE
+        return
+
+    if not emitted:
+        yield CLM_FALLBACK_RESPONSE
+        return
+    if result is not None and replayable(result.new_messages()):
+        answer_cache.set(cache_key, "".join(emitted))
+
+
+async def answer_once(run, *args) -> AsyncIterator[str]:
+    """A non-streamed run's answer as a one-chunk stream, so it can be shared like a streamed one."""
+    yield await run(*args)
+
+
+async def single_chunk(text: str) -> AsyncIterator[str]:
+    yield text
+
+
+def chat_completion(text: str) -> dict:
+    """A non-streamed OpenAI chat completion carrying text."""
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex[:8]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": "membership-marketing-agent",
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": text},
+            "finish_reason": "stop"
+        }]
+    }
+
+
+# Duplicate CLM turns (Hume retries, the Next.js proxy) share a run; fallback answers aren't replayed
+clm_flights = SingleFlight(retain=lambda text: not text.endswith(CLM_FALLBACK_RESPONSE), endpoint="clm")
 
 
 @main_app.post("/chat/completions")
-async def clm_endpoint(request: ChatCompletionRequest):
+async def clm_endpoint(request: ChatCompletionRequest, http_request: Request, custom_session_id: Optional[str] = None):
     """OpenAI-compatible endpoint for Hume CLM."""
+    started = time.perf_counter()
+    session_id = custom_session_id or request.custom_session_id or request.session_id
+
     # Extract system prompt (contains user context from Hume)
     system_prompt = None
     for msg in request.messages:
         if msg.role == "system":
             system_prompt = msg.content
-            print(f"[CLM] Found system prompt: {system_prompt[:100]}...", file=sys.stderr)
+            log.debug("system prompt found", extra={"prompt_chars": len(system_prompt)})
             break
 
-    # Get user message (last non-system message)
+    # Get user message (last user message); earlier turns become message history
     user_message = ""
-    for msg in reversed(request.messages):
-        if msg.role == "user":
-            user_message = msg.content
+    user_index = 0
+    for i in range(len(request.messages) - 1, -1, -1):
+        if request.messages[i].role == "user":
+            user_message = request.messages[i].content
+            user_index = i
             break
-    print(f"[CLM] Query: {user_message[:80]}", file=sys.stderr)
+    # Message text can carry personal details, so it is only logged at debug level
+    log.debug("query", extra={"session_id": session_id, "query": user_message[:80], "history_messages": len(request.messages) - 1})
+    transcript = [
+        (msg.role, msg.content)
+        for msg in request.messages[:user_index]
+        if msg.role in HISTORY_ROLES and msg.content
+    ]
 
-    # Run agent with system prompt for user context
-    response_text = await run_agent_for_clm(user_message, system_prompt)
-    print(f"[CLM] Response: {response_text[:80]}", file=sys.stderr)
+    # Cached and deterministic answers are given before joining a run or queueing for a slot
+    try:
+        with span("extract"):
+            deps = build_clm_deps(system_prompt, session_id)
+            await restore_session_state(deps)
+        cache_key = clm_answer_cache_key(deps, user_message, system_prompt, bool(transcript))
+        quick_answer = clm_quick_answer(deps, user_message, cache_key)
+    except Exception:
+        log.exception("session restore failed", extra={"session_id": session_id})
+        quick_answer = CLM_FALLBACK_RESPONSE
+    if quick_answer is not None:
+        if request.stream:
+            return StreamingResponse(
+                observe_first_chunk(encode_sse_stream(single_chunk(quick_answer), f"chatcmpl-{uuid.uuid4().hex[:8]}"), started),
+                media_type="text/event-stream"
+            )
+        return chat_completion(quick_answer)
+
+    # Retried or re-proxied copies of a turn share one run instead of starting their own
+    flight_key = clm_flights.key(
+        session_id, request.stream, messages=[(msg.role, msg.content) for msg in request.messages]
+    ) if session_id else None
+    flight, leader = clm_flights.join(flight_key)
+
+    if leader:
+        # Long-term memory is fetched while the history is built and the run queues for a slot
+        user_id = deps.user_context.get("user_id")
+        user_memory.prefetch(user_id)
+
+        with span("history"):
+            message_history = build_message_history(transcript, session_id)
+
+        if request.stream:
+            # Stream model deltas straight through so voice playback starts on the first token
+            output = stream_agent_for_clm(user_message, deps, cache_key, message_history)
+        else:
+            output = answer_once(run_agent_for_clm, user_message, deps, cache_key, message_history)
+
+        # Runs are admitted per user (falling back to the session) so one caller can't crowd out the rest;
+        # the slot is held for the run itself, however many requests are reading it
+        flight.start(output, acquire=lambda: admission.acquire(user_id or session_id))
+    else:
+        log.info("joined duplicate turn", extra={"session_id": session_id, "finished": flight.done})
+
+    try:
+        await unless_disconnected(http_request, flight.wait_started(), "clm")
+    except Saturated as e:
+        return saturated_response(e)
+    except ClientDisconnected:
+        # Leaving cancels the run (queued or running) if no other request is waiting on it
+        flight.leave()
+        return Response(status_code=499)
 
     if request.stream:
         msg_id = f"chatcmpl-{uuid.uuid4().hex[:8]}"
-        return StreamingResponse(
-            stream_sse_response(response_text, msg_id),
+        # Leaves the flight when sending ends, even if the body was never iterated
+        return HeldSlotResponse(StreamingResponse(
+            observe_first_chunk(encode_sse_stream(flight.subscribe(), msg_id), started),
             media_type="text/event-stream"
-        )
-    else:
-        return {
-            "id": f"chatcmpl-{uuid.uuid4().hex[:8]}",
-            "object": "chat.completion",
-            "created": int(time.time()),
-            "model": "membership-marketing-agent",
-            "choices": [{
-                "index": 0,
-                "message": {"role": "assistant", "content": response_text},
-                "finish_reason": "stop"
-            }]
-        }
+        ), flight.attachment())
+
+    # Streamed responses are cancelled by Starlette on disconnect; this one has to watch for it
+    try:
+        response_text = await unless_disconnected(http_request, flight.read(), "clm")
+    except ClientDisconnected:
+        return Response(status_code=499)
+    log.debug("response", extra={"session_id": session_id, "response": response_text[:80]})
+
+    return chat_completion(response_text)
 
 
 # Mount AG-UI app for CopilotKit
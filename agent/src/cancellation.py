@@ -0,0 +1,87 @@
+"""
+Client disconnects
+Stops agent runs nobody is waiting for any more: streamed runs that cancel with their consumer, and
+disconnect detection for responses that aren't streamed
+"""
+from typing import Any, AsyncIterator, Awaitable, TypeVar
+import asyncio
+
+from pydantic_ai import AgentRunResultEvent
+from pydantic_ai.agent import WrapperAgent
+from starlette.requests import Request
+
+from .metrics import Counter, registry
+
+client_disconnects = registry.register(Counter(
+    "agent_client_disconnects_total", "Clients that disconnected before their response finished.", ("endpoint",)))
+
+T = TypeVar("T")
+
+_RUN_FINISHED = object()
+
+
+class ClientDisconnected(Exception):
+    """The client went away while its response was being prepared."""
+
+
+def _consume_result(task: asyncio.Task) -> None:
+    if not task.cancelled():
+        task.exception()
+
+
+class CancellableAgent(WrapperAgent):
+    """An agent whose streamed runs stop when their event stream is abandoned.
+
+    Agent.run_stream_events runs the agent in a task of its own that keeps
+    going (model requests, tool calls) after the consumer stops reading, until
+    it next tries to hand over an event. Here closing or cancelling the
+    stream - e.g. Starlette cancelling a StreamingResponse when the client
+    disconnects - cancels that task, and with it the in-flight model request.
+    """
+
+    async def run_stream_events(self, user_prompt: Any = None, **kwargs) -> AsyncIterator[Any]:
+        kwargs.pop("infer_name", None)
+        events: asyncio.Queue = asyncio.Queue()
+
+        async def forward(_, stream) -> None:
+            async for event in stream:
+                events.put_nowait(event)
+
+        async def run():
+            try:
+                return await self.wrapped.run(user_prompt, event_stream_handler=forward, infer_name=False, **kwargs)
+            finally:
+                events.put_nowait(_RUN_FINISHED)
+
+        task = asyncio.create_task(run())
+        try:
+            while (event := await events.get()) is not _RUN_FINISHED:
+                yield event
+            yield AgentRunResultEvent(await task)
+        finally:
+            if not task.done():
+                task.cancel()
+                task.add_done_callback(_consume_result)
+
+
+async def until_disconnected(request: Request) -> None:
+    """Return once the client disconnects (the request body must already have been read)."""
+    while (await request.receive())["type"] != "http.disconnect":
+        pass
+
+
+async def unless_disconnected(request: Request, awaitable: Awaitable[T], endpoint: str) -> T:
+    """Await something, cancelling it and raising ClientDisconnected if the client leaves first."""
+    task = asyncio.ensure_future(awaitable)
+    watcher = asyncio.create_task(until_disconnected(request))
+    try:
+        done, _ = await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        watcher.cancel()
+        if not task.done():
+            task.cancel()
+            task.add_done_callback(_consume_result)
+    if task in done:
+        return task.result()
+    client_disconnects.inc(endpoint=endpoint)
+    raise ClientDisconnected()
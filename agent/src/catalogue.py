@@ -0,0 +1,145 @@
+"""
+Membership marketing catalogue
+Services, case studies, organisation types and challenges loaded from catalogue.json,
+with lookup indexes built once at load time so tool calls never scan the full catalogue
+"""
+from pathlib import Path
+from typing import Iterable, List, Optional
+import json
+import os
+import re
+
+from .symptom_matcher import SymptomMatcher
+
+DEFAULT_CATALOGUE_PATH = Path(__file__).with_name("catalogue.json")
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def normalise(text: str) -> str:
+    """Lowercase and collapse whitespace for index keys."""
+    return " ".join(text.lower().split())
+
+
+def tokenise(text: str) -> List[str]:
+    """Lowercase word tokens."""
+    return _TOKEN.findall(text.lower())
+
+
+def organisation_type_key(organisation_type: str) -> str:
+    """"Professional Body" / "professional body" -> "professional_body"."""
+    return "_".join(organisation_type.lower().replace("_", " ").split())
+
+
+class Catalogue:
+    """Read-only catalogue with precomputed indexes.
+
+    Lookups keep the original substring semantics (a query matches a name it is
+    a substring of) but resolve through token indexes, so cost grows with the
+    number of matches rather than the size of the catalogue.
+    """
+
+    def __init__(self, data: dict):
+        self.services: List[dict] = data["services"]
+        self.case_studies: List[dict] = data["case_studies"]
+        self.organisation_types: dict = data["organisation_types"]
+        self.challenges: dict = data["challenges"]
+
+        # Service name -> record, and name token -> service positions
+        self._service_names = [normalise(s["name"]) for s in self.services]
+        self._service_by_name = {}
+        self._service_tokens: dict[str, List[int]] = {}
+        for i, name in enumerate(self._service_names):
+            self._service_by_name.setdefault(name, self.services[i])
+            for token in set(tokenise(name)):
+                self._service_tokens.setdefault(token, []).append(i)
+
+        # Facet indexes: service used / organisation type -> case study positions.
+        # Primary-service positions (services_used[0]) rank ahead of supporting ones.
+        self._cases_by_service: dict[str, List[int]] = {}
+        self._primary_cases_by_service: dict[str, set] = {}
+        self._cases_by_org: dict[str, List[int]] = {}
+        for i, case in enumerate(self.case_studies):
+            for rank, service in enumerate(case.get("services_used", [])):
+                self._cases_by_service.setdefault(normalise(service), []).append(i)
+                if rank == 0:
+                    self._primary_cases_by_service.setdefault(normalise(service), set()).add(i)
+            org_type = case.get("organisation_type")
+            if org_type:
+                self._cases_by_org.setdefault(organisation_type_key(org_type), []).append(i)
+
+        # Trigram TF-IDF index over challenge names, symptoms and related phrases
+        self.symptom_matcher = SymptomMatcher(self.challenges)
+
+    @classmethod
+    def load(cls, path: Optional[str] = None) -> "Catalogue":
+        """Load the catalogue from CATALOGUE_PATH or the bundled catalogue.json."""
+        path = path or os.getenv("CATALOGUE_PATH") or DEFAULT_CATALOGUE_PATH
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def _service_positions(self, query: str) -> List[int]:
+        """Positions of services whose name contains the query, in catalogue order."""
+        query = normalise(query)
+        tokens = tokenise(query)
+        candidates = self._service_tokens.get(tokens[0], []) if tokens else []
+        matches = [i for i in candidates if query in self._service_names[i]]
+        if matches or not tokens:
+            return matches
+        # Partial-word query (e.g. "retent") - only the short name list is scanned
+        return [i for i, name in enumerate(self._service_names) if query in name]
+
+    def find_service(self, query: str) -> Optional[dict]:
+        """The first service whose name contains the query."""
+        exact = self._service_by_name.get(normalise(query))
+        if exact is not None:
+            return exact
+        positions = self._service_positions(query)
+        return self.services[positions[0]] if positions else None
+
+    def services_named(self, names: Iterable[str]) -> List[dict]:
+        """Services with exactly these names, in catalogue order."""
+        wanted = {normalise(n) for n in names}
+        return [s for s, name in zip(self.services, self._service_names) if name in wanted]
+
+    def case_study_positions(self, service: Optional[str] = None, organisation_type: Optional[str] = None) -> List[int]:
+        """Positions of case studies matching every given filter, best first.
+
+        Cases where the service was the primary one used rank ahead of cases
+        where it played a supporting role; ties keep catalogue order.
+        """
+        positions: Optional[set] = None
+        primary: set = set()
+        if service:
+            # Substring match over the distinct service names used, not over every case
+            query = normalise(service)
+            names = [name for name in self._cases_by_service if query in name]
+            positions = {i for name in names for i in self._cases_by_service[name]}
+            primary = {i for name in names for i in self._primary_cases_by_service.get(name, ())}
+        if organisation_type:
+            matched = set(self._cases_by_org.get(organisation_type_key(organisation_type), []))
+            positions = matched if positions is None else positions & matched
+        if positions is None:
+            return list(range(len(self.case_studies)))
+        return sorted(positions, key=lambda i: (i not in primary, i))
+
+    def find_case_studies(
+        self,
+        service: Optional[str] = None,
+        organisation_type: Optional[str] = None,
+        limit: Optional[int] = None
+    ) -> tuple[List[dict], int]:
+        """Matching case studies (at most `limit`, best first) and the total number of matches."""
+        positions = self.case_study_positions(service, organisation_type)
+        selected = positions if limit is None else positions[:max(limit, 0)]
+        return [self.case_studies[i] for i in selected], len(positions)
+
+    def find_organisation_type(self, organisation_type: str) -> Optional[dict]:
+        return self.organisation_types.get(organisation_type_key(organisation_type))
+
+    def rank_challenges(self, symptoms: Iterable[str], threshold: Optional[float] = None) -> List[tuple[str, float]]:
+        """(challenge key, score) for challenges matching the described symptoms, best first."""
+        return self.symptom_matcher.rank(symptoms, threshold)
+
+
+catalogue = Catalogue.load()
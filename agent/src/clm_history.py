@@ -0,0 +1,103 @@
+"""
+Conversation history for the Hume CLM endpoint
+Converts the OpenAI-style transcript into Pydantic AI message history within a bounded window,
+reusing messages already converted for the same session on earlier turns
+"""
+from dataclasses import dataclass
+from typing import List, Optional, Sequence
+import os
+
+from pydantic_ai.messages import ModelMessage, ModelRequest, ModelResponse, TextPart, UserPromptPart
+
+from .session_store import SessionStore
+
+# Window kept from the transcript (override via env)
+HISTORY_MAX_MESSAGES = int(os.getenv("CLM_HISTORY_MAX_MESSAGES", "24"))
+HISTORY_MAX_TOKENS = int(os.getenv("CLM_HISTORY_MAX_TOKENS", "3000"))
+
+# Rough tokens-per-character ratio for English; good enough for a budget, not billing
+CHARS_PER_TOKEN = 4
+
+HISTORY_ROLES = ("user", "assistant")
+
+
+@dataclass
+class _ConvertedWindow:
+    """Messages converted for a session's last turn, anchored at their transcript position."""
+    start: int
+    keys: List[tuple[str, str]]
+    messages: List[ModelMessage]
+
+
+# Sized like the user context store: one entry per live conversation
+_converted_history = SessionStore(
+    max_entries=int(os.getenv("USER_CONTEXT_MAX_SESSIONS", "10000")),
+    ttl_seconds=float(os.getenv("USER_CONTEXT_TTL_SECONDS", "3600")),
+)
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate used for the history budget."""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def to_model_message(role: str, content: str) -> ModelMessage:
+    """Convert one transcript message into a Pydantic AI message."""
+    if role == "assistant":
+        return ModelResponse(parts=[TextPart(content=content)])
+    return ModelRequest(parts=[UserPromptPart(content=content)])
+
+
+def window_start(
+    transcript: Sequence[tuple[str, str]],
+    max_messages: int = HISTORY_MAX_MESSAGES,
+    max_tokens: int = HISTORY_MAX_TOKENS,
+) -> int:
+    """Index of the oldest transcript message that fits the message and token budget."""
+    start = len(transcript)
+    budget = max_tokens
+    while start > 0 and len(transcript) - start < max_messages:
+        cost = estimate_tokens(transcript[start - 1][1])
+        if cost > budget:
+            break
+        budget -= cost
+        start -= 1
+
+    # History should open with a user turn, as a real conversation would
+    while start < len(transcript) and transcript[start][0] != "user":
+        start += 1
+    return start
+
+
+def build_message_history(
+    transcript: Sequence[tuple[str, str]],
+    session_id: Optional[str] = None,
+    max_messages: int = HISTORY_MAX_MESSAGES,
+    max_tokens: int = HISTORY_MAX_TOKENS,
+) -> List[ModelMessage]:
+    """Convert prior (role, content) turns into bounded Pydantic AI message history.
+
+    Hume resends the whole transcript each turn, so messages converted for the
+    session last time are reused as long as they still match at the same
+    transcript position; only new (or edited) messages are converted.
+    """
+    start = window_start(transcript, max_messages, max_tokens)
+    keys = list(transcript[start:])
+
+    messages: List[ModelMessage] = []
+    cached: Optional[_ConvertedWindow] = _converted_history.get(session_id)
+    if cached is not None and cached.start <= start < cached.start + len(cached.keys):
+        offset = start - cached.start
+        reused = 0
+        for key in cached.keys[offset:]:
+            if reused >= len(keys) or key != keys[reused]:
+                break
+            reused += 1
+        messages = cached.messages[offset:offset + reused]
+
+    for role, content in keys[len(messages):]:
+        messages.append(to_model_message(role, content))
+
+    if session_id:
+        _converted_history.set(session_id, _ConvertedWindow(start=start, keys=keys, messages=messages))
+    return list(messages)
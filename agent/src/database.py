@@ -0,0 +1,82 @@
+"""
+Database access for the agent
+A small pooled DB-API wrapper over Postgres (DATABASE_URL, psycopg2) or SQLite (sqlite:///path)
+for local runs and tests
+"""
+from contextlib import contextmanager
+from typing import Iterator, Optional
+import os
+import sqlite3
+import threading
+
+DB_POOL_SIZE = int(os.getenv("DATABASE_POOL_SIZE", "4"))
+DB_CONNECT_TIMEOUT_SECONDS = int(os.getenv("DATABASE_CONNECT_TIMEOUT_SECONDS", "5"))
+
+
+class Database:
+    """Connections from a bounded pool, committed or rolled back per use.
+
+    Postgres connections come from a psycopg2 ThreadedConnectionPool (imported
+    only when a Postgres URL is used). SQLite shares one connection behind a
+    lock, which also makes sqlite:///:memory: usable across threads.
+    Blocking calls: use from worker threads, never directly on the event loop.
+    """
+
+    def __init__(self, url: str, pool_size: int = DB_POOL_SIZE):
+        self.url = url
+        self.pool_size = pool_size
+        self.dialect = "sqlite" if url.startswith("sqlite:") else "postgres"
+        self._pool = None
+        self._sqlite: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    @property
+    def placeholder(self) -> str:
+        return "?" if self.dialect == "sqlite" else "%s"
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                from psycopg2.pool import ThreadedConnectionPool
+                self._pool = ThreadedConnectionPool(1, self.pool_size, dsn=self.url, connect_timeout=DB_CONNECT_TIMEOUT_SECONDS)
+            return self._pool
+
+    @contextmanager
+    def connection(self) -> Iterator:
+        if self.dialect == "sqlite":
+            with self._lock:
+                if self._sqlite is None:
+                    path = self.url.split(":///", 1)[1] if ":///" in self.url else ":memory:"
+                    self._sqlite = sqlite3.connect(path or ":memory:", check_same_thread=False)
+                try:
+                    yield self._sqlite
+                    self._sqlite.commit()
+                except BaseException:
+                    self._sqlite.rollback()
+                    raise
+            return
+
+        pool = self._get_pool()
+        conn = pool.getconn()
+        broken = False
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            try:
+                conn.rollback()
+            except Exception:
+                broken = True
+            raise
+        finally:
+            # A connection that can't even roll back is discarded rather than reused
+            pool.putconn(conn, close=broken or bool(conn.closed))
+
+    def close(self) -> None:
+        with self._lock:
+            if self._pool is not None:
+                self._pool.closeall()
+                self._pool = None
+            if self._sqlite is not None:
+                self._sqlite.close()
+                self._sqlite = None
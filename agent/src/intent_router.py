@@ -0,0 +1,119 @@
+"""
+Fast-path intent routing
+Recognises a few deterministic requests (profile, booking link, services, prices) from compiled
+patterns so they can be answered from data without a model round-trip
+"""
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Pattern
+import os
+import re
+import time
+
+from .logs import get_logger
+from .metrics import Counter, Histogram, registry
+
+FAST_PATH_ENABLED = os.getenv("FAST_PATH_ENABLED", "true").lower() not in ("0", "false", "no")
+# Longer messages are never routed: they almost always carry more than one request
+FAST_PATH_MAX_CHARS = int(os.getenv("FAST_PATH_MAX_CHARS", "120"))
+
+log = get_logger("router")
+
+fast_path_requests = registry.register(Counter(
+    "agent_fast_path_requests_total", "Messages checked by the fast-path router, by endpoint and result.",
+    ("endpoint", "result")))
+fast_path_answers = registry.register(Counter(
+    "agent_fast_path_answers_total", "Messages answered without the model, by intent.", ("intent",)))
+fast_path_duration = registry.register(Histogram(
+    "agent_fast_path_duration_seconds", "Time to route and answer a fast-path message.", ("intent",)))
+fast_path_saved = registry.register(Counter(
+    "agent_fast_path_seconds_saved_total", "Estimated agent run time avoided by fast-path answers."))
+
+# Politeness around a request that doesn't change what is being asked
+_PREFIX = r"(?:(?:hi|hey|hello|ok(?:ay)?|so|um+|er+|please)[,!.]?\s+)*(?:(?:can|could|would) you\s+(?:please\s+)?(?:tell me|remind me)\s+)?"
+_SUFFIX = r"(?:\s+please)?\s*[?.!]*"
+
+# Intent name -> utterance pattern (without the shared prefix/suffix). Named groups become slots.
+INTENT_PATTERNS: Dict[str, str] = {
+    "profile": (
+        r"(?:what(?:'s| is) my (?:name|email(?: address)?|profile|account details)|who am i"
+        r"|(?:show|tell) me my (?:profile|details|account))"
+    ),
+    "booking_link": (
+        r"(?:(?:i(?:'d| would) like|i want|can i|how (?:do|can) i|let'?s)\s+(?:to\s+)?"
+        r"(?:book|schedule|arrange) (?:a |an )?(?:free )?(?:call|consultation|meeting|chat)"
+        r"|(?:what(?:'s| is)|send me|give me|share) (?:the |your )?(?:booking|calendar|calendly|consultation) link)"
+    ),
+    "list_services": (
+        r"(?:what (?:services|kind of services|do you) (?:do you )?(?:offer|provide|have|do)"
+        r"|(?:list|show me|tell me about) (?:all )?(?:of )?(?:your )?services)"
+    ),
+    "service_price": (
+        r"(?:how much (?:does|is|do|would) (?:the |your )?(?P<service>[a-z][a-z ]*?)(?: service)? cost"
+        r"|what(?:'s| is| are) the (?:price|cost|fees?|investment) (?:of|for) (?:the |your )?(?P<service2>[a-z][a-z ]*?)(?: service)?)"
+    ),
+}
+
+
+@dataclass
+class IntentMatch:
+    intent: str
+    slots: Dict[str, str] = field(default_factory=dict)
+
+
+class IntentRouter:
+    """Matches a whole user message against one compiled pattern per intent.
+
+    Patterns must match the entire (normalised) message, so anything with
+    extra content - a time for the booking, a question about the service -
+    falls through to the agent. Answerers may still decline (return None),
+    e.g. a price question for a service the catalogue doesn't have.
+    """
+
+    def __init__(self, patterns: Dict[str, str] = INTENT_PATTERNS, max_chars: int = FAST_PATH_MAX_CHARS):
+        self.max_chars = max_chars
+        self._patterns: List[tuple[str, Pattern]] = [
+            (intent, re.compile(_PREFIX + pattern + _SUFFIX, re.IGNORECASE)) for intent, pattern in patterns.items()
+        ]
+
+    def match(self, message: Optional[str]) -> Optional[IntentMatch]:
+        if not message or len(message) > self.max_chars:
+            return None
+        text = " ".join(message.replace("’", "'").split())
+        for intent, pattern in self._patterns:
+            found = pattern.fullmatch(text)
+            if found:
+                slots = {name.rstrip("0123456789"): value for name, value in found.groupdict().items() if value}
+                return IntentMatch(intent, slots)
+        return None
+
+    def answer(
+        self,
+        endpoint: str,
+        message: Optional[str],
+        answerers: Dict[str, Callable[[IntentMatch], Optional[str]]],
+        expected_run_seconds: float = 0.0,
+    ) -> Optional[str]:
+        """The fast-path answer for a message, or None to run the agent."""
+        if not FAST_PATH_ENABLED:
+            return None
+        start = time.perf_counter()
+        match = self.match(message)
+        answer = None
+        if match is not None and match.intent in answerers:
+            try:
+                answer = answerers[match.intent](match)
+            except Exception:
+                log.exception("fast-path answer failed", extra={"intent": match.intent})
+        if answer is None:
+            fast_path_requests.inc(endpoint=endpoint, result="miss")
+            return None
+        elapsed = time.perf_counter() - start
+        fast_path_requests.inc(endpoint=endpoint, result="hit")
+        fast_path_answers.inc(intent=match.intent)
+        fast_path_duration.observe(elapsed, intent=match.intent)
+        fast_path_saved.inc(max(0.0, expected_run_seconds - elapsed))
+        log.info("fast-path answer", extra={"endpoint": endpoint, "intent": match.intent, "ms": round(elapsed * 1000, 2)})
+        return answer
+
+
+intent_router = IntentRouter()
@@ -0,0 +1,233 @@
+"""
+Lead persistence
+Bookings and qualification snapshots queued from the request path and written to the database in
+batches by a background thread
+"""
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import List, Optional
+import json
+import os
+import queue
+import threading
+import time
+
+from .database import Database
+from .logs import get_logger
+from .metrics import Counter, Gauge, Histogram, registry
+
+LEAD_BATCH_SIZE = int(os.getenv("LEAD_BATCH_SIZE", "50"))
+LEAD_FLUSH_INTERVAL_SECONDS = float(os.getenv("LEAD_FLUSH_INTERVAL_SECONDS", "1"))
+LEAD_QUEUE_SIZE = int(os.getenv("LEAD_QUEUE_SIZE", "10000"))
+# Flushes a failed batch gets (e.g. across a database restart) before it is dropped
+LEAD_MAX_FLUSH_ATTEMPTS = int(os.getenv("LEAD_MAX_FLUSH_ATTEMPTS", "5"))
+
+LEADS_TABLE = "agent_leads"
+
+SCHEMA = {
+    "postgres": f"""
+        CREATE TABLE IF NOT EXISTS {LEADS_TABLE} (
+            id BIGSERIAL PRIMARY KEY,
+            kind TEXT NOT NULL,
+            session_id TEXT,
+            user_id TEXT,
+            email TEXT,
+            payload JSONB NOT NULL,
+            created_at TIMESTAMPTZ NOT NULL
+        )
+    """,
+    "sqlite": f"""
+        CREATE TABLE IF NOT EXISTS {LEADS_TABLE} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            session_id TEXT,
+            user_id TEXT,
+            email TEXT,
+            payload TEXT NOT NULL,
+            created_at TEXT NOT NULL
+        )
+    """,
+}
+
+log = get_logger("leads")
+
+leads_written = registry.register(Counter(
+    "agent_leads_written_total", "Lead records written to the database.", ("kind",)))
+leads_dropped = registry.register(Counter(
+    "agent_leads_dropped_total", "Lead records dropped, by reason.", ("reason",)))
+lead_queue_depth = registry.register(Gauge(
+    "agent_lead_queue_depth", "Lead records waiting to be written."))
+lead_flush_duration = registry.register(Histogram(
+    "agent_lead_flush_seconds", "Duration of each batched lead write."))
+
+
+@dataclass
+class LeadEvent:
+    kind: str  # "booking" or "qualification"
+    session_id: Optional[str]
+    user_id: Optional[str]
+    email: Optional[str]
+    payload: dict
+    created_at: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+
+
+_STOP = object()
+
+
+class _FlushRequest:
+    def __init__(self):
+        self.done = threading.Event()
+
+
+class LeadWriter:
+    """Background batched writer for lead events.
+
+    record() only enqueues, so it costs no database round-trip on the
+    request path and is safe from the event loop and tool threads. A writer
+    thread inserts queued events in one transaction per batch, flushing when
+    the batch reaches batch_size, every flush_interval seconds, and on stop().
+    With no database configured, record() is a no-op.
+    """
+
+    def __init__(
+        self,
+        database: Optional[Database],
+        batch_size: int = LEAD_BATCH_SIZE,
+        flush_interval: float = LEAD_FLUSH_INTERVAL_SECONDS,
+        queue_size: int = LEAD_QUEUE_SIZE,
+    ):
+        self.database = database
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._schema_ready = False
+        registry.add_collector(lambda: lead_queue_depth.set(self._queue.qsize()))
+
+    @property
+    def enabled(self) -> bool:
+        return self.database is not None
+
+    def start(self) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="lead-writer", daemon=True)
+                self._thread.start()
+
+    def record(
+        self,
+        kind: str,
+        payload: dict,
+        session_id: Optional[str] = None,
+        user_id: Optional[str] = None,
+        email: Optional[str] = None,
+    ) -> bool:
+        """Queue a lead event; False if it was dropped (no database, or the queue is full)."""
+        if not self.enabled:
+            return False
+        if self._thread is None:
+            self.start()
+        try:
+            self._queue.put_nowait(LeadEvent(kind, session_id, user_id, email, payload))
+        except queue.Full:
+            leads_dropped.inc(reason="queue_full")
+            return False
+        return True
+
+    def flush(self, timeout: float = 10) -> bool:
+        """Write everything queued so far, waiting up to timeout seconds.
+
+        True once the writer has attempted the write: the batch was written,
+        or the write failed and the batch is either kept for the next flush or
+        (after LEAD_MAX_FLUSH_ATTEMPTS) dropped - leads_dropped counts those.
+        False if the queue stayed full or the attempt didn't finish in time.
+        """
+        if not self.enabled or self._thread is None:
+            return True
+        request = _FlushRequest()
+        try:
+            self._queue.put(request, timeout=timeout)
+        except queue.Full:
+            return False
+        return request.done.wait(timeout)
+
+    def stop(self, timeout: float = 10) -> None:
+        """Flush what is queued and stop the writer thread."""
+        if self._thread is None:
+            return
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            log.error("lead queue full at shutdown, queued leads lost", extra={"queued": self._queue.qsize()})
+            return
+        self._thread.join(timeout)
+        self._thread = None
+        self.database.close()
+
+    def _run(self) -> None:
+        batch: List[LeadEvent] = []
+        attempts = 0
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            item = None
+            try:
+                item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                pass
+
+            if isinstance(item, LeadEvent):
+                batch.append(item)
+                if len(batch) < self.batch_size:
+                    continue
+            elif item is None and time.monotonic() < deadline:
+                continue
+
+            # Batch full, interval elapsed, or an explicit flush / stop
+            if batch:
+                if self._write(batch):
+                    batch, attempts = [], 0
+                else:
+                    attempts += 1
+                    if attempts >= LEAD_MAX_FLUSH_ATTEMPTS or item is _STOP:
+                        log.error("dropping unwritable lead batch", extra={"records": len(batch), "attempts": attempts})
+                        leads_dropped.inc(len(batch), reason="write_failed")
+                        batch, attempts = [], 0
+            deadline = time.monotonic() + self.flush_interval
+
+            if isinstance(item, _FlushRequest):
+                item.done.set()
+            elif item is _STOP:
+                return
+
+    def _write(self, batch: List[LeadEvent]) -> bool:
+        start = time.perf_counter()
+        insert = f"INSERT INTO {LEADS_TABLE} (kind, session_id, user_id, email, payload, created_at) VALUES "
+        rows = [
+            (e.kind, e.session_id, e.user_id, e.email, json.dumps(e.payload, default=str), e.created_at.isoformat())
+            for e in batch
+        ]
+        try:
+            with self.database.connection() as conn:
+                cursor = conn.cursor()
+                if not self._schema_ready:
+                    cursor.execute(SCHEMA[self.database.dialect])
+                    self._schema_ready = True
+                if self.database.dialect == "postgres":
+                    # One multi-row INSERT; psycopg2's executemany is a round-trip per row
+                    from psycopg2.extras import execute_values
+                    execute_values(cursor, insert + "%s", rows, page_size=len(rows))
+                else:
+                    cursor.executemany(insert + "(?, ?, ?, ?, ?, ?)", rows)
+                cursor.close()
+        except Exception:
+            self._schema_ready = False
+            log.exception("lead batch write failed", extra={"records": len(batch)})
+            return False
+        finally:
+            lead_flush_duration.observe(time.perf_counter() - start)
+        for event in batch:
+            leads_written.inc(kind=event.kind)
+        return True
@@ -0,0 +1,191 @@
+"""
+Structured logging for the agent
+JSON log lines written by a background thread, tagged with a per-request correlation id and
+with user PII redacted
+"""
+from contextvars import ContextVar
+from typing import Any, Optional
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import re
+import sys
+import time
+import uuid
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# "json" for log shippers, "text" for reading locally
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+# Records dropped rather than blocking the event loop when the writer falls behind
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+REQUEST_ID_HEADER = "x-request-id"
+
+# Field names whose values identify a person
+REDACTED_FIELDS = frozenset({"name", "first_name", "firstname", "user_name", "email"})
+REDACTED = "[redacted]"
+_EMAIL = re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+")
+# A quoted value assigned to a PII field in reprs and tracebacks: 'name': 'Dan', name="Dan", "firstName": "Dan"
+_PII_ASSIGNMENT = re.compile(
+    r"""(\b(?:%s)['"]?\s*[:=]\s*)(['"])(?:(?!\2).)+\2""" % "|".join(sorted(REDACTED_FIELDS)), re.IGNORECASE
+)
+
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+_STANDARD_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "request_id"}
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def redact(value: Any, key: Optional[str] = None) -> Any:
+    """Mask values under PII field names (at any depth), and in free text email addresses and quoted PII fields."""
+    if key is not None and key.lower() in REDACTED_FIELDS and value:
+        return REDACTED
+    if isinstance(value, dict):
+        return {k: redact(v, str(k)) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [redact(v) for v in value]
+    if isinstance(value, str):
+        return _PII_ASSIGNMENT.sub(rf"\1\2{REDACTED}\2", _EMAIL.sub(REDACTED, value))
+    return value
+
+
+class RequestIdFilter(logging.Filter):
+    """Stamp records with the current request's correlation id (read in the logging thread of origin)."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+
+class _NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """Hands records to the writer thread without formatting them on the request path."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        # Bind the arguments now; they may be mutated after the call returns
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message, request id and redacted extra fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": redact(record.getMessage()),
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRS:
+                entry[key] = redact(value, key)
+        if record.exc_info:
+            # Tracebacks echo values too (e.g. a pydantic error's input), so they are redacted like the rest
+            entry["exception"] = redact(self.formatException(record.exc_info))
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    """Readable single-line records with the same redaction as the JSON format."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        extra = {k: redact(v, k) for k, v in vars(record).items() if k not in _STANDARD_ATTRS}
+        line = f"[{record.levelname}] {record.name} {redact(record.getMessage())}"
+        if getattr(record, "request_id", None):
+            line += f" request_id={record.request_id}"
+        if extra:
+            line += " " + " ".join(f"{k}={v}" for k, v in extra.items())
+        if record.exc_info:
+            line += "\n" + redact(self.formatException(record.exc_info))
+        return line
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def configure_logging(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT) -> None:
+    """Route the "agent" loggers through a queue to a stderr writer thread (idempotent)."""
+    global _listener
+    if _listener is not None:
+        return
+
+    writer = logging.StreamHandler(sys.stderr)
+    writer.setFormatter(TextFormatter() if fmt == "text" else JsonFormatter())
+
+    handler = _NonBlockingQueueHandler(queue.Queue(maxsize=LOG_QUEUE_SIZE))
+    handler.addFilter(RequestIdFilter())
+
+    root = logging.getLogger("agent")
+    root.setLevel(level)
+    root.addHandler(handler)
+    root.propagate = False
+
+    _listener = logging.handlers.QueueListener(handler.queue, writer, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging() -> None:
+    """Flush queued records and stop the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def get_logger(name: str) -> logging.Logger:
+    """A logger under the "agent" hierarchy, e.g. get_logger("clm") -> "agent.clm"."""
+    configure_logging()
+    return logging.getLogger(f"agent.{name}")
+
+
+class RequestIdMiddleware:
+    """ASGI middleware giving every request a correlation id.
+
+    Reuses an incoming X-Request-ID (so ids follow a request across the
+    Next.js proxy) and echoes it on the response. Pure ASGI rather than
+    BaseHTTPMiddleware, so the id stays set while a streaming body is sent.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        request_id = None
+        for name, value in scope.get("headers", ()):
+            if name == REQUEST_ID_HEADER.encode():
+                request_id = value.decode("latin-1")[:64]
+                break
+        request_id = request_id or new_request_id()
+        token = request_id_var.set(request_id)
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                message["headers"] = [*message["headers"], (REQUEST_ID_HEADER.encode(), request_id.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            request_id_var.reset(token)
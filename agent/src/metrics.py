@@ -0,0 +1,296 @@
+"""
+Latency spans and Prometheus metrics
+In-process counters, gauges and histograms rendered in the Prometheus text format for /metrics
+"""
+from bisect import bisect_left
+from contextlib import asynccontextmanager, contextmanager
+from functools import wraps
+from typing import AsyncIterator, Callable, Dict, Iterable, List, Sequence
+import threading
+import time
+
+from pydantic_ai.models.wrapper import WrapperModel
+
+# Seconds; model round-trips and whole agent runs need the long tail
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelValues = tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> LabelValues:
+        return tuple(str(labels.get(n, "")) for n in self.label_names)
+
+    def samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        super().__init__(name, help_text, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set(self, value: float, **labels) -> None:
+        """Mirror a running total kept by another component (from a scrape-time collector)."""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_format_labels(self.label_names, key)} {value:g}"
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [count per bucket (+Inf last)], sum, count
+        self._series: Dict[LabelValues, list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, **labels) -> int:
+        series = self._series.get(self._key(labels))
+        return series[2] if series else 0
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            items = [(key, (list(s[0]), s[1], s[2])) for key, s in self._series.items()]
+        for key, (bucket_counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip((*self.buckets, float("inf")), bucket_counts):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                le_label = f'le="{le}"'
+                yield f"{self.name}_bucket{_format_labels(self.label_names, key, le_label)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.label_names, key)} {total:g}"
+            yield f"{self.name}_count{_format_labels(self.label_names, key)} {count}"
+
+
+class Registry:
+    """Metrics plus collectors that refresh gauges from other components at scrape time."""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Callable[[], None]] = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], None]) -> None:
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        for collector in self._collectors:
+            collector()
+        return "\n".join(m.render() for m in self._metrics) + "\n"
+
+
+registry = Registry()
+
+http_requests = registry.register(Counter(
+    "http_requests_total", "HTTP requests by route and status.", ("route", "method", "status")))
+http_request_duration = registry.register(Histogram(
+    "http_request_duration_seconds", "HTTP request duration, including streamed bodies.", ("route", "method")))
+http_in_flight = registry.register(Gauge(
+    "http_requests_in_flight", "HTTP requests currently being handled.", ("route",)))
+stage_duration = registry.register(Histogram(
+    "agent_stage_duration_seconds", "Duration of each request stage.", ("stage",)))
+tool_duration = registry.register(Histogram(
+    "agent_tool_duration_seconds", "Duration of each tool call.", ("tool",)))
+model_duration = registry.register(Histogram(
+    "agent_model_request_duration_seconds", "Duration of each model round-trip.", ("model", "mode")))
+model_tokens = registry.register(Counter(
+    "agent_model_tokens_total", "Tokens reported by the model.", ("model", "kind")))
+stream_first_chunk = registry.register(Histogram(
+    "clm_stream_first_chunk_seconds", "Time from request to the first SSE chunk."))
+errors = registry.register(Counter(
+    "agent_errors_total", "Errors by stage (a tool name for tool errors).", ("stage",)))
+runs_cancelled = registry.register(Counter(
+    "agent_runs_cancelled_total", "Agent runs stopped early because no client was waiting for them.", ("endpoint",)))
+cache_requests = registry.register(Counter(
+    "agent_cache_requests_total", "Cache lookups by cache and result.", ("cache", "result")))
+tool_result_tokens = registry.register(Counter(
+    "agent_tool_result_tokens_total", "Estimated prompt tokens returned by each tool.", ("tool",)))
+
+
+def render_metrics() -> str:
+    return registry.render()
+
+
+@contextmanager
+def span(stage: str):
+    """Time a request stage; an exception counts as an error for the stage."""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        errors.inc(stage=stage)
+        raise
+    finally:
+        stage_duration.observe(time.perf_counter() - start, stage=stage)
+
+
+def observe_tool(fn: Callable) -> Callable:
+    """Time every call of a (sync) tool and count its failures.
+
+    Goes between @agent.tool and the function, like account_tool_tokens.
+    """
+    name = fn.__name__
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        except Exception:
+            errors.inc(stage=f"tool:{name}")
+            raise
+        finally:
+            tool_duration.observe(time.perf_counter() - start, tool=name)
+    return wrapper
+
+
+def _record_usage(model_name: str, usage) -> None:
+    if usage is None:
+        return
+    model_tokens.inc(usage.input_tokens or 0, model=model_name, kind="input")
+    model_tokens.inc(usage.output_tokens or 0, model=model_name, kind="output")
+
+
+class TimedModel(WrapperModel):
+    """Wraps the agent's model to time each round-trip and count the tokens it reports."""
+
+    async def request(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = await self.wrapped.request(*args, **kwargs)
+        except Exception:
+            errors.inc(stage="model")
+            raise
+        finally:
+            model_duration.observe(time.perf_counter() - start, model=self.model_name, mode="request")
+        _record_usage(self.model_name, response.usage)
+        return response
+
+    @asynccontextmanager
+    async def request_stream(self, *args, **kwargs) -> AsyncIterator:
+        start = time.perf_counter()
+        response_stream = None
+        try:
+            async with self.wrapped.request_stream(*args, **kwargs) as response_stream:
+                yield response_stream
+        except Exception:
+            errors.inc(stage="model")
+            raise
+        finally:
+            model_duration.observe(time.perf_counter() - start, model=self.model_name, mode="stream")
+            if response_stream is not None:
+                _record_usage(self.model_name, response_stream.usage())
+
+
+async def observe_first_chunk(chunks: AsyncIterator[str], started: float) -> AsyncIterator[str]:
+    """Pass SSE frames through, recording when the first one was ready."""
+    first = True
+    async for chunk in chunks:
+        if first:
+            stream_first_chunk.observe(time.perf_counter() - started)
+            first = False
+        yield chunk
+
+
+# Fixed route labels keep series cardinality bounded whatever paths clients send
+_ROUTES = ("/chat/completions", "/agui", "/metrics", "/health")
+
+
+def route_label(path: str) -> str:
+    for route in _ROUTES:
+        if path == route or path.startswith(route + "/"):
+            return route
+    return "/" if path == "/" else "other"
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording request counts, durations (until the body is sent) and in-flight gauges."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        route = route_label(scope.get("path", ""))
+        method = scope.get("method", "")
+        status = "500"
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            await send(message)
+
+        http_in_flight.inc(route=route)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            http_in_flight.dec(route=route)
+            http_request_duration.observe(time.perf_counter() - start, route=route, method=method)
+            http_requests.inc(route=route, method=method, status=status)
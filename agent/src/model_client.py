@@ -0,0 +1,101 @@
+"""
+Gemini model and its HTTP client
+One pooled httpx.AsyncClient shared by every model request, and a start-up warm-up that opens
+its connections before the service reports ready
+"""
+from typing import Optional
+import asyncio
+import importlib.util
+import os
+import time
+
+import httpx
+from pydantic_ai.models import get_user_agent
+from pydantic_ai.models.google import GoogleModel
+from pydantic_ai.providers.google import GoogleProvider
+
+from .logs import get_logger
+
+MODEL_NAME = os.getenv("GEMINI_MODEL", "gemini-2.0-flash")
+
+# Connection pool and timeouts (override via env)
+HTTP_MAX_CONNECTIONS = int(os.getenv("MODEL_HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("MODEL_HTTP_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("MODEL_HTTP_KEEPALIVE_EXPIRY_SECONDS", "60"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("MODEL_HTTP_CONNECT_TIMEOUT_SECONDS", "5"))
+HTTP_READ_TIMEOUT = float(os.getenv("MODEL_HTTP_READ_TIMEOUT_SECONDS", "60"))
+HTTP_POOL_TIMEOUT = float(os.getenv("MODEL_HTTP_POOL_TIMEOUT_SECONDS", "5"))
+# "auto" uses HTTP/2 when the h2 package is installed (pip install 'httpx[http2]')
+HTTP2 = os.getenv("MODEL_HTTP2", "auto").lower()
+
+WARMUP_ENABLED = os.getenv("MODEL_WARMUP", "1") != "0"
+WARMUP_CONNECTIONS = int(os.getenv("MODEL_WARMUP_CONNECTIONS", "2"))
+WARMUP_TIMEOUT_SECONDS = float(os.getenv("MODEL_WARMUP_TIMEOUT_SECONDS", "10"))
+
+log = get_logger("model")
+
+
+def http2_enabled(setting: str = HTTP2) -> bool:
+    if setting == "auto":
+        return importlib.util.find_spec("h2") is not None
+    return setting in ("1", "true", "yes")
+
+
+def build_http_client() -> httpx.AsyncClient:
+    """The pooled client every Gemini request goes through."""
+    return httpx.AsyncClient(
+        http2=http2_enabled(),
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(
+            connect=HTTP_CONNECT_TIMEOUT,
+            read=HTTP_READ_TIMEOUT,
+            write=HTTP_CONNECT_TIMEOUT,
+            pool=HTTP_POOL_TIMEOUT,
+        ),
+        headers={"User-Agent": get_user_agent()},
+    )
+
+
+http_client = build_http_client()
+
+
+def build_model(model_name: str = MODEL_NAME) -> GoogleModel:
+    return GoogleModel(model_name, provider=GoogleProvider(http_client=http_client))
+
+
+class WarmUp:
+    """Start-up warm-up state, read by the health check."""
+
+    def __init__(self):
+        self.ready = not WARMUP_ENABLED
+        self.duration: Optional[float] = None
+        self.error: Optional[str] = None
+
+    async def run(self, model: GoogleModel) -> None:
+        """Open pooled connections to the Gemini API and check the model is reachable.
+
+        A failed warm-up is logged and the service still reports ready: the
+        first real requests then pay the connection cost, as before.
+        """
+        start = time.perf_counter()
+        try:
+            async with asyncio.timeout(WARMUP_TIMEOUT_SECONDS):
+                # A model metadata lookup is free, authenticated, and leaves a warm connection in the
+                # pool per concurrent call
+                models = model.client.aio.models
+                await asyncio.gather(*(models.get(model=model.model_name) for _ in range(WARMUP_CONNECTIONS)))
+        except Exception as e:
+            self.error = f"{type(e).__name__}: {e}"
+            log.warning("model warm-up failed", extra={"model": model.model_name, "error": self.error})
+        else:
+            log.info("model warm-up finished", extra={"model": model.model_name, "connections": WARMUP_CONNECTIONS})
+        finally:
+            self.duration = time.perf_counter() - start
+            self.ready = True
+
+
+warm_up = WarmUp()
@@ -0,0 +1,120 @@
+"""
+Qualification answers
+Normalises what a prospect says about their organisation into the AppState buckets the prompt and
+lead records use
+"""
+from typing import Iterable, List, Optional
+import re
+
+from .catalogue import catalogue, organisation_type_key
+
+# Bucket keys in ascending order with the (exclusive) upper bound of each; the last is open-ended
+MEMBER_COUNT_BUCKETS = (("under_500", 500), ("500_2000", 2_000), ("2000_10000", 10_000), ("over_10000", None))
+BUDGET_RANGE_BUCKETS = (("under_2k", 2_000), ("2k_5k", 5_000), ("5k_10k", 10_000), ("over_10k", None))
+TIMELINES = ("urgent", "3_months", "6_months", "exploring")
+# The AppState fields the qualification questions fill in
+QUALIFICATION_FIELDS = ("organisation_type", "member_count", "primary_challenges", "budget_range", "timeline")
+
+_AMOUNT = re.compile(r"(\d[\d,]*(?:\.\d+)?)\s*(k|thousand|m|million)?\b", re.IGNORECASE)
+_BELOW = re.compile(r"\b(under|below|less than|fewer than|up to)\b", re.IGNORECASE)
+_ABOVE = re.compile(r"\b(over|above|more than|at least)\b|\+", re.IGNORECASE)
+_MONTHS = re.compile(r"(\d+)\s*(week|month|year)s?", re.IGNORECASE)
+# In order: "not right now" and "no rush" are exploring, so negations come before the urgent words
+_TIMELINE_WORDS = (
+    ("exploring", re.compile(
+        r"\b(exploring|just looking|research|no (rush|hurry)|not sure|next year"
+        r"|not (yet|urgent|immediately|right away|(right |just )?now|this month|in a (rush|hurry)))\b",
+        re.IGNORECASE)),
+    ("urgent", re.compile(r"\b(urgent|asap|immediately|right away|now|this month)\b", re.IGNORECASE)),
+    ("6_months", re.compile(r"\b(half|later this year|six months)\b", re.IGNORECASE)),
+    ("3_months", re.compile(r"\b(soon|quarter|few months|three months)\b", re.IGNORECASE)),
+)
+_MULTIPLIERS = {"k": 1_000, "thousand": 1_000, "m": 1_000_000, "million": 1_000_000}
+
+
+def clean_answer(value: Optional[str]) -> Optional[str]:
+    """An answer with its whitespace collapsed; None when nothing was said."""
+    value = " ".join(str(value).split()) if value is not None else ""
+    return value or None
+
+
+def _amount(text: str) -> Optional[float]:
+    """First number in the text ("1,200", "3.5k", "2 million"), nudged below/above a stated bound."""
+    match = _AMOUNT.search(text)
+    if not match:
+        return None
+    amount = float(match.group(1).replace(",", "")) * _MULTIPLIERS.get((match.group(2) or "").lower(), 1)
+    if _BELOW.search(text):
+        amount -= 0.5
+    elif _ABOVE.search(text):
+        amount += 0.5
+    return amount
+
+
+def _bucket(text: str, buckets) -> Optional[str]:
+    key = organisation_type_key(text)
+    if any(key == name for name, _ in buckets):
+        return key
+    amount = _amount(text)
+    if amount is None:
+        return None
+    return next(name for name, bound in buckets if bound is None or amount < bound)
+
+
+def normalise_member_count(value: Optional[str]) -> Optional[str]:
+    """"about 1,200 members" -> "500_2000"; unrecognised answers are kept as said."""
+    value = clean_answer(value)
+    return value and (_bucket(value, MEMBER_COUNT_BUCKETS) or value)
+
+
+def normalise_budget_range(value: Optional[str]) -> Optional[str]:
+    """"£3k a month" -> "2k_5k"; unrecognised answers are kept as said."""
+    value = clean_answer(value)
+    return value and (_bucket(value, BUDGET_RANGE_BUCKETS) or value)
+
+
+def normalise_timeline(value: Optional[str]) -> Optional[str]:
+    """"within 3 months" -> "3_months", "just exploring" -> "exploring"."""
+    value = clean_answer(value)
+    if not value:
+        return None
+    key = organisation_type_key(value)
+    if key in TIMELINES:
+        return key
+    match = _MONTHS.search(value)
+    if match:
+        count, unit = int(match.group(1)), match.group(2).lower()
+        months = count / 4 if unit == "week" else count * 12 if unit == "year" else count
+        return "urgent" if months <= 1 else "3_months" if months <= 3 else "6_months" if months <= 6 else "exploring"
+    for timeline, pattern in _TIMELINE_WORDS:
+        if pattern.search(value):
+            return timeline
+    return value
+
+
+def normalise_organisation_type(value: Optional[str]) -> Optional[str]:
+    """"Professional Body" -> "professional_body"; other types are kept in the same key form."""
+    value = clean_answer(value)
+    if not value:
+        return None
+    key = organisation_type_key(value)
+    if key in catalogue.organisation_types:
+        return key
+    # "an accountancy professional body", "a trade association for builders"
+    return next((known for known in catalogue.organisation_types if known.replace("_", " ") in key.replace("_", " ")), key)
+
+
+def normalise_challenges(values: Optional[Iterable[str]]) -> List[str]:
+    """Challenge keys (acquisition, retention, ...) for what was said, in order and without repeats."""
+    keys: List[str] = []
+    for value in values or ():
+        value = clean_answer(value)
+        if not value:
+            continue
+        key = value.lower()
+        if key not in catalogue.challenges:
+            ranked = catalogue.rank_challenges([value])
+            key = ranked[0][0] if ranked else key
+        if key not in keys:
+            keys.append(key)
+    return keys
@@ -0,0 +1,214 @@
+"""
+Resilient model calls
+Per-attempt deadlines, jittered retries on transient errors, optional hedged requests and a
+fallback model, wrapped around the agent's model
+"""
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional
+import asyncio
+import os
+import random
+
+import httpx
+from pydantic_ai.exceptions import ModelHTTPError
+from pydantic_ai.models import Model
+from pydantic_ai.models.wrapper import WrapperModel
+
+from .logs import get_logger
+from .metrics import Counter, registry
+
+# Deadline for one attempt; for a stream, the deadline to open it (i.e. the first chunk)
+ATTEMPT_TIMEOUT_SECONDS = float(os.getenv("MODEL_ATTEMPT_TIMEOUT_SECONDS", "20"))
+MAX_ATTEMPTS = int(os.getenv("MODEL_MAX_ATTEMPTS", "2"))
+RETRY_BASE_DELAY_SECONDS = float(os.getenv("MODEL_RETRY_BASE_DELAY_SECONDS", "0.2"))
+RETRY_MAX_DELAY_SECONDS = float(os.getenv("MODEL_RETRY_MAX_DELAY_SECONDS", "2"))
+# Start a second, identical request if the first hasn't answered by then (0 disables hedging)
+HEDGE_AFTER_SECONDS = float(os.getenv("MODEL_HEDGE_AFTER_SECONDS", "0"))
+# Secondary model used once the primary's attempts are exhausted, e.g. "gemini-2.0-flash-lite"
+FALLBACK_MODEL = os.getenv("FALLBACK_MODEL") or None
+
+TRANSIENT_STATUS_CODES = frozenset({408, 409, 429, 500, 502, 503, 504})
+
+log = get_logger("model")
+
+model_attempts = registry.register(Counter(
+    "agent_model_attempts_total", "Model attempts by model and outcome.", ("model", "outcome")))
+model_retries = registry.register(Counter(
+    "agent_model_retries_total", "Model attempts that were retries.", ("model",)))
+model_hedges = registry.register(Counter(
+    "agent_model_hedges_total", "Hedged model requests started, and those that won.", ("model", "result")))
+model_fallbacks = registry.register(Counter(
+    "agent_model_fallbacks_total", "Requests that fell back to the secondary model.", ("model",)))
+
+
+def is_transient(error: BaseException) -> bool:
+    """Errors worth another attempt: deadlines, network failures, rate limits and server errors."""
+    if isinstance(error, (TimeoutError, httpx.TransportError)):
+        return True
+    if isinstance(error, ModelHTTPError):
+        return error.status_code in TRANSIENT_STATUS_CODES
+    return False
+
+
+def backoff_delay(retry: int, base: float = RETRY_BASE_DELAY_SECONDS, cap: float = RETRY_MAX_DELAY_SECONDS) -> float:
+    """Full-jitter exponential backoff before the given retry (1 = first retry)."""
+    return random.uniform(0, min(cap, base * 2 ** (retry - 1)))
+
+
+def _consume_result(task: asyncio.Task) -> None:
+    if not task.cancelled():
+        task.exception()
+
+
+class _StreamHolder:
+    """Opens a model stream in its own task and keeps it open until closed.
+
+    Entering and exiting the stream's context must happen in one task, so
+    racing two streams (hedging) needs each held by a task of its own; the
+    winner's events are still read by the caller.
+    """
+
+    def __init__(self, stream_context):
+        self.opened: asyncio.Future = asyncio.get_running_loop().create_future()
+        self._done = asyncio.Event()
+        self._task = asyncio.create_task(self._hold(stream_context))
+
+    async def _hold(self, stream_context) -> None:
+        try:
+            async with stream_context as stream:
+                if self.opened.done():
+                    return
+                self.opened.set_result(stream)
+                await self._done.wait()
+        except BaseException as e:
+            if not self.opened.done():
+                if isinstance(e, asyncio.CancelledError):
+                    self.opened.cancel()
+                else:
+                    self.opened.set_exception(e)
+            elif not isinstance(e, asyncio.CancelledError):
+                log.debug("model stream close failed", extra={"error": repr(e)})
+
+    def abort(self) -> None:
+        self._task.cancel()
+        self._task.add_done_callback(_consume_result)
+
+    async def close(self) -> None:
+        self._done.set()
+        await asyncio.shield(self._task)
+
+
+class ResilientModel(WrapperModel):
+    """Calls the wrapped (primary) model with deadlines, retries and hedging, then the fallback.
+
+    Transient failures are retried on the primary up to max_attempts times
+    with jittered backoff, then tried once on the fallback model. With
+    hedge_after set, an attempt still unanswered after that long races a
+    second identical request, and the first to succeed wins. A stream is only
+    retried, hedged or failed over while opening; once its first event has
+    been handed to the agent it runs to completion.
+    """
+
+    def __init__(
+        self,
+        primary: Model,
+        fallback: Optional[Model] = None,
+        attempt_timeout: float = ATTEMPT_TIMEOUT_SECONDS,
+        max_attempts: int = MAX_ATTEMPTS,
+        hedge_after: float = HEDGE_AFTER_SECONDS,
+    ):
+        super().__init__(primary)
+        self.fallback = fallback
+        self.attempt_timeout = attempt_timeout
+        self.max_attempts = max(1, max_attempts)
+        self.hedge_after = hedge_after
+
+    async def _attempt(
+        self,
+        model: Model,
+        start: Callable[[Model], Awaitable[Any]],
+        discard: Optional[Callable[[Any], None]],
+    ) -> Any:
+        """One deadline-bound attempt, hedged with a second request if it is slow."""
+        tasks = [asyncio.create_task(start(model))]
+        pending = set(tasks)
+        winner = None
+        error: Optional[BaseException] = None
+        try:
+            async with asyncio.timeout(self.attempt_timeout):
+                while pending:
+                    hedge = self.hedge_after > 0 and len(tasks) == 1
+                    done, pending = await asyncio.wait(
+                        pending, timeout=self.hedge_after if hedge else None, return_when=asyncio.FIRST_COMPLETED
+                    )
+                    if not done:
+                        model_hedges.inc(model=model.model_name, result="started")
+                        tasks.append(asyncio.create_task(start(model)))
+                        pending.add(tasks[-1])
+                        continue
+                    for task in done:
+                        if task.exception() is None:
+                            winner = task
+                            break
+                        error = task.exception()
+                    if winner is not None:
+                        if winner is not tasks[0]:
+                            model_hedges.inc(model=model.model_name, result="won")
+                        return winner.result()
+            raise error
+        finally:
+            for task in tasks:
+                if task is winner:
+                    continue
+                if not task.done():
+                    task.cancel()
+                    task.add_done_callback(_consume_result)
+                elif not task.cancelled() and task.exception() is None and discard is not None:
+                    # Lost a tie: both requests succeeded
+                    discard(task.result())
+
+    async def _call(self, start: Callable[[Model], Awaitable[Any]], discard: Optional[Callable[[Any], None]] = None) -> Any:
+        plan = [(self.wrapped, self.max_attempts)]
+        if self.fallback is not None:
+            plan.append((self.fallback, 1))
+
+        error: Optional[BaseException] = None
+        for position, (model, attempts) in enumerate(plan):
+            if position:
+                model_fallbacks.inc(model=model.model_name)
+                log.warning("falling back to secondary model", extra={"model": model.model_name, "error": repr(error)})
+            for attempt in range(attempts):
+                if attempt:
+                    model_retries.inc(model=model.model_name)
+                    await asyncio.sleep(backoff_delay(attempt))
+                try:
+                    result = await self._attempt(model, start, discard)
+                except Exception as e:
+                    error = e
+                    outcome = "timeout" if isinstance(e, TimeoutError) else "error"
+                    model_attempts.inc(model=model.model_name, outcome=outcome)
+                    if not is_transient(e):
+                        raise
+                    continue
+                model_attempts.inc(model=model.model_name, outcome="success")
+                return result
+        raise error
+
+    async def request(self, messages, model_settings, model_request_parameters):
+        return await self._call(lambda model: model.request(messages, model_settings, model_request_parameters))
+
+    @asynccontextmanager
+    async def request_stream(self, messages, model_settings, model_request_parameters, run_context=None) -> AsyncIterator:
+        async def open_stream(model: Model):
+            holder = _StreamHolder(model.request_stream(messages, model_settings, model_request_parameters, run_context))
+            try:
+                return holder, await holder.opened
+            except BaseException:
+                holder.abort()
+                raise
+
+        holder, stream = await self._call(open_stream, discard=lambda opened: opened[0].abort())
+        try:
+            yield stream
+        finally:
+            await holder.close()
@@ -0,0 +1,114 @@
+"""
+Response caching for the agent
+Frozen, memoised tool results and an exact-match cache for whole CLM answers
+"""
+from functools import lru_cache, wraps
+from typing import Any, Callable, Optional
+import hashlib
+import os
+import re
+
+from .session_store import SessionStore
+
+ANSWER_CACHE_SIZE = int(os.getenv("CLM_ANSWER_CACHE_SIZE", "256"))
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("CLM_ANSWER_CACHE_TTL_SECONDS", "3600"))
+
+
+class FrozenDict(dict):
+    """A dict that refuses mutation, so a cached tool result can be shared by every caller."""
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("cached tool results are read-only")
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _readonly
+    __ior__ = _readonly
+
+    def __reduce__(self):
+        # copy/deepcopy/pickle rebuild via dict(...) rather than item assignment
+        return (FrozenDict, (dict(self),))
+
+
+def freeze(value: Any) -> Any:
+    """Recursively convert dicts to FrozenDict and lists to tuples."""
+    if isinstance(value, dict):
+        return FrozenDict((k, freeze(v)) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(v) for v in value)
+    return value
+
+
+_memoised_tools: dict[str, Callable] = {}
+
+
+def memoise_tool_result(maxsize: int = 128) -> Callable:
+    """Memoise a pure tool helper on its (hashable) arguments and freeze its result."""
+    def decorator(fn: Callable) -> Callable:
+        @lru_cache(maxsize=maxsize)
+        @wraps(fn)
+        def cached(*args):
+            return freeze(fn(*args))
+
+        _memoised_tools[fn.__name__] = cached
+        return cached
+    return decorator
+
+
+def tool_cache_stats() -> dict:
+    """Hit/miss counters for every memoised tool helper."""
+    stats = {}
+    for name, cached in _memoised_tools.items():
+        info = cached.cache_info()
+        stats[name] = {"hits": info.hits, "misses": info.misses, "size": info.currsize}
+    return stats
+
+
+_WHITESPACE = re.compile(r"\s+")
+_TRAILING_PUNCTUATION = re.compile(r"[\s.!?,]+$")
+
+
+def normalise_prompt(text: str) -> str:
+    """Case, whitespace and trailing punctuation never change the answer to an opening question."""
+    return _TRAILING_PUNCTUATION.sub("", _WHITESPACE.sub(" ", text.strip().lower()))
+
+
+class AnswerCache:
+    """Exact-match LRU cache of whole CLM answers.
+
+    Only guest opening turns are cached: an answer for a logged-in user
+    addresses them by name, and later turns depend on the transcript. The key
+    covers the normalised question, the system prompt (which carries the page
+    context) and the state with the user removed.
+    """
+
+    def __init__(self, max_entries: int = ANSWER_CACHE_SIZE, ttl_seconds: float = ANSWER_CACHE_TTL_SECONDS):
+        self.enabled = max_entries > 0
+        self._store = SessionStore(max_entries=max(max_entries, 1), ttl_seconds=ttl_seconds)
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, user_message: str, system_prompt: Optional[str], state_fingerprint: str) -> str:
+        digest = hashlib.blake2b(digest_size=16)
+        for part in (normalise_prompt(user_message), system_prompt or "", state_fingerprint):
+            digest.update(part.encode())
+            digest.update(b"\x00")
+        return digest.hexdigest()
+
+    def get(self, key: Optional[str]) -> Optional[str]:
+        if not self.enabled or not key:
+            return None
+        answer = self._store.get(key)
+        if answer is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return answer
+
+    def set(self, key: Optional[str], answer: str) -> None:
+        if self.enabled and key and answer:
+            self._store.set(key, answer)
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._store)}
+
+
+answer_cache = AnswerCache()
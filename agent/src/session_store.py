@@ -0,0 +1,70 @@
+"""
+Session-keyed in-memory store
+Bounded LRU map with per-entry TTL, safe to use from the event loop and tool worker threads
+"""
+from collections import OrderedDict
+from typing import Any, Optional
+import threading
+import time
+
+
+class SessionStore:
+    """LRU + TTL store keyed by conversation (Hume session / CopilotKit thread id).
+
+    Every operation holds a short non-async lock and never awaits, so it can be
+    called from coroutines and from the worker threads sync tools run in.
+    Each process keeps its own store; callers must be able to rebuild an entry
+    from the request (e.g. the Hume system prompt) when a session lands on a
+    different worker.
+    """
+
+    def __init__(self, max_entries: int = 10_000, ttl_seconds: float = 3600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Optional[str], default: Any = None) -> Any:
+        """Return the value for a session, refreshing its LRU position."""
+        if not key:
+            return default
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: Optional[str], value: Any) -> None:
+        """Store a value for a session, evicting the least recently used entries."""
+        if not key:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def pop(self, key: Optional[str], default: Any = None) -> Any:
+        """Remove a session and return its value."""
+        if not key:
+            return default
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        return entry[1] if entry else default
+
+    def prune(self) -> int:
+        """Drop expired entries and return how many were removed."""
+        now = time.monotonic()
+        with self._lock:
+            expired = [key for key, (expires_at, _) in self._entries.items() if expires_at < now]
+            for key in expired:
+                del self._entries[key]
+        return len(expired)
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,241 @@
+"""
+Single-flight request coalescing
+Identical requests that arrive while one is running attach to it and share its streamed output;
+finished results are kept briefly for late duplicates (client retries)
+"""
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterable, List, Optional, Tuple
+import asyncio
+import hashlib
+import json
+import os
+import time
+
+from .cancellation import ClientDisconnected, client_disconnects
+from .logs import get_logger
+from .metrics import Counter, Gauge, registry, runs_cancelled
+
+# How long a finished run still answers duplicates of its request
+SINGLE_FLIGHT_RETENTION_SECONDS = float(os.getenv("SINGLE_FLIGHT_RETENTION_SECONDS", "10"))
+
+log = get_logger("flight")
+
+coalesced_requests = registry.register(Counter(
+    "agent_coalesced_requests_total",
+    "Requests by whether they ran (leader), joined a running duplicate, or replayed a retained result.",
+    ("result",)))
+flights_running = registry.register(Gauge(
+    "agent_flights_running", "Runs currently shared by coalesced requests."))
+
+
+class Flight:
+    """One run's output, replayable by any number of subscribers.
+
+    The leader starts the run with start(); every request on the flight,
+    leader included, waits on wait_started() and then reads read() or
+    subscribe(). The run is pumped by a task of its own, so a request going
+    away never stops the others; once every request has gone (each either
+    finished read() or released its attachment()), an unfinished run is
+    cancelled.
+    """
+
+    def __init__(self, endpoint: str = "unknown"):
+        self.endpoint = endpoint
+        # Requests attached by SingleFlight.join() that haven't finished reading or left
+        self.requests = 0
+        self.cancelled = False
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.finished_at: Optional[float] = None
+        self._started: asyncio.Future = asyncio.get_running_loop().create_future()
+        self._changed = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._on_finish: List[Callable[["Flight"], None]] = []
+
+    def _append(self, chunk: str) -> None:
+        self.chunks.append(chunk)
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def start(self, output: AsyncIterator[str], acquire: Optional[Callable[[], Awaitable[Any]]] = None) -> None:
+        """Run output in the flight's own task, first awaiting acquire() (e.g. an admission slot).
+
+        acquire() returns something with release(), called when the run
+        finishes; if it raises, the flight fails and wait_started() raises the
+        same error for every request on it.
+        """
+        self._task = asyncio.create_task(self._pump(output, acquire))
+
+    def fail(self, error: BaseException) -> None:
+        """The run couldn't start; every request on the flight gets the same error."""
+        self.error = error
+        self._started.set_exception(error)
+        # Retrieved here so an unjoined failure isn't reported as never retrieved
+        self._started.exception()
+        self._finish()
+
+    def _finish(self) -> None:
+        self.done = True
+        self.finished_at = time.monotonic()
+        self._changed.set()
+        for callback in self._on_finish:
+            callback(self)
+
+    async def wait_started(self) -> None:
+        await asyncio.shield(self._started)
+
+    async def _pump(self, output: AsyncIterator[str], acquire: Optional[Callable[[], Awaitable[Any]]]) -> None:
+        held = None
+        if acquire is not None:
+            try:
+                held = await acquire()
+            except asyncio.CancelledError:
+                # Every request left while the run was still queued
+                await output.aclose()
+                self.fail(ClientDisconnected())
+                return
+            except Exception as e:
+                await output.aclose()
+                self.fail(e)
+                return
+        self._started.set_result(None)
+        flights_running.inc()
+        try:
+            async for chunk in output:
+                self._append(chunk)
+        except asyncio.CancelledError:
+            runs_cancelled.inc(endpoint=self.endpoint)
+            log.info("run cancelled, no client waiting", extra={"chunks": len(self.chunks)})
+        except Exception:
+            log.exception("coalesced run failed", extra={"chunks": len(self.chunks)})
+        finally:
+            flights_running.dec()
+            if held is not None:
+                held.release()
+            self._finish()
+
+    def leave(self) -> None:
+        """A request stops waiting for the run; the last one to go cancels it."""
+        self.requests -= 1
+        if self.requests <= 0 and not self.done and self._task is not None:
+            self.cancelled = True
+            self._task.cancel()
+
+    def attachment(self) -> "Attachment":
+        """The request's place on the flight, to release once its response ends (see HeldSlotResponse)."""
+        return Attachment(self)
+
+    async def subscribe(self, count_disconnect: bool = True) -> AsyncIterator[str]:
+        """Every chunk so far, then each new one until the run finishes.
+
+        Doesn't end the request's attachment: a generator that is never
+        iterated (the client left before the body was sent) never runs its
+        cleanup, so streamed responses release an attachment() instead.
+        """
+        sent = 0
+        try:
+            while True:
+                while sent < len(self.chunks):
+                    yield self.chunks[sent]
+                    sent += 1
+                if self.done:
+                    return
+                await self._changed.wait()
+        except (asyncio.CancelledError, GeneratorExit):
+            # The response stopped before the run finished: its client went away
+            if count_disconnect:
+                client_disconnects.inc(endpoint=self.endpoint)
+            raise
+
+    async def read(self) -> str:
+        """The whole output, once the run finishes; ends the request's attachment."""
+        try:
+            # A cancelled read is a disconnect already counted by whoever cancelled it
+            return "".join([chunk async for chunk in self.subscribe(count_disconnect=False)])
+        finally:
+            self.leave()
+
+    def text(self) -> str:
+        return "".join(self.chunks)
+
+
+class Attachment:
+    """One request on a flight; release() leaves it, however many times it is called."""
+
+    def __init__(self, flight: Flight):
+        self.flight = flight
+        self.released = False
+
+    def release(self) -> None:
+        if not self.released:
+            self.released = True
+            self.flight.leave()
+
+
+class SingleFlight:
+    """Flights keyed by request, so duplicates share one run.
+
+    join() returns the running (or recently finished) flight for a key, or a
+    new one the caller leads. A key of None is never shared. A finished flight
+    is retained for retention_seconds unless retain() rejects its text
+    (e.g. a fallback answer, which a retry should get a fresh run for).
+    """
+
+    def __init__(
+        self,
+        retention_seconds: float = SINGLE_FLIGHT_RETENTION_SECONDS,
+        retain: Optional[Callable[[str], bool]] = None,
+        endpoint: str = "unknown",
+    ):
+        self.endpoint = endpoint
+        self.retention_seconds = retention_seconds
+        self.retain = retain
+        self._flights: dict[str, Flight] = {}
+
+    @staticmethod
+    def key(*parts, messages: Iterable[Tuple[str, Optional[str]]] = ()) -> str:
+        """Request key over the given parts and (role, content) messages, whitespace-normalised."""
+        normalised = [(role, " ".join((content or "").split())) for role, content in messages]
+        payload = json.dumps([parts, normalised], separators=(",", ":"), ensure_ascii=False, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def _reusable(self, flight: Flight) -> bool:
+        if not flight.done:
+            return True
+        return (
+            flight.error is None and not flight.cancelled
+            and time.monotonic() - flight.finished_at <= self.retention_seconds
+        )
+
+    def join(self, key: Optional[str]) -> Tuple[Flight, bool]:
+        """(flight, True if the caller leads it and must start it).
+
+        The caller is attached to the flight until it has finished read(),
+        released its attachment() or called leave().
+        """
+        if key is not None:
+            flight = self._flights.get(key)
+            if flight is not None and self._reusable(flight):
+                coalesced_requests.inc(result="joined" if not flight.done else "retained")
+                flight.requests += 1
+                return flight, False
+        flight = Flight(self.endpoint)
+        flight.requests += 1
+        coalesced_requests.inc(result="leader")
+        if key is not None:
+            self._flights[key] = flight
+            flight._on_finish.append(lambda finished: self._finished(key, finished))
+        return flight, True
+
+    def _forget(self, key: str, flight: Flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def _finished(self, key: str, flight: Flight) -> None:
+        if flight.error is not None or flight.cancelled or (self.retain is not None and not self.retain(flight.text())):
+            self._forget(key, flight)
+        else:
+            asyncio.get_running_loop().call_later(self.retention_seconds, self._forget, key, flight)
+
+    def __len__(self) -> int:
+        return len(self._flights)
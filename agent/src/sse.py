@@ -0,0 +1,174 @@
+"""
+OpenAI-compatible SSE encoding for the Hume CLM endpoint
+Pre-serialised chunk envelopes and phrase-level coalescing of model deltas for TTS
+"""
+from typing import Optional, AsyncIterator
+import os
+import json
+import time
+import asyncio
+
+CLM_MODEL_NAME = "membership-marketing-agent"
+
+# Coalescing budget (override via env for tuning against Hume playback)
+STREAM_MIN_CHARS = int(os.getenv("CLM_STREAM_MIN_CHARS", "24"))
+STREAM_MAX_CHARS = int(os.getenv("CLM_STREAM_MAX_CHARS", "160"))
+STREAM_MAX_DELAY_MS = int(os.getenv("CLM_STREAM_MAX_DELAY_MS", "150"))
+
+# Characters that end a sentence or phrase - a natural place for TTS to start speaking
+SENTENCE_BREAKS = ".!?\n"
+PHRASE_BREAKS = ",;:)"
+
+DONE_FRAME = "data: [DONE]\n\n"
+
+
+class SSEChunkEncoder:
+    """Encodes text deltas as chat.completion.chunk frames for one response.
+
+    The envelope around the delta content is constant for a response, so it is
+    serialised once and only the content string is JSON-escaped per frame.
+    """
+
+    def __init__(self, msg_id: str, model: str = CLM_MODEL_NAME, created: Optional[int] = None):
+        envelope = {
+            "id": msg_id,
+            "object": "chat.completion.chunk",
+            "created": created if created is not None else int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "delta": {"content": "\x00"},
+                "finish_reason": None
+            }]
+        }
+        # Split the serialised envelope around a placeholder content value
+        prefix, suffix = json.dumps(envelope).split(json.dumps("\x00"))
+        self._prefix = "data: " + prefix
+        self._suffix = suffix + "\n\n"
+
+        final = {
+            "id": msg_id,
+            "object": "chat.completion.chunk",
+            "created": envelope["created"],
+            "model": model,
+            "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]
+        }
+        self.final_frame = f"data: {json.dumps(final)}\n\n"
+
+    def encode(self, content: str) -> str:
+        """Encode one content delta as an SSE frame."""
+        return self._prefix + json.dumps(content) + self._suffix
+
+
+def _split_point(buffer: str, min_chars: int, max_chars: int) -> int:
+    """Return how many buffered characters to flush now, or 0 to keep buffering."""
+    if len(buffer) < min_chars:
+        return 0
+
+    # Prefer the last sentence break, then the last phrase break
+    for breaks in (SENTENCE_BREAKS, PHRASE_BREAKS):
+        for i in range(len(buffer) - 2, -1, -1):
+            # Only break before whitespace so "£2,000" or "3.5" are never split
+            if buffer[i] in breaks and buffer[i + 1].isspace():
+                # Keep trailing whitespace with the phrase it follows
+                end = i + 1
+                while end < len(buffer) and buffer[end].isspace():
+                    end += 1
+                return end
+
+    if len(buffer) >= max_chars:
+        # No punctuation - break on the last word boundary so words are never split
+        space = buffer.rfind(" ", 0, max_chars)
+        return space + 1 if space > 0 else max_chars
+
+    return 0
+
+
+async def coalesce_deltas(
+    deltas: AsyncIterator[str],
+    min_chars: int = STREAM_MIN_CHARS,
+    max_chars: int = STREAM_MAX_CHARS,
+    max_delay_ms: int = STREAM_MAX_DELAY_MS,
+) -> AsyncIterator[str]:
+    """Group small model deltas into sentence/phrase-sized frames.
+
+    A frame is flushed at a sentence or phrase break once it holds at least
+    `min_chars`, at a word boundary once it reaches `max_chars`, or when text
+    has been buffered for `max_delay_ms` with nothing new arriving (e.g. while
+    the agent is running a tool).
+    """
+    max_delay = max_delay_ms / 1000
+    queue: asyncio.Queue = asyncio.Queue()
+    end = object()
+
+    async def pump() -> None:
+        # Read the source on its own task so a stalled model never blocks a timed flush
+        try:
+            async for delta in deltas:
+                queue.put_nowait(delta)
+        except BaseException as e:
+            queue.put_nowait(e)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+        else:
+            queue.put_nowait(end)
+
+    reader = asyncio.create_task(pump())
+    buffer = ""
+    buffered_at = 0.0
+
+    try:
+        while True:
+            if not queue.empty():
+                item = queue.get_nowait()
+            elif buffer:
+                timeout = buffered_at + max_delay - time.monotonic()
+                try:
+                    async with asyncio.timeout(max(0.0, timeout)):
+                        item = await queue.get()
+                except TimeoutError:
+                    # Time budget spent - flush whatever we have
+                    yield buffer
+                    buffer = ""
+                    continue
+            else:
+                item = await queue.get()
+
+            if item is end:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            if not item:
+                continue
+            if not buffer:
+                buffered_at = time.monotonic()
+            buffer += item
+
+            while True:
+                cut = _split_point(buffer, min_chars, max_chars)
+                if not cut:
+                    break
+                yield buffer[:cut]
+                buffer = buffer[cut:]
+                buffered_at = time.monotonic()
+
+        if buffer:
+            yield buffer
+    finally:
+        if not reader.done():
+            reader.cancel()
+
+
+async def encode_sse_stream(
+    deltas: AsyncIterator[str],
+    msg_id: str,
+    min_chars: int = STREAM_MIN_CHARS,
+    max_chars: int = STREAM_MAX_CHARS,
+    max_delay_ms: int = STREAM_MAX_DELAY_MS,
+) -> AsyncIterator[str]:
+    """Stream coalesced deltas as OpenAI-compatible SSE frames, ending with stop and [DONE]."""
+    encoder = SSEChunkEncoder(msg_id)
+    async for frame in coalesce_deltas(deltas, min_chars, max_chars, max_delay_ms):
+        yield encoder.encode(frame)
+    yield encoder.final_frame
+    yield DONE_FRAME
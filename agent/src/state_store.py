@@ -0,0 +1,283 @@
+"""
+Server-side AG-UI thread state
+Per-thread state in an in-memory LRU with an optional database tier, updated from client deltas so
+each request only validates the fields that changed
+"""
+from copy import deepcopy
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Generic, List, Optional, Type, TypeVar
+import asyncio
+import json
+import os
+import re
+
+from pydantic import BaseModel
+
+from .database import Database
+from .logs import get_logger
+from .metrics import Counter, registry
+from .session_store import SessionStore
+
+THREAD_STATE_MAX_THREADS = int(os.getenv("THREAD_STATE_MAX_THREADS", os.getenv("USER_CONTEXT_MAX_SESSIONS", "10000")))
+THREAD_STATE_TTL_SECONDS = float(os.getenv("THREAD_STATE_TTL_SECONDS", os.getenv("USER_CONTEXT_TTL_SECONDS", "3600")))
+
+# A client sends {"_delta": {...}} (changed fields) or {"_delta": [...]} (RFC 6902 JSON Patch)
+# instead of the whole state; an empty or missing state means "unchanged"
+STATE_DELTA_KEY = "_delta"
+
+STATE_TABLE = "agent_thread_state"
+
+SCHEMA = {
+    "postgres": f"""
+        CREATE TABLE IF NOT EXISTS {STATE_TABLE} (
+            thread_id TEXT PRIMARY KEY,
+            state JSONB NOT NULL,
+            updated_at TIMESTAMPTZ NOT NULL
+        )
+    """,
+    "sqlite": f"""
+        CREATE TABLE IF NOT EXISTS {STATE_TABLE} (
+            thread_id TEXT PRIMARY KEY,
+            state TEXT NOT NULL,
+            updated_at TEXT NOT NULL
+        )
+    """,
+}
+
+log = get_logger("state")
+
+state_loads = registry.register(Counter(
+    "agent_thread_state_loads_total", "Thread state lookups by the tier that answered.", ("tier",)))
+state_fields_validated = registry.register(Counter(
+    "agent_thread_state_fields_validated_total", "State fields validated from client input."))
+
+StateT = TypeVar("StateT", bound=BaseModel)
+
+
+class StatePatchError(ValueError):
+    """A client state delta that can't be applied."""
+
+
+# A JSON Pointer array index: no sign, no leading zeros
+_INDEX = re.compile(r"0|[1-9][0-9]*")
+
+
+def _pointer(path: str) -> List[str]:
+    if not path.startswith("/"):
+        raise StatePatchError(f"invalid JSON pointer: {path!r}")
+    return [part.replace("~1", "/").replace("~0", "~") for part in path[1:].split("/")]
+
+
+def _path(key: str) -> str:
+    return "/" + key.replace("~", "~0").replace("/", "~1")
+
+
+def _index(items: list, part: str, add: bool = False) -> int:
+    """A list index from a pointer segment; an add may also target the end ("-" or len)."""
+    if add and part == "-":
+        return len(items)
+    if not _INDEX.fullmatch(part) or int(part) > len(items) - (0 if add else 1):
+        raise StatePatchError(f"list index out of range: {part!r}")
+    return int(part)
+
+
+def apply_json_patch(document: dict, operations: List[dict]) -> set:
+    """Apply add/replace/remove operations in place; returns the top-level keys touched.
+
+    As RFC 6902 specifies, every member on the way to the target must exist,
+    and replace and remove need an existing target; anything else raises
+    StatePatchError, leaving the document partly patched.
+    """
+    touched = set()
+    for op in operations:
+        if not isinstance(op, dict) or not isinstance(op.get("path"), str):
+            raise StatePatchError(f"unsupported patch operation: {op!r}")
+        kind = op.get("op")
+        parts = _pointer(op["path"])
+        if kind not in ("add", "replace", "remove") or not parts[0] or (kind != "remove" and "value" not in op):
+            raise StatePatchError(f"unsupported patch operation: {op!r}")
+        touched.add(parts[0])
+        parent: Any = document
+        for part in parts[:-1]:
+            if isinstance(parent, list):
+                parent = parent[_index(parent, part)]
+            elif isinstance(parent, dict) and part in parent:
+                parent = parent[part]
+            else:
+                raise StatePatchError(f"cannot apply {op!r}: no container at {part!r}")
+        last = parts[-1]
+        if isinstance(parent, list):
+            index = _index(parent, last, add=kind == "add")
+            if kind == "add":
+                parent.insert(index, op["value"])
+            elif kind == "replace":
+                parent[index] = op["value"]
+            else:
+                del parent[index]
+        elif not isinstance(parent, dict):
+            raise StatePatchError(f"cannot apply {op!r}: target's parent is not an object or array")
+        elif kind != "add" and last not in parent:
+            raise StatePatchError(f"cannot apply {op!r}: no member {last!r}")
+        elif kind == "remove":
+            del parent[last]
+        else:
+            parent[last] = op["value"]
+    return touched
+
+
+def json_patch(before: dict, after: dict) -> List[dict]:
+    """JSON Patch operations turning one state snapshot into another.
+
+    Top-level fields are set whole, except lists that only grew, which get
+    one append per new item, so a delta stays as small as the change. Fields
+    are set with add, never replace: a client drops members whose value is
+    undefined from its copy, and replace fails on a member that isn't there.
+    """
+    operations = []
+    for key, value in after.items():
+        path = _path(key)
+        old = before.get(key)
+        if key in before and old == value:
+            continue
+        if isinstance(old, list) and isinstance(value, list) and value[:len(old)] == old:
+            operations.extend({"op": "add", "path": f"{path}/-", "value": item} for item in value[len(old):])
+        else:
+            operations.append({"op": "add", "path": path, "value": value})
+    operations.extend({"op": "remove", "path": _path(key)} for key in before if key not in after)
+    return operations
+
+
+@dataclass
+class _Entry(Generic[StateT]):
+    state: StateT
+    # JSON form of the state, to diff client snapshots against without re-validating them
+    snapshot: dict
+
+
+class ThreadStateStore(Generic[StateT]):
+    """Per-thread state: memory first, then the database, then a fresh default state.
+
+    resolve() merges what the client sent into the stored state, validating
+    only the fields that differ (a full snapshot is diffed against the stored
+    one first), and returns a copy the run can mutate freely. save() records
+    the state a run finished with; the database write happens in a worker
+    thread off the request path.
+    """
+
+    def __init__(self, state_type: Type[StateT], database: Optional[Database] = None, memory: Optional[SessionStore] = None):
+        self.state_type = state_type
+        self.database = database
+        self._memory = memory or SessionStore(max_entries=THREAD_STATE_MAX_THREADS, ttl_seconds=THREAD_STATE_TTL_SECONDS)
+        self._schema_ready = False
+        self._pending_writes: set = set()
+
+    # ----- database tier (blocking; called in worker threads)
+    def _ensure_schema(self, cursor) -> None:
+        if not self._schema_ready:
+            cursor.execute(SCHEMA[self.database.dialect])
+            self._schema_ready = True
+
+    def _db_load(self, thread_id: str) -> Optional[dict]:
+        p = self.database.placeholder
+        with self.database.connection() as conn:
+            cursor = conn.cursor()
+            self._ensure_schema(cursor)
+            cursor.execute(f"SELECT state FROM {STATE_TABLE} WHERE thread_id = {p}", (thread_id,))
+            row = cursor.fetchone()
+            cursor.close()
+        if row is None:
+            return None
+        return json.loads(row[0]) if isinstance(row[0], str) else row[0]
+
+    def _db_save(self, thread_id: str, snapshot: dict) -> None:
+        p = self.database.placeholder
+        with self.database.connection() as conn:
+            cursor = conn.cursor()
+            self._ensure_schema(cursor)
+            cursor.execute(
+                f"INSERT INTO {STATE_TABLE} (thread_id, state, updated_at) VALUES ({p}, {p}, {p}) "
+                "ON CONFLICT (thread_id) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at",
+                (thread_id, json.dumps(snapshot), datetime.now(timezone.utc).isoformat()),
+            )
+            cursor.close()
+
+    # ----- public API
+    async def _load(self, thread_id: Optional[str]) -> _Entry:
+        entry = self._memory.get(thread_id)
+        if entry is not None:
+            state_loads.inc(tier="memory")
+            return entry
+        if thread_id and self.database is not None:
+            try:
+                snapshot = await asyncio.to_thread(self._db_load, thread_id)
+            except Exception:
+                self._schema_ready = False
+                log.exception("thread state load failed", extra={"thread_id": thread_id})
+                snapshot = None
+            if snapshot is not None:
+                state_loads.inc(tier="database")
+                state = self.state_type.model_validate(snapshot)
+                return _Entry(state, state.model_dump(mode="json"))
+        state_loads.inc(tier="new")
+        state = self.state_type()
+        return _Entry(state, state.model_dump(mode="json"))
+
+    async def resolve(self, thread_id: Optional[str], client_state: Any) -> StateT:
+        """The thread's state with the client's changes applied."""
+        entry = await self._load(thread_id)
+
+        if not client_state:
+            changed = {}
+        elif isinstance(client_state, dict) and STATE_DELTA_KEY in client_state:
+            delta = client_state[STATE_DELTA_KEY]
+            if isinstance(delta, list):
+                document = deepcopy(entry.snapshot)
+                touched = apply_json_patch(document, delta)
+                changed = {key: document[key] for key in touched if key in document}
+                # A removed field goes back to its default
+                changed.update({key: None for key in touched if key not in document})
+            elif isinstance(delta, dict):
+                changed = delta
+            else:
+                raise StatePatchError(f"{STATE_DELTA_KEY} must be an object or a JSON Patch array")
+        elif isinstance(client_state, dict):
+            # Full snapshot: only what differs from the stored state needs validating
+            changed = {key: value for key, value in client_state.items() if entry.snapshot.get(key, None) != value}
+        else:
+            raise StatePatchError("state must be an object")
+
+        fields = self.state_type.model_fields
+        changed = {key: value for key, value in changed.items() if key in fields}
+        if not changed:
+            return entry.state.model_copy(deep=True)
+
+        state_fields_validated.inc(len(changed))
+        # Removed or nulled fields fall back to the model default
+        provided = {key: value for key, value in changed.items() if value is not None}
+        validated = self.state_type.model_validate(provided)
+        update = {key: getattr(validated, key) for key in changed}
+        return entry.state.model_copy(update=update, deep=True)
+
+    def save(self, thread_id: Optional[str], state: StateT) -> None:
+        """Keep the state a run finished with; persisted to the database in the background."""
+        if not thread_id:
+            return
+        snapshot = state.model_dump(mode="json")
+        self._memory.set(thread_id, _Entry(state, snapshot))
+        if self.database is not None:
+            task = asyncio.get_running_loop().create_task(asyncio.to_thread(self._save_quietly, thread_id, snapshot))
+            self._pending_writes.add(task)
+            task.add_done_callback(self._pending_writes.discard)
+
+    def _save_quietly(self, thread_id: str, snapshot: dict) -> None:
+        try:
+            self._db_save(thread_id, snapshot)
+        except Exception:
+            self._schema_ready = False
+            log.exception("thread state save failed", extra={"thread_id": thread_id})
+
+    async def drain(self) -> None:
+        """Wait for background database writes (on shutdown)."""
+        if self._pending_writes:
+            await asyncio.gather(*self._pending_writes, return_exceptions=True)
@@ -0,0 +1,109 @@
+"""
+Fuzzy symptom matching for assess_challenges
+TF-IDF over character trigrams, scored through a precomputed inverted index
+"""
+from collections import Counter
+from typing import Dict, Iterable, List, Optional
+import math
+import os
+import re
+
+MATCH_THRESHOLD = float(os.getenv("SYMPTOM_MATCH_THRESHOLD", "0.3"))
+
+_WORD = re.compile(r"[a-z0-9]+")
+# Words that carry no signal about which challenge is meant (including ones every
+# membership organisation uses about everything)
+STOP_WORDS = frozenset(
+    "a an the our we us they their them is are was were be been being have has had do does did "
+    "not no of to in on for with at by from it its this that there very really so too just "
+    "i my me you your what who how why when which can cant don dont isn aren t s "
+    "member members membership people nobody organisation".split()
+)
+# Described symptoms often bundle several problems; each clause is scored on its own
+_CLAUSE_BREAK = re.compile(r"[,;.!?]|\band\b|\bbut\b|\balso\b|\bplus\b")
+
+
+def trigram_features(text: str) -> Counter:
+    """Character trigrams of each word (padded), so "renewing" still overlaps "renewal"."""
+    features = Counter()
+    for word in _WORD.findall(text.lower()):
+        if word in STOP_WORDS:
+            continue
+        padded = f" {word} "
+        for i in range(len(padded) - 2):
+            features[padded[i:i + 3]] += 1
+    return features
+
+
+class SymptomMatcher:
+    """Ranks challenges against described symptoms.
+
+    A challenge's name, canned symptoms and related phrases are each a document. Their
+    L2-normalised TF-IDF vectors are stored as an inverted index (feature ->
+    [(phrase, weight)]), i.e. a sparse phrase x feature matrix, so scoring a
+    batch of symptoms is one sparse matrix-vector product per clause and only
+    touches phrases sharing a trigram with the input.
+    """
+
+    def __init__(self, challenges: dict):
+        self.challenge_keys = list(challenges)
+        phrases: List[str] = []
+        owners: List[int] = []
+        for position, challenge in enumerate(challenges.values()):
+            for phrase in [challenge["name"], *challenge["symptoms"], *challenge.get("related_phrases", [])]:
+                phrases.append(phrase)
+                owners.append(position)
+        self.phrases = phrases
+        self._owners = owners
+
+        counts = [trigram_features(p) for p in phrases]
+        document_frequency = Counter(f for c in counts for f in c)
+        total = len(phrases)
+        self._idf = {f: math.log((1 + total) / (1 + df)) + 1 for f, df in document_frequency.items()}
+        self._unseen_idf = math.log(1 + total) + 1
+
+        self._postings: Dict[str, List[tuple[int, float]]] = {}
+        for i, c in enumerate(counts):
+            weights = {f: n * self._idf[f] for f, n in c.items()}
+            norm = math.sqrt(sum(w * w for w in weights.values())) or 1.0
+            for f, w in weights.items():
+                self._postings.setdefault(f, []).append((i, w / norm))
+
+    def _score_clause(self, clause: str, best: List[float]) -> None:
+        """Raise each challenge's best score with this clause's cosine similarity."""
+        # Trigrams no phrase has get the rarest-feature weight: they only lengthen the query
+        weights = {f: n * self._idf.get(f, self._unseen_idf) for f, n in trigram_features(clause).items()}
+        if not weights:
+            return
+        norm = math.sqrt(sum(w * w for w in weights.values()))
+        dots: Dict[int, float] = {}
+        for f, w in weights.items():
+            for phrase, pw in self._postings.get(f, ()):
+                dots[phrase] = dots.get(phrase, 0.0) + w * pw
+        for phrase, dot in dots.items():
+            owner = self._owners[phrase]
+            score = dot / norm
+            if score > best[owner]:
+                best[owner] = score
+
+    def score(self, symptoms: Iterable[str]) -> Dict[str, float]:
+        """Best similarity (0-1) of each challenge to any clause of any symptom."""
+        best = [0.0] * len(self.challenge_keys)
+        # Repeated clauses across a batch can only produce the same scores, so score each once
+        clauses = {
+            clause.strip()
+            for symptom in symptoms
+            for clause in _CLAUSE_BREAK.split(symptom.lower())
+        }
+        clauses.discard("")
+        for clause in clauses:
+            self._score_clause(clause, best)
+        return dict(zip(self.challenge_keys, best))
+
+    def rank(self, symptoms: Iterable[str], threshold: Optional[float] = None) -> List[tuple[str, float]]:
+        """Challenges scoring at least the threshold, best first."""
+        threshold = MATCH_THRESHOLD if threshold is None else threshold
+        scores = self.score(symptoms)
+        ranked = [(key, score) for key, score in scores.items() if score >= threshold]
+        ranked.sort(key=lambda item: item[1], reverse=True)
+        return ranked
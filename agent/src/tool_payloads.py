@@ -0,0 +1,110 @@
+"""
+Tool result payloads
+Compact views of catalogue records and per-tool accounting of the prompt tokens each result costs
+"""
+from functools import wraps
+from typing import Any, Callable, List
+import json
+import os
+import threading
+
+from pydantic_ai import ToolReturn
+
+from .clm_history import estimate_tokens
+from .logs import get_logger
+
+# Results above this estimate are logged, so payload growth shows up before the bill does
+TOOL_RESULT_TOKEN_BUDGET = int(os.getenv("TOOL_RESULT_TOKEN_BUDGET", "400"))
+
+log = get_logger("tools")
+
+
+def service_summary(service: dict) -> dict:
+    """The fields the model needs to recommend a service; get_service_info has the rest."""
+    return {
+        "name": service["name"],
+        "description": service["description"],
+        "typical_results": service["typical_results"],
+        "monthly_investment": service["monthly_investment"],
+    }
+
+
+def case_study_summary(case: dict) -> dict:
+    """A case study with only its headline result."""
+    results = case.get("results") or {}
+    return {
+        "client": case["client"],
+        "organisation_type": case.get("organisation_type"),
+        "challenge": case["challenge"],
+        "headline_result": next(iter(results.values()), None),
+        "services_used": case.get("services_used", []),
+    }
+
+
+def result_tokens(result: Any) -> int:
+    """Estimated prompt tokens for a tool result, serialised compactly as the model receives it."""
+    if isinstance(result, ToolReturn):
+        # Metadata (e.g. AG-UI state events) goes to the client, not the model
+        result = result.return_value
+    return estimate_tokens(json.dumps(result, separators=(",", ":"), ensure_ascii=False, default=str))
+
+
+class ToolTokenMeter:
+    """Running totals of estimated prompt tokens per tool.
+
+    Tool results are re-sent to the model on every later turn of a run, so
+    these are a lower bound on what a result costs over a conversation.
+    Listeners are called with (tool name, tokens) after each result.
+    """
+
+    def __init__(self, budget: int = TOOL_RESULT_TOKEN_BUDGET):
+        self.budget = budget
+        self.listeners: List[Callable[[str, int], None]] = []
+        self._stats: dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def record(self, tool_name: str, result: Any) -> int:
+        tokens = result_tokens(result)
+        with self._lock:
+            stats = self._stats.setdefault(tool_name, {"calls": 0, "tokens": 0, "max_tokens": 0})
+            stats["calls"] += 1
+            stats["tokens"] += tokens
+            stats["max_tokens"] = max(stats["max_tokens"], tokens)
+        if tokens > self.budget:
+            log.warning("tool result over token budget", extra={"tool": tool_name, "tokens": tokens, "budget": self.budget})
+        for listener in self.listeners:
+            listener(tool_name, tokens)
+        return tokens
+
+    def stats(self) -> dict:
+        """Calls, total, mean and max estimated tokens per tool."""
+        with self._lock:
+            return {
+                name: {**s, "mean_tokens": round(s["tokens"] / s["calls"], 1)}
+                for name, s in self._stats.items()
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
+
+
+tool_token_meter = ToolTokenMeter()
+
+
+def account_tool_tokens(fn: Callable) -> Callable:
+    """Record the prompt-token cost of every result a (sync) tool returns.
+
+    Goes between @agent.tool and the function; the signature and docstring
+    the tool schema is built from are carried over by functools.wraps.
+    """
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        result = fn(*args, **kwargs)
+        tool_token_meter.record(fn.__name__, result)
+        return result
+    return wrapper
+
+
+def tool_token_stats() -> dict:
+    return tool_token_meter.stats()
@@ -0,0 +1,82 @@
+"""
+Tool execution
+Where each tool runs: cheap lookups inline on the event loop, blocking tools on a bounded thread pool
+with a deadline, so the tool calls of one model response run side by side
+"""
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, wraps
+from typing import Callable, Optional
+import asyncio
+import contextvars
+import os
+import time
+
+from .logs import get_logger
+from .metrics import Counter, Gauge, Histogram, registry
+
+# Threads shared by every blocking tool call; calls beyond this wait for a free thread
+TOOL_THREADS = int(os.getenv("TOOL_THREADS", "16"))
+TOOL_TIMEOUT_SECONDS = float(os.getenv("TOOL_TIMEOUT_SECONDS", "10"))
+
+log = get_logger("tools")
+
+tool_timeouts = registry.register(Counter(
+    "agent_tool_timeouts_total", "Tool calls abandoned at their deadline.", ("tool",)))
+tool_threads_busy = registry.register(Gauge(
+    "agent_tool_threads_busy", "Tool pool threads running a tool (including abandoned calls)."))
+tool_queue_wait = registry.register(Histogram(
+    "agent_tool_queue_seconds", "Time blocking tool calls waited for a pool thread.", ("tool",)))
+
+tool_executor = ThreadPoolExecutor(max_workers=TOOL_THREADS, thread_name_prefix="tool")
+
+
+def inline_tool(fn: Callable) -> Callable:
+    """Run a (sync) tool directly on the event loop.
+
+    For tools that only read in-memory data and return in microseconds, where
+    a thread hop would cost more than the call. Never use it for anything that
+    does I/O. Goes between @agent.tool and the other tool decorators; the
+    sync tool stays callable as tool.__wrapped__.
+    """
+    @wraps(fn)
+    async def wrapper(*args, **kwargs):
+        return fn(*args, **kwargs)
+    return wrapper
+
+
+def blocking_tool(timeout: Optional[float] = TOOL_TIMEOUT_SECONDS) -> Callable[[Callable], Callable]:
+    """Run a (sync) tool on the bounded tool pool, giving up after timeout seconds.
+
+    For tools that do I/O (database, calendar, CRM). Several of them called in
+    one model response run in parallel, up to TOOL_THREADS at once. A call
+    past its deadline returns an error result the model can work around; its
+    thread can't be interrupted, so it finishes in the background. Goes
+    between @agent.tool and the other tool decorators.
+    """
+    def decorator(fn: Callable) -> Callable:
+        name = fn.__name__
+
+        def run(queued_at: float, *args, **kwargs):
+            tool_queue_wait.observe(time.perf_counter() - queued_at, tool=name)
+            tool_threads_busy.inc()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                tool_threads_busy.dec()
+
+        @wraps(fn)
+        async def wrapper(*args, **kwargs):
+            # Copied so request ids and other context reach the tool's log lines
+            call = partial(contextvars.copy_context().run, run, time.perf_counter(), *args, **kwargs)
+            future = asyncio.get_running_loop().run_in_executor(tool_executor, call)
+            try:
+                return await asyncio.wait_for(future, timeout)
+            except TimeoutError:
+                tool_timeouts.inc(tool=name)
+                log.warning("tool call timed out", extra={"tool": name, "timeout": timeout})
+                return {
+                    "error": f"{name} did not finish within {timeout:g} seconds",
+                    "suggestion": "Carry on without this result, and offer to follow up by email.",
+                }
+        return wrapper
+    return decorator
@@ -0,0 +1,195 @@
+"""
+Long-term user memory
+Facts Zep remembers about a logged-in user, fetched while the request is still being prepared and
+cached per user (TTL with stale-while-revalidate), summarised for the system prompt
+"""
+from dataclasses import dataclass
+from functools import lru_cache
+from textwrap import dedent
+from typing import Iterable, Optional
+import asyncio
+import os
+import time
+
+import httpx
+
+from .logs import get_logger
+from .metrics import Counter, Histogram, registry
+from .session_store import SessionStore
+
+# Without a key the agent runs without long-term memory
+ZEP_API_KEY = os.getenv("ZEP_API_KEY", "")
+ZEP_API_URL = os.getenv("ZEP_API_URL", "https://api.getzep.com/api/v2")
+USER_MEMORY_TTL_SECONDS = float(os.getenv("USER_MEMORY_TTL_SECONDS", "300"))
+# Past its TTL a summary is still served, and refreshed in the background, for this much longer
+USER_MEMORY_STALE_SECONDS = float(os.getenv("USER_MEMORY_STALE_SECONDS", "86400"))
+# How long a run's first model request waits for a user's first fetch before going ahead without it
+USER_MEMORY_WAIT_SECONDS = float(os.getenv("USER_MEMORY_WAIT_SECONDS", "0.3"))
+USER_MEMORY_TIMEOUT_SECONDS = float(os.getenv("USER_MEMORY_TIMEOUT_SECONDS", "3"))
+USER_MEMORY_MAX_USERS = int(os.getenv("USER_MEMORY_MAX_USERS", "10000"))
+USER_MEMORY_MAX_FACTS = int(os.getenv("USER_MEMORY_MAX_FACTS", "6"))
+
+# The same graph search the frontend's /api/zep-context route runs
+SEARCH_QUERY = "user organisation membership challenges goals services acquisition retention engagement strategy"
+SEARCH_LIMIT = 15
+MAX_FACT_CHARS = 200
+
+log = get_logger("memory")
+
+memory_lookups = registry.register(Counter(
+    "agent_user_memory_lookups_total",
+    "User memory lookups by result (fresh, stale, fetched, timeout, pending).", ("result",)))
+memory_fetches = registry.register(Counter(
+    "agent_user_memory_fetches_total", "Zep memory fetches by result (ok, not_found, error).", ("result",)))
+memory_fetch_duration = registry.register(Histogram(
+    "agent_user_memory_fetch_seconds", "Zep graph search round-trip time."))
+
+_TEMPLATE = dedent("""
+    ## WHAT YOU REMEMBER ABOUT THEM
+    From earlier conversations. Use it to personalise; confirm rather than re-ask, and don't recite it.
+    {facts}
+""")
+
+
+@dataclass
+class _Memory:
+    facts: tuple[str, ...]
+    fetched_at: float
+
+
+def summarise_facts(edges: Iterable[dict], max_facts: int = USER_MEMORY_MAX_FACTS) -> tuple[str, ...]:
+    """The first max_facts distinct facts still true, in Zep's relevance order."""
+    facts, seen = [], set()
+    for edge in edges:
+        # Facts Zep has since learned were superseded ("was on the old plan") are skipped
+        if edge.get("invalid_at") or edge.get("expired_at"):
+            continue
+        fact = " ".join(str(edge.get("fact") or "").split())[:MAX_FACT_CHARS]
+        if fact and fact.casefold() not in seen:
+            seen.add(fact.casefold())
+            facts.append(fact)
+            if len(facts) == max_facts:
+                break
+    return tuple(facts)
+
+
+@lru_cache(maxsize=1024)
+def render_memory(facts: tuple[str, ...]) -> str:
+    return _TEMPLATE.format(facts="\n".join(f"- {fact}" for fact in facts)) if facts else ""
+
+
+class UserMemory:
+    """Per-user cache of Zep facts, filled ahead of the model run.
+
+    prefetch() starts a fetch as soon as a request's user id is known, so it
+    runs while the rest of the request is prepared; instructions() is awaited
+    by the system prompt, and only a run's first model request waits (at most
+    wait_seconds) for a user's first fetch. A cached summary is served as is
+    for ttl_seconds, then served stale while one background fetch refreshes it. A failed fetch keeps
+    whatever was cached (or nothing) until the next TTL instead of retrying
+    every turn.
+    """
+
+    def __init__(
+        self,
+        api_url: str = ZEP_API_URL,
+        api_key: str = ZEP_API_KEY,
+        ttl_seconds: float = USER_MEMORY_TTL_SECONDS,
+        stale_seconds: float = USER_MEMORY_STALE_SECONDS,
+        wait_seconds: float = USER_MEMORY_WAIT_SECONDS,
+        max_users: int = USER_MEMORY_MAX_USERS,
+        client: Optional[httpx.AsyncClient] = None,
+    ):
+        self.enabled = bool(api_key)
+        self.ttl_seconds = ttl_seconds
+        self.wait_seconds = wait_seconds
+        self._cache = SessionStore(max_entries=max_users, ttl_seconds=ttl_seconds + stale_seconds)
+        self._pending: dict[str, asyncio.Task] = {}
+        self._client = client or httpx.AsyncClient(
+            base_url=api_url,
+            timeout=USER_MEMORY_TIMEOUT_SECONDS,
+            headers={"Authorization": f"Api-Key {api_key}"},
+        )
+
+    def _fresh(self, memory: _Memory) -> bool:
+        return time.monotonic() - memory.fetched_at < self.ttl_seconds
+
+    def _refresh(self, user_id: str) -> asyncio.Task:
+        """The running fetch for a user, started if there isn't one."""
+        task = self._pending.get(user_id)
+        if task is None:
+            task = asyncio.create_task(self._fetch(user_id))
+            self._pending[user_id] = task
+            task.add_done_callback(lambda _: self._pending.pop(user_id, None))
+        return task
+
+    def prefetch(self, user_id: Optional[str]) -> None:
+        """Start fetching a user's memory unless a fresh copy is cached or a fetch is already running."""
+        if not self.enabled or not user_id:
+            return
+        memory = self._cache.get(user_id)
+        if memory is None or not self._fresh(memory):
+            self._refresh(user_id)
+
+    async def instructions(self, user_id: Optional[str], wait: bool = True) -> str:
+        """The system-prompt block for a user's memory, or "" (no user, nothing known, or not fetched in time).
+
+        With wait=False a first fetch that is still running isn't waited for.
+        """
+        if not self.enabled or not user_id:
+            return ""
+        memory = self._cache.get(user_id)
+        if memory is None:
+            fetch = self._refresh(user_id)
+            if wait:
+                try:
+                    await asyncio.wait_for(asyncio.shield(fetch), self.wait_seconds)
+                except TimeoutError:
+                    pass
+            memory = self._cache.get(user_id)
+            if memory is None:
+                # The fetch carries on, so a later model request has it
+                memory_lookups.inc(result="timeout" if wait else "pending")
+                return ""
+            memory_lookups.inc(result="fetched")
+        elif self._fresh(memory):
+            memory_lookups.inc(result="fresh")
+        else:
+            self._refresh(user_id)
+            memory_lookups.inc(result="stale")
+        return render_memory(memory.facts) if memory else ""
+
+    async def _fetch(self, user_id: str) -> None:
+        start = time.perf_counter()
+        try:
+            response = await self._client.post("/graph/search", json={
+                "user_id": user_id,
+                "query": SEARCH_QUERY,
+                "limit": SEARCH_LIMIT,
+                "scope": "edges",
+            })
+            if response.status_code == 404:
+                # Zep hasn't seen this user yet
+                facts, result = (), "not_found"
+            else:
+                response.raise_for_status()
+                facts, result = summarise_facts(response.json().get("edges") or []), "ok"
+        except (httpx.HTTPError, ValueError, AttributeError) as e:
+            memory_fetches.inc(result="error")
+            log.warning("user memory fetch failed", extra={"user_id": user_id, "error": repr(e)})
+            previous = self._cache.get(user_id)
+            self._cache.set(user_id, _Memory(previous.facts if previous else (), time.monotonic()))
+            return
+        finally:
+            memory_fetch_duration.observe(time.perf_counter() - start)
+        memory_fetches.inc(result=result)
+        self._cache.set(user_id, _Memory(facts, time.monotonic()))
+        log.debug("user memory fetched", extra={"user_id": user_id, "facts": len(facts)})
+
+    async def aclose(self) -> None:
+        for task in list(self._pending.values()):
+            task.cancel()
+        await self._client.aclose()
+
+
+user_memory = UserMemory()
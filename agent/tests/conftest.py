@@ -0,0 +1,5 @@
+import os
+
+# The agent module builds its Gemini client at import; tests never reach the network
+os.environ.setdefault("GOOGLE_API_KEY", "offline-tests")
+os.environ.setdefault("LOG_LEVEL", "ERROR")
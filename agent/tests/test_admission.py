@@ -0,0 +1,41 @@
+import asyncio
+
+import pytest
+
+from src.admission import AdmissionController, Saturated
+
+
+async def hold(controller: AdmissionController, user, seconds: float = 0.05) -> int:
+    try:
+        async with controller.slot(user):
+            await asyncio.sleep(seconds)
+    except Saturated:
+        return 429
+    return 200
+
+
+async def gather_runs(controller: AdmissionController, users) -> list[int]:
+    return list(await asyncio.gather(*(hold(controller, user) for user in users)))
+
+
+def test_concurrent_anonymous_guests_are_not_one_user():
+    controller = AdmissionController(max_concurrent=32, max_queue=64, queue_timeout=1, max_per_user=2)
+    assert asyncio.run(gather_runs(controller, [None] * 8)) == [200] * 8
+    assert controller.running == 0 and controller.queued == 0
+
+
+def test_anonymous_guests_still_bounded_by_global_limits():
+    controller = AdmissionController(max_concurrent=2, max_queue=2, queue_timeout=1, max_per_user=2)
+    assert sorted(asyncio.run(gather_runs(controller, [None] * 6))) == [200] * 4 + [429] * 2
+
+
+def test_one_user_is_capped():
+    controller = AdmissionController(max_concurrent=32, max_queue=64, queue_timeout=1, max_per_user=2)
+    assert sorted(asyncio.run(gather_runs(controller, ["user:1"] * 6))) == [200] * 4 + [429] * 2
+
+
+@pytest.mark.parametrize("user", ["", None])
+def test_slot_released_for_anonymous(user):
+    controller = AdmissionController(max_concurrent=1, max_queue=0, queue_timeout=1, max_per_user=1)
+    assert asyncio.run(gather_runs(controller, [user])) == [200]
+    assert controller.running == 0 and not controller._running_by_user
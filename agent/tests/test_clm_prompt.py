@@ -0,0 +1,37 @@
+import asyncio
+
+from pydantic_ai.messages import ModelResponse, TextPart
+from pydantic_ai.models.function import AgentInfo, FunctionModel
+
+from src import agent as agent_module
+from src.clm_history import build_message_history
+
+PERSONA = "You are a friendly, knowledgeable membership marketing consultant."
+
+
+def run_turns(turns):
+    """Instructions the model saw on each (transcript, question) turn."""
+    seen = []
+
+    def respond(messages, info: AgentInfo) -> ModelResponse:
+        seen.append(info.instructions or "")
+        return ModelResponse(parts=[TextPart("Noted.")])
+
+    async def run():
+        with agent_module.agent.override(model=FunctionModel(respond)):
+            for transcript, question in turns:
+                deps = agent_module.build_clm_deps(None, "prompt-test")
+                history = build_message_history(transcript, "prompt-test")
+                await agent_module.agent.run(question, deps=deps, message_history=history)
+
+    asyncio.run(run())
+    return seen
+
+
+def test_prompt_sent_on_turns_with_history():
+    seen = run_turns([
+        ([], "Hi"),
+        ([("user", "Hi"), ("assistant", "Noted.")], "We're a trade association"),
+    ])
+    assert [PERSONA in instructions for instructions in seen] == [True, True]
+    assert "record_qualification" in seen[1]
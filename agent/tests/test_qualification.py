@@ -0,0 +1,23 @@
+import pytest
+
+from src.qualification import normalise_timeline
+
+
+@pytest.mark.parametrize("said, timeline", [
+    ("not now", "exploring"),
+    ("Not right now", "exploring"),
+    ("not just now, thanks", "exploring"),
+    ("not yet", "exploring"),
+    ("it's not urgent", "exploring"),
+    ("no rush", "exploring"),
+    ("just exploring", "exploring"),
+    ("asap", "urgent"),
+    ("we need it right now", "urgent"),
+    ("now please", "urgent"),
+    ("this month", "urgent"),
+    ("within 3 months", "3_months"),
+    ("later this year", "6_months"),
+    ("urgent", "urgent"),
+])
+def test_normalise_timeline(said, timeline):
+    assert normalise_timeline(said) == timeline
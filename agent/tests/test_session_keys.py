@@ -0,0 +1,52 @@
+import asyncio
+import uuid
+
+import httpx
+from pydantic_ai.messages import ModelResponse, TextPart
+from pydantic_ai.models.function import AgentInfo, FunctionModel
+
+from src import agent as agent_module
+
+
+def test_agui_thread_cannot_name_a_clm_session():
+    seen = []
+
+    def respond(messages, info: AgentInfo) -> ModelResponse:
+        seen.append(info.instructions or "")
+        return ModelResponse(parts=[TextPart("Noted.")])
+
+    async def stream(messages, info: AgentInfo):
+        seen.append(info.instructions or "")
+        yield "Noted."
+
+    user_id = uuid.uuid4().hex
+    clm_turn = {
+        "stream": False,
+        "messages": [
+            {"role": "system", "content": f"User Name: Quentin Private\nUser ID: {user_id}"},
+            {"role": "user", "content": "Tell me about your approach to renewals"},
+        ],
+    }
+    agui_turn = {
+        # The key the CLM endpoint stores that user's session under, without a session id
+        "threadId": f"user:{user_id}",
+        "runId": uuid.uuid4().hex,
+        "state": {},
+        "messages": [{"id": uuid.uuid4().hex, "role": "user", "content": "Tell me about your approach to renewals"}],
+        "tools": [],
+        "context": [],
+        "forwardedProps": {},
+    }
+
+    async def run():
+        transport = httpx.ASGITransport(app=agent_module.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            with agent_module.agent.override(model=FunctionModel(respond, stream_function=stream)):
+                assert (await client.post("/chat/completions", json=clm_turn)).status_code == 200
+                response = await client.post("/agui/", json=agui_turn, headers={"accept": "text/event-stream"})
+                assert response.status_code == 200
+
+    asyncio.run(run())
+    assert len(seen) == 2
+    assert "Quentin" in seen[0]
+    assert "Quentin" not in seen[1]
@@ -0,0 +1,104 @@
+import asyncio
+from typing import Optional
+
+import pytest
+from pydantic import BaseModel, Field
+
+from src.state_store import STATE_DELTA_KEY, StatePatchError, ThreadStateStore, apply_json_patch, json_patch
+
+
+class Profile(BaseModel):
+    name: Optional[str] = None
+
+
+class State(BaseModel):
+    user: Optional[Profile] = None
+    primary_challenges: list[str] = Field(default_factory=list)
+    timeline: Optional[str] = None
+
+
+def document() -> dict:
+    return {"user": {"name": "Ann"}, "primary_challenges": ["retention"], "timeline": None}
+
+
+def test_applies_well_formed_operations():
+    doc = document()
+    touched = apply_json_patch(doc, [
+        {"op": "add", "path": "/primary_challenges/-", "value": "engagement"},
+        {"op": "add", "path": "/primary_challenges/0", "value": "acquisition"},
+        {"op": "replace", "path": "/user/name", "value": "Bea"},
+        {"op": "add", "path": "/budget_range", "value": "2k_5k"},
+        {"op": "remove", "path": "/timeline"},
+    ])
+    assert touched == {"primary_challenges", "user", "budget_range", "timeline"}
+    assert doc == {
+        "user": {"name": "Bea"},
+        "primary_challenges": ["acquisition", "retention", "engagement"],
+        "budget_range": "2k_5k",
+    }
+
+
+@pytest.mark.parametrize("operations", [
+    ["oops"],
+    [None],
+    [{"op": "add", "path": 3, "value": 1}],
+    [{"op": "add", "path": "/timeline"}],
+    [{"op": "move", "path": "/timeline", "value": 1}],
+    [{"op": "add", "path": "/", "value": 1}],
+    [{"op": "add", "path": "timeline", "value": 1}],
+    # Intermediate segments that aren't there, or aren't containers
+    [{"op": "add", "path": "/primary_challenges/x/y", "value": 1}],
+    [{"op": "add", "path": "/primary_challenges/5/y", "value": 1}],
+    [{"op": "add", "path": "/user/name/first", "value": "Ann"}],
+    [{"op": "add", "path": "/timeline/urgent", "value": True}],
+    [{"op": "add", "path": "/organisation/name", "value": "IWE"}],
+    # List indices
+    [{"op": "add", "path": "/primary_challenges/5", "value": "strategy"}],
+    [{"op": "add", "path": "/primary_challenges/-1", "value": "strategy"}],
+    [{"op": "add", "path": "/primary_challenges/01", "value": "strategy"}],
+    [{"op": "replace", "path": "/primary_challenges/1", "value": "strategy"}],
+    [{"op": "replace", "path": "/primary_challenges/-", "value": "strategy"}],
+    [{"op": "remove", "path": "/primary_challenges/1"}],
+    # Targets replace and remove need
+    [{"op": "replace", "path": "/budget_range", "value": "2k_5k"}],
+    [{"op": "remove", "path": "/user/email"}],
+])
+def test_rejects_malformed_operations(operations):
+    with pytest.raises(StatePatchError):
+        apply_json_patch(document(), operations)
+
+
+def test_resolve_reports_malformed_delta_as_patch_error():
+    store = ThreadStateStore(State)
+
+    async def resolve(delta):
+        return await store.resolve("thread", {STATE_DELTA_KEY: delta})
+
+    with pytest.raises(StatePatchError):
+        asyncio.run(resolve([{"op": "add", "path": "/user/name/first", "value": "Ann"}]))
+    state = asyncio.run(resolve([{"op": "add", "path": "/primary_challenges/-", "value": "retention"}]))
+    assert state.primary_challenges == ["retention"]
+
+
+def client_copy(state: dict) -> dict:
+    """The state as a browser holds it: members set to undefined (None here) aren't there."""
+    return {key: value for key, value in state.items() if value is not None}
+
+
+def test_json_patch_applies_to_client_without_unset_members():
+    before = {"organisation_type": None, "organisation_name": None, "member_count": None,
+              "primary_challenges": [], "budget_range": None, "timeline": None}
+    after = {**before, "organisation_type": "professional_body", "member_count": "500_2000",
+             "primary_challenges": ["retention"], "timeline": "urgent"}
+    delta = json_patch(before, after)
+    assert all(op["op"] == "add" for op in delta)
+
+    document = client_copy(before)
+    apply_json_patch(document, delta)
+    assert document == client_copy(after)
+
+    # Set members are overwritten by add too
+    later = {**after, "timeline": "3_months", "primary_challenges": ["engagement"]}
+    document = client_copy(after)
+    apply_json_patch(document, json_patch(after, later))
+    assert document == client_copy(later)
@@ -191,6 +191,8 @@ RULES:
       messages: openaiMessages,
       model: 'membership-marketing-agent',
       stream: true,
+      // Lets the agent keep user context per voice session
+      custom_session_id: customSessionId || undefined,
     };
 
     console.log('[CLM] Calling Railway CLM at:', AGENT_CLM_URL);